@@ -0,0 +1,94 @@
+"""Benchmarks for BigQueryTool methods, using a fake client that replays canned responses.
+
+They measure the client-side cost of each method (DataFrame handling, schema conversion),
+not BigQuery's own latency.
+"""
+
+from types import SimpleNamespace
+from .harness import sample_dataframe
+
+
+SUITE = "bigquery_tools"
+
+
+class FakeQueryJob(object):
+    def __init__(self, dataframe):
+        self.dataframe = dataframe
+
+    def to_dataframe(self):
+        return self.dataframe.copy()
+
+
+class FakeBigQueryClient(object):
+    """Stands in for google.cloud.bigquery.Client, returning the same data for every call."""
+
+    def __init__(self, dataframe, tables=100):
+        self.dataframe = dataframe
+        self.tables = [
+            SimpleNamespace(
+                clustering_fields=None, created=None, dataset_id="bench", expires=None, friendly_name=None,
+                full_table_id=f"project:bench.table_{index}", labels={}, partition_expiration=None,
+                partitioning_type=None, project="project", reference=None, table_id=f"table_{index}",
+                table_type="TABLE", time_partitioning=None, view_use_legacy_sql=None,
+            )
+            for index in range(tables)
+        ]
+
+    def query(self, sql_query, job_config=None):
+        return FakeQueryJob(self.dataframe)
+
+    def list_tables(self, dataset):
+        return iter(self.tables)
+
+    def list_datasets(self):
+        return [SimpleNamespace(dataset_id="bench")]
+
+
+def postgresql_schema_dataframe(tables=20, columns=30):
+    """Builds a DataFrame like the one returned by PostgreSQLTool.get_all_db_info."""
+
+    import pandas as pd
+
+    types = ["integer", "text", "timestamp without time zone", "numeric", "boolean", "jsonb"]
+    rows = []
+    for table in range(tables):
+        for column in range(columns):
+            data_type = types[column % len(types)]
+            rows.append({
+                "table_catalog": "db",
+                "table_schema": "public",
+                "table_name": f"table_{table}",
+                "column_name": f"column_{column}",
+                "data_type": data_type,
+                "json_key": "",
+                "json_value_type": "",
+                "is_nullable": "YES",
+            })
+            if data_type == "jsonb":
+                for key in range(3):
+                    rows.append(dict(rows[-1], json_key=f"key_{key}", json_value_type="string"))
+
+    return pd.DataFrame(rows)
+
+
+def run(runner, rows=10000):
+    from instackup.bigquery_tools import BigQueryTool
+
+    dataframe = sample_dataframe(rows)
+
+    # Skipping __init__, which would create a real client
+    bq = BigQueryTool.__new__(BigQueryTool)
+    bq.client = FakeBigQueryClient(dataframe)
+    bq.transfer_client = None
+    bq.project = None
+
+    runner.bench(SUITE, f"query_{rows}_rows", lambda: bq.query("SELECT * FROM bench.table"), rows=rows)
+    runner.bench(SUITE, "list_tables_in_dataset_dict_100_tables", lambda: bq.list_tables_in_dataset("bench"), rows=100)
+    runner.bench(SUITE, "list_tables_in_dataset_dataframe_100_tables", lambda: bq.list_tables_in_dataset("bench", return_type="dataframe"), rows=100)
+
+    schema_df = postgresql_schema_dataframe()
+    runner.bench(SUITE, "convert_multiple_postgresql_tables_schema_20_tables", lambda: bq.convert_multiple_postgresql_tables_schema(schema_df.copy()), rows=len(schema_df))
+
+    string_df = dataframe.astype(str)
+    runner.bench(SUITE, f"convert_dataframe_to_numeric_{rows}_rows", lambda: bq.convert_dataframe_to_numeric(string_df.copy(), exclude_columns=["name", "created_at"], errors="coerce"), rows=rows)
+    runner.bench(SUITE, "clean_dataframe_column_names", lambda: bq.clean_dataframe_column_names(dataframe.rename(columns=lambda column: f"Côlumn {column}!")))
@@ -0,0 +1,71 @@
+"""Benchmarks for GCloudStorageTool methods, against a local fake-gcs-server.
+
+Start the server before running this suite, e.g.:
+docker run -d -p 4443:4443 fsouza/fake-gcs-server -scheme http
+and point the Google Cloud Storage client to it:
+export STORAGE_EMULATOR_HOST=http://localhost:4443
+"""
+
+import os
+from .harness import SuiteSkipped, fake_credentials, make_file, make_folder, sample_dataframe, working_directory
+
+
+SUITE = "gcloudstorage_tools"
+BUCKET = "instackup-bench"
+
+
+def run(runner, files=100, file_size=64 * 1024, rows=10000):
+    if os.environ.get("STORAGE_EMULATOR_HOST") is None:
+        raise SuiteSkipped("STORAGE_EMULATOR_HOST is not set (see fake-gcs-server instructions in this module)")
+
+    try:
+        from google.cloud import storage  # noqa: F401
+    except ImportError:
+        raise SuiteSkipped("google-cloud-storage is not installed")
+
+    from instackup.gcloudstorage_tools import GCloudStorageTool
+
+    os.environ.setdefault("GOOGLE_CLOUD_PROJECT", "test-project")
+
+    with fake_credentials(), working_directory() as work_dir:
+        gs = GCloudStorageTool(bucket=BUCKET, authenticate=False)
+        if gs.client.lookup_bucket(BUCKET) is None:
+            gs.client.create_bucket(BUCKET)
+
+        # Fixtures
+        local_file = make_file(os.path.join(work_dir, "fixtures", "upload.bin"), file_size)
+        local_folder = make_folder(os.path.join(work_dir, "fixtures", "folder"), files=10, nbytes=file_size // 4)
+        dataframe = sample_dataframe(rows)
+
+        gs.set_subfolder("listing")
+        for index in range(files):
+            gs.upload_file(local_file, f"listing/file_{index}.bin")
+
+        runner.bench(SUITE, "constructor", lambda: GCloudStorageTool(bucket=BUCKET, authenticate=False))
+        runner.bench(SUITE, f"list_contents_{files}_blobs", lambda: gs.list_contents(), rows=files)
+        runner.bench(SUITE, f"list_contents_yield_{files}_blobs", lambda: list(gs.list_contents(yield_results=True)), rows=files)
+
+        gs.set_subfolder("upload")
+        runner.bench(SUITE, "upload_file", lambda: gs.upload_file(local_file), nbytes=file_size)
+        runner.bench(
+            SUITE, "download_file",
+            lambda: gs.download_file(download_to=os.path.join(work_dir, "downloads") + os.sep, remote_filename="upload.bin", replace=True),
+            setup=lambda: os.makedirs(os.path.join(work_dir, "downloads"), exist_ok=True),
+            nbytes=file_size,
+        )
+
+        gs.set_subfolder("subfolders")
+        runner.bench(SUITE, "upload_subfolder_30_files", lambda: gs.upload_subfolder(local_folder), nbytes=30 * (file_size // 4))
+
+        gs.set_subfolder("subfolders/folder")
+        download_to = os.path.join(work_dir, "subfolder_downloads")
+        runner.bench(SUITE, "download_subfolder_30_files", lambda: gs.download_subfolder(download_to=download_to), nbytes=30 * (file_size // 4))
+
+        gs.set_subfolder("dataframes")
+        runner.bench(
+            SUITE, f"upload_from_dataframe_{rows}_rows",
+            lambda: gs.upload_from_dataframe(dataframe, filename="frame.csv", overwrite=True, index=False),
+            rows=rows,
+        )
+        gs.select_file("frame.csv")
+        runner.bench(SUITE, f"download_as_string_{rows}_rows", lambda: gs.download_as_string(), rows=rows)
@@ -0,0 +1,52 @@
+"""Benchmarks for GSheetsTool methods, using a fake in-memory worksheet.
+
+They measure the client-side cost of each method (DataFrame conversion and validation),
+not Google Sheets' own latency.
+"""
+
+from .harness import sample_dataframe
+
+
+SUITE = "gsheets_tools"
+
+
+class FakeWorksheet(object):
+    """Stands in for gspread.Worksheet, keeping its values in a list of lists."""
+
+    def __init__(self, values=None):
+        self.values = values or []
+
+    def get_all_records(self):
+        if not self.values:
+            return []
+        header, *rows = self.values
+        return [dict(zip(header, row)) for row in rows]
+
+    def clear(self):
+        self.values = []
+
+    def update(self, values):
+        self.values = values
+
+
+def run(runner, rows=5000):
+    from instackup.gsheets_tools import GSheetsTool
+
+    dataframe = sample_dataframe(rows)
+    dataframe["created_at"] = dataframe["created_at"].astype(str)
+    values = [dataframe.columns.values.tolist()] + dataframe.values.tolist()
+
+    # Skipping __init__, which would authenticate a real client
+    sheets = GSheetsTool.__new__(GSheetsTool)
+    sheets.gspread_client = None
+    sheets.spreadsheet = None
+
+    sheets.worksheet = FakeWorksheet(values)
+    runner.bench(SUITE, f"download_{rows}_rows", lambda: sheets.download(), rows=rows)
+
+    def reset_worksheet():
+        sheets.worksheet = FakeWorksheet(list(values))
+
+    runner.bench(SUITE, f"upload_truncate_{rows}_rows", lambda: sheets.upload(dataframe, write_mode="TRUNCATE"), setup=reset_worksheet, rows=rows)
+    runner.bench(SUITE, f"upload_truncate_forced_{rows}_rows", lambda: sheets.upload(dataframe, write_mode="TRUNCATE", force_upload=True), setup=reset_worksheet, rows=rows)
+    runner.bench(SUITE, f"upload_append_{rows}_rows", lambda: sheets.upload(dataframe, write_mode="APPEND"), setup=reset_worksheet, rows=rows)
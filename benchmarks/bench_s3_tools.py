@@ -0,0 +1,63 @@
+"""Benchmarks for S3Tool methods, against moto's in-process S3 stand-in."""
+
+import os
+from .harness import SuiteSkipped, fake_credentials, make_file, make_folder, working_directory
+
+
+SUITE = "s3_tools"
+BUCKET = "instackup-bench"
+
+
+def _mock_s3():
+    try:
+        import moto
+    except ImportError:
+        raise SuiteSkipped("moto is not installed (pip install moto)")
+
+    # moto >= 5 merged all service mocks into mock_aws
+    mock = getattr(moto, "mock_aws", None) or getattr(moto, "mock_s3")
+    return mock()
+
+
+def run(runner, files=100, file_size=64 * 1024):
+    from instackup.s3_tools import S3Tool
+
+    # moto intercepts every boto3 call, so no real credentials or network are used
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+
+    with _mock_s3(), fake_credentials(), working_directory() as work_dir:
+        s3 = S3Tool(bucket=BUCKET)
+        s3.s3.create_bucket(Bucket=BUCKET)
+
+        # Fixtures
+        local_file = make_file(os.path.join(work_dir, "fixtures", "upload.bin"), file_size)
+        local_folder = make_folder(os.path.join(work_dir, "fixtures", "folder"), files=10, nbytes=file_size // 4)
+
+        s3.set_subfolder("listing")
+        for index in range(files):
+            s3.upload_file(local_file, f"listing/file_{index}.bin")
+
+        runner.bench(SUITE, "constructor", lambda: S3Tool(bucket=BUCKET))
+        runner.bench(SUITE, f"list_contents_{files}_keys", lambda: s3.list_contents(), rows=files)
+        runner.bench(SUITE, f"list_contents_yield_{files}_keys", lambda: list(s3.list_contents(yield_results=True)), rows=files)
+
+        s3.set_subfolder("upload")
+        runner.bench(SUITE, "upload_file", lambda: s3.upload_file(local_file), nbytes=file_size)
+
+        def download():
+            s3.download_file("upload/upload.bin", os.path.join("downloads", "upload.bin"))
+
+        runner.bench(
+            SUITE, "download_file", download,
+            teardown=lambda _: os.remove(os.path.join("downloads", "upload.bin")),
+            nbytes=file_size,
+        )
+
+        s3.set_subfolder("subfolders")
+        runner.bench(SUITE, "upload_subfolder_30_files", lambda: s3.upload_subfolder(local_folder), nbytes=30 * (file_size // 4))
+
+        download_to = os.path.join(work_dir, "subfolder_downloads")
+        s3.set_subfolder("subfolders/folder")
+        runner.bench(SUITE, "download_subfolder_30_files", lambda: s3.download_subfolder(download_to=download_to), nbytes=30 * (file_size // 4))
@@ -0,0 +1,170 @@
+"""Benchmarks for SQLTool methods, using an in-memory SQLite database."""
+
+import io
+import os
+import tempfile
+from instackup.sql_tools import SQLiteTool, QueryResultCache, JSONWatermarkStore, close_all_pools, run_concurrent_queries, copy_table
+from .harness import sample_dataframe
+
+
+SUITE = "sql_tools"
+
+
+def _populated_db(rows):
+    db = SQLiteTool().connect()
+    sample_dataframe(rows).to_sql("bench", db.connection, index=False)
+    db.commit()
+    return db
+
+
+def run(runner, rows=10000):
+    db = _populated_db(rows)
+
+    try:
+        runner.bench(SUITE, f"query_pandas_{rows}_rows", lambda: db.query("SELECT * FROM bench"), rows=rows)
+        runner.bench(SUITE, f"query_cursor_{rows}_rows", lambda: db.query("SELECT * FROM bench", fetch_through_pandas=False), rows=rows)
+        runner.bench(SUITE, f"query_arrow_{rows}_rows", lambda: db.query("SELECT * FROM bench", fetch_as="arrow"), rows=rows)
+        runner.bench(SUITE, f"query_pandas_arrow_{rows}_rows", lambda: db.query("SELECT * FROM bench", fetch_as="pandas_arrow"), rows=rows)
+        runner.bench(SUITE, f"query_to_parquet_{rows}_rows", lambda: db.query_to_parquet("SELECT * FROM bench", io.BytesIO(), chunksize=1000), rows=rows)
+        def stream_query():
+            for _ in db.stream_query("SELECT * FROM bench", chunksize=1000):
+                pass
+
+        runner.bench(SUITE, f"stream_query_pandas_{rows}_rows", stream_query, rows=rows)
+        runner.bench(SUITE, "query_single_row", lambda: db.query("SELECT * FROM bench WHERE id = 42", fetch_through_pandas=False), iterations=runner.iterations * 50)
+        runner.bench(
+            SUITE, "query_single_row_params",
+            lambda: db.query("SELECT * FROM bench WHERE id = ?", fetch_through_pandas=False, params=(42,)),
+            iterations=runner.iterations * 50,
+        )
+        def cached_query():
+            db.result_cache = QueryResultCache()
+            try:
+                for _ in range(10):
+                    db.query("SELECT * FROM bench")
+            finally:
+                db.result_cache = None
+
+        runner.bench(SUITE, f"query_pandas_{rows}_rows_x10_cached", cached_query, rows=rows * 10)
+        runner.bench(SUITE, "describe_table", lambda: db.describe_table("bench"))
+        runner.bench(SUITE, "describe_table_catalog", lambda: db.describe_table("bench", use_catalog=True))
+
+        def insert_rows():
+            for index in range(100):
+                db.execute_sql(f"INSERT INTO bench_insert VALUES ({index}, 'name_{index}')")
+            db.commit()
+
+        runner.bench(
+            SUITE, "execute_sql_insert_100_rows", insert_rows,
+            setup=lambda: db.execute_sql("CREATE TABLE bench_insert (id INTEGER, name TEXT)"),
+            teardown=lambda _: db.execute_sql("DROP TABLE bench_insert"),
+            rows=100,
+        )
+
+        bulk_rows = [(index, f"name_{index}") for index in range(rows)]
+        runner.bench(
+            SUITE, f"bulk_insert_{rows}_rows", lambda: db.bulk_insert(bulk_rows, "bench_insert"),
+            setup=lambda: db.execute_sql("CREATE TABLE bench_insert (id INTEGER, name TEXT)"),
+            teardown=lambda _: db.execute_sql("DROP TABLE bench_insert"),
+            rows=rows,
+        )
+
+        def connect_and_query():
+            with SQLiteTool() as conn_db:
+                conn_db.query("SELECT 1", fetch_through_pandas=False)
+
+        runner.bench(SUITE, "connect_query_close", connect_and_query, iterations=runner.iterations * 10)
+
+        def pooled_connect_and_query():
+            with SQLiteTool(use_pool=True) as conn_db:
+                conn_db.query("SELECT 1", fetch_through_pandas=False)
+
+        runner.bench(SUITE, "connect_query_close_pooled", pooled_connect_and_query, iterations=runner.iterations * 10)
+
+        # Separate connections need a database file, and sqlite3 releases the GIL while a query runs
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_db = SQLiteTool(filename=os.path.join(temp_dir, "bench.db"), use_pool=True)
+            slow_query = "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 200000) SELECT SUM(x) FROM c"
+
+            def serial_queries():
+                with file_db:
+                    for _ in range(8):
+                        file_db.query(slow_query, fetch_through_pandas=False)
+
+            runner.bench(SUITE, "query_x8_serial", serial_queries)
+            runner.bench(
+                SUITE, "run_concurrent_queries_x8",
+                lambda: run_concurrent_queries([(file_db, slow_query)] * 8, max_workers=8, fetch_through_pandas=False),
+            )
+
+            # Writes to disk, committing every batch, against a single transaction with the index built at the end
+            def indexed_table(profile):
+                def setup():
+                    load_db = SQLiteTool(filename=os.path.join(temp_dir, f"load_{profile}.db"), profile=profile).connect()
+                    load_db.execute_sql("CREATE TABLE bench_insert (id INTEGER, name TEXT)")
+                    load_db.execute_sql("CREATE INDEX bench_insert_name ON bench_insert (name)")
+                    load_db.commit()
+                    return load_db
+
+                return setup
+
+            def drop_table(load_db):
+                load_db.execute_sql("DROP TABLE bench_insert")
+                load_db.commit()
+                load_db.close_connection()
+
+            def bulk_load(load_db):
+                with load_db.bulk_load(tables=["bench_insert"]):
+                    load_db.bulk_insert(bulk_rows, "bench_insert", batch_size=1000)
+
+            runner.bench(
+                SUITE, f"bulk_insert_{rows}_rows_file_indexed",
+                lambda load_db: load_db.bulk_insert(bulk_rows, "bench_insert", batch_size=1000),
+                setup=indexed_table("default"), teardown=drop_table, rows=rows,
+            )
+            runner.bench(
+                SUITE, f"bulk_load_{rows}_rows_file_indexed_fast_profile", bulk_load,
+                setup=indexed_table("fast"), teardown=drop_table, rows=rows,
+            )
+
+            # Only the newest 1% of the rows are past the watermark
+            store = JSONWatermarkStore(os.path.join(temp_dir, "watermarks.json"))
+            new_rows = max(rows // 100, 1)
+
+            def extract_new_rows():
+                for batch in db.extract_incremental("bench", "id", store, key="bench"):
+                    pass
+
+            runner.bench(
+                SUITE, f"extract_incremental_{new_rows}_of_{rows}_rows", extract_new_rows,
+                setup=lambda: store.set("bench", rows - new_rows - 1), rows=new_rows,
+            )
+
+            # Copying from a file, read by another thread while the previous chunks are written,
+            # against loading the whole table in a DataFrame and inserting it
+            source_db = SQLiteTool(filename=os.path.join(temp_dir, "source.db")).connect()
+            sample_dataframe(rows).to_sql("bench", source_db.connection, index=False)
+            source_db.commit()
+
+            def query_and_insert(copy_db):
+                copy_db.bulk_insert(source_db.query("SELECT * FROM bench"), "bench")
+
+            def create_copy_table():
+                copy_db = SQLiteTool().connect()
+                copy_db.execute_sql("CREATE TABLE bench (id INTEGER, value REAL, name TEXT, active INTEGER, created_at TIMESTAMP)")
+                return copy_db
+
+            try:
+                runner.bench(
+                    SUITE, f"query_and_bulk_insert_{rows}_rows", query_and_insert,
+                    setup=create_copy_table, teardown=lambda copy_db: copy_db.close_connection(), rows=rows,
+                )
+                runner.bench(
+                    SUITE, f"copy_table_{rows}_rows", lambda copy_db: copy_table(source_db, copy_db, "bench", chunksize=1000),
+                    setup=lambda: SQLiteTool().connect(), teardown=lambda copy_db: copy_db.close_connection(), rows=rows,
+                )
+            finally:
+                source_db.close_connection()
+    finally:
+        db.close_connection()
+        close_all_pools()
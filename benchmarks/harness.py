@@ -0,0 +1,278 @@
+import io
+import os
+import gc
+import json
+import time
+import shutil
+import platform
+import tempfile
+import tracemalloc
+import contextlib
+from datetime import datetime, timezone
+
+
+class SuiteSkipped(Exception):
+    """Raised by a benchmark suite when its local stand-in (package or server) isn't available."""
+
+
+def percentile(sorted_values, percent):
+    """Returns the percentile of an already sorted list, interpolating between the closest ranks."""
+
+    if not sorted_values:
+        return None
+
+    position = (len(sorted_values) - 1) * percent / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+class BenchmarkRunner(object):
+    """Runs benchmark cases and collects their results.
+
+    Each case is timed for a number of iterations after some warmup ones, and then run once
+    more under tracemalloc to get its peak memory, so the tracing overhead doesn't affect the timings.
+    """
+
+    def __init__(self, iterations=20, warmup=2, quiet=True):
+        self.iterations = iterations
+        self.warmup = warmup
+        self.quiet = quiet
+        self.results = []
+
+    @contextlib.contextmanager
+    def _silenced(self):
+        """Hides the progress messages printed by some methods (e.g. upload_subfolder)."""
+
+        if self.quiet:
+            with contextlib.redirect_stdout(io.StringIO()):
+                yield
+        else:
+            yield
+
+    def bench(self, suite, name, func, setup=None, teardown=None, iterations=None, rows=None, nbytes=None):
+        """Benchmarks func, which receives whatever setup returns (or nothing if it returns None).
+
+        setup and teardown run around every iteration and aren't timed.
+        rows and nbytes are the amount of rows and bytes each call handles, used to report throughput.
+        """
+
+        iterations = self.iterations if iterations is None else iterations
+
+        def run_once(trace_memory=False):
+            state = setup() if setup is not None else None
+            args = () if state is None else (state,)
+
+            try:
+                with self._silenced():
+                    if trace_memory:
+                        tracemalloc.start()
+                        func(*args)
+                        _, peak = tracemalloc.get_traced_memory()
+                        tracemalloc.stop()
+                        return peak
+                    else:
+                        start = time.perf_counter()
+                        func(*args)
+                        return time.perf_counter() - start
+            finally:
+                if teardown is not None:
+                    teardown(state)
+
+        result = {
+            "suite": suite,
+            "name": name,
+            "iterations": iterations,
+        }
+
+        try:
+            for _ in range(self.warmup):
+                run_once()
+
+            gc.collect()
+            latencies = sorted(run_once() for _ in range(iterations))
+            peak_memory = run_once(trace_memory=True)
+
+        except Exception as e:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+            result["error"] = f"{type(e).__name__}: {e}"
+            self.results.append(result)
+            return result
+
+        total_time = sum(latencies)
+        result.update({
+            "ops_per_sec": iterations / total_time if total_time else None,
+            "latency_seconds": {
+                "min": latencies[0],
+                "mean": total_time / iterations,
+                "p50": percentile(latencies, 50),
+                "p90": percentile(latencies, 90),
+                "p95": percentile(latencies, 95),
+                "p99": percentile(latencies, 99),
+                "max": latencies[-1],
+            },
+            "peak_memory_bytes": peak_memory,
+        })
+
+        if rows is not None:
+            result["rows_per_call"] = rows
+            result["rows_per_sec"] = rows * result["ops_per_sec"] if result["ops_per_sec"] else None
+        if nbytes is not None:
+            result["bytes_per_call"] = nbytes
+            result["bytes_per_sec"] = nbytes * result["ops_per_sec"] if result["ops_per_sec"] else None
+
+        self.results.append(result)
+        return result
+
+    def skip(self, suite, reason):
+        """Records that a whole suite was skipped."""
+
+        self.results.append({"suite": suite, "skipped": reason})
+
+
+def environment_info():
+    """Returns information about where the benchmarks ran, saved alongside the results."""
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def save_results(results, path, iterations, warmup):
+    """Writes the benchmark results to path as JSON."""
+
+    report = {
+        "environment": environment_info(),
+        "settings": {"iterations": iterations, "warmup": warmup},
+        "results": results,
+    }
+
+    with open(path, "w") as results_file:
+        json.dump(report, results_file, indent=2)
+
+
+def compare_results(baseline_path, results, threshold=0.10):
+    """Compares results with the ones saved in baseline_path and returns the list of regressions,
+    i.e. cases whose median latency grew more than threshold (a fraction, 0.10 = 10%)."""
+
+    with open(baseline_path, "r") as baseline_file:
+        baseline = json.load(baseline_file)
+
+    baseline_latencies = {
+        (case["suite"], case["name"]): case["latency_seconds"]["p50"]
+        for case in baseline["results"] if "latency_seconds" in case
+    }
+
+    regressions = []
+    for case in results:
+        if "latency_seconds" not in case:
+            continue
+
+        old_p50 = baseline_latencies.get((case["suite"], case["name"]))
+        new_p50 = case["latency_seconds"]["p50"]
+        if old_p50 and new_p50 > old_p50 * (1 + threshold):
+            regressions.append({
+                "suite": case["suite"],
+                "name": case["name"],
+                "baseline_p50": old_p50,
+                "current_p50": new_p50,
+                "change": new_p50 / old_p50 - 1,
+            })
+
+    return regressions
+
+
+@contextlib.contextmanager
+def working_directory():
+    """Runs the block inside a new temporary directory, removed afterwards.
+    Some download methods write to the current working directory."""
+
+    current_path = os.getcwd()
+    temp_dir = tempfile.mkdtemp(prefix="instackup_bench_")
+    os.chdir(temp_dir)
+
+    try:
+        yield temp_dir
+    finally:
+        os.chdir(current_path)
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+@contextlib.contextmanager
+def fake_credentials():
+    """Points CREDENTIALS_HOME to a temporary secrets file with dummy values for every service,
+    restoring the previous value afterwards."""
+
+    from instackup.general_tools import reload_credentials
+
+    secrets = {
+        "Location": "local",
+        "AWS": {"default": {"access_key": "testing", "secret_key": "testing"}},
+        "Google": {"default": {
+            "project_id": "test-project",
+            "project_name": "test-project",
+            "project_number": "000000000000",
+            "secret_filename": "api_key.json",
+        }},
+    }
+
+    previous = os.environ.get("CREDENTIALS_HOME")
+
+    with tempfile.TemporaryDirectory() as secrets_dir:
+        secrets_path = os.path.join(secrets_dir, "secret.json")
+        with open(secrets_path, "w") as secrets_file:
+            json.dump(secrets, secrets_file)
+
+        os.environ["CREDENTIALS_HOME"] = secrets_path
+        reload_credentials()
+
+        try:
+            yield secrets_path
+        finally:
+            if previous is None:
+                del os.environ["CREDENTIALS_HOME"]
+            else:
+                os.environ["CREDENTIALS_HOME"] = previous
+            reload_credentials()
+
+
+def make_file(path, nbytes):
+    """Creates a file with nbytes of random content and returns its path."""
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(os.urandom(nbytes))
+    return path
+
+
+def make_folder(path, files=10, nbytes=1024, subfolders=2):
+    """Creates a folder tree with the given amount of files in the root and in each subfolder."""
+
+    for index in range(files):
+        make_file(os.path.join(path, f"file_{index}.bin"), nbytes)
+
+    for subfolder in range(subfolders):
+        for index in range(files):
+            make_file(os.path.join(path, f"sub_{subfolder}", f"file_{index}.bin"), nbytes)
+
+    return path
+
+
+def sample_dataframe(rows=1000):
+    """Returns a DataFrame with integer, float, string, boolean and timestamp columns."""
+
+    import pandas as pd
+
+    return pd.DataFrame({
+        "id": range(rows),
+        "value": [index * 0.5 for index in range(rows)],
+        "name": [f"name_{index}" for index in range(rows)],
+        "active": [index % 2 == 0 for index in range(rows)],
+        "created_at": pd.date_range("2020-01-01", periods=rows, freq="min"),
+    })
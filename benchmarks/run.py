@@ -0,0 +1,79 @@
+"""Runs the instackup benchmark suites and saves the results as JSON.
+
+Usage (from the repository root):
+python -m benchmarks.run --output results.json
+python -m benchmarks.run --suites sql_tools s3_tools --compare baseline.json
+
+Each suite uses a local stand-in for its service:
+- sql_tools: in-memory SQLite database;
+- s3_tools: moto (pip install moto);
+- gcloudstorage_tools: fake-gcs-server, reached through STORAGE_EMULATOR_HOST;
+- bigquery_tools and gsheets_tools: fake clients replaying canned responses.
+Suites whose stand-in isn't available are skipped and recorded as such.
+"""
+
+import sys
+import argparse
+import importlib
+from .harness import BenchmarkRunner, SuiteSkipped, save_results, compare_results
+
+
+SUITES = ["sql_tools", "s3_tools", "gcloudstorage_tools", "bigquery_tools", "gsheets_tools"]
+
+
+def format_result(result):
+    if "skipped" in result:
+        return f"{result['suite']:<20} SKIPPED: {result['skipped']}"
+    if "error" in result:
+        return f"{result['suite']:<20} {result['name']:<55} ERROR: {result['error']}"
+
+    latency = result["latency_seconds"]
+    return "{suite:<20} {name:<55} {ops:>10.1f} ops/s  p50 {p50:>9.3f} ms  p95 {p95:>9.3f} ms  peak {peak:>8.1f} KiB".format(
+        suite=result["suite"],
+        name=result["name"],
+        ops=result["ops_per_sec"] or 0,
+        p50=latency["p50"] * 1000,
+        p95=latency["p95"] * 1000,
+        peak=result["peak_memory_bytes"] / 1024,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Runs instackup performance benchmarks.")
+    parser.add_argument("--suites", nargs="+", choices=SUITES, default=SUITES, help="Suites to run (defaults to all).")
+    parser.add_argument("--iterations", type=int, default=20, help="Timed iterations per case.")
+    parser.add_argument("--warmup", type=int, default=2, help="Untimed iterations before each case.")
+    parser.add_argument("--output", default="benchmark_results.json", help="Path of the JSON results file.")
+    parser.add_argument("--compare", help="JSON results file of a previous run to check for regressions.")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Median latency growth flagged as regression (0.10 = 10%%).")
+    args = parser.parse_args(argv)
+
+    runner = BenchmarkRunner(iterations=args.iterations, warmup=args.warmup)
+
+    for suite in args.suites:
+        first_result = len(runner.results)
+        try:
+            module = importlib.import_module(f".bench_{suite}", __package__)
+            module.run(runner)
+        except SuiteSkipped as reason:
+            runner.skip(suite, str(reason))
+
+        for result in runner.results[first_result:]:
+            print(format_result(result))
+
+    save_results(runner.results, args.output, iterations=args.iterations, warmup=args.warmup)
+    print(f"\nResults saved to {args.output}")
+
+    if args.compare:
+        regressions = compare_results(args.compare, runner.results, threshold=args.threshold)
+        for regression in regressions:
+            print("REGRESSION {suite} {name}: p50 {baseline_p50:.6f}s -> {current_p50:.6f}s ({change:+.1%})".format(**regression))
+
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""Instackup package.
+
+The tool classes and helper functions can be accessed directly from the package, e.g.
+instackup.SQLiteTool or instackup.fetch_credentials. They're only imported on first access
+(see PEP 562), so importing the package doesn't load the SDKs of services that aren't used.
+"""
+
+import logging
+import importlib
+
+
+# Library default: discard log records unless general_tools.configure_logging is called
+logging.getLogger(__name__).addHandler(logging.NullHandler())
+
+
+# Maps each lazily exposed attribute name to the module it's defined in.
+_LAZY_ATTRIBUTES = {
+    # bigquery_tools
+    "BigQueryTool": "bigquery_tools",
+
+    # gcloudstorage_tools
+    "GCloudStorageTool": "gcloudstorage_tools",
+
+    # general_tools
+    "fetch_credentials": "general_tools",
+    "configure_logging": "general_tools",
+    "shutdown_logging": "general_tools",
+    "reload_credentials": "general_tools",
+    "code_location": "general_tools",
+    "unicode_to_ascii": "general_tools",
+    "parse_remote_uri": "general_tools",
+
+    # gsheets_tools
+    "GSheetsTool": "gsheets_tools",
+
+    # heroku_tools
+    "HerokuTool": "heroku_tools",
+
+    # metrics_tools
+    "MetricsRegistry": "metrics_tools",
+    "enable_metrics": "metrics_tools",
+    "disable_metrics": "metrics_tools",
+    "get_registry": "metrics_tools",
+
+    # redshift_tools
+    "RedShiftTool": "redshift_tools",
+    "ClusterCredentialsCache": "redshift_tools",
+    "configure_credentials_cache": "redshift_tools",
+
+    # s3_tools
+    "S3Tool": "s3_tools",
+
+    # sql_tools
+    "SQLTool": "sql_tools",
+    "SQLiteTool": "sql_tools",
+    "MySQLTool": "sql_tools",
+    "PostgreSQLTool": "sql_tools",
+    "ConnectionPool": "sql_tools",
+    "StatementCache": "sql_tools",
+    "QueryResultCache": "sql_tools",
+    "ReplicaSet": "sql_tools",
+    "SlowQueryLog": "sql_tools",
+    "SchemaCatalog": "sql_tools",
+    "JSONWatermarkStore": "sql_tools",
+    "SQLiteWatermarkStore": "sql_tools",
+    "configure_pool": "sql_tools",
+    "close_all_pools": "sql_tools",
+    "configure_replicas": "sql_tools",
+    "run_concurrent_queries": "sql_tools",
+    "copy_table": "sql_tools",
+}
+
+_SUBMODULES = set(_LAZY_ATTRIBUTES.values())
+
+__all__ = sorted(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return importlib.import_module("." + name, __name__)
+
+    try:
+        module_name = _LAZY_ATTRIBUTES[name]
+    except KeyError:
+        raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+
+    value = getattr(importlib.import_module("." + module_name, __name__), name)
+
+    # Caching the value, so the next access doesn't go through this function
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES) | _SUBMODULES)
@@ -1,26 +1,13 @@
 import os
 import logging
 import time
-import pandas as pd
-from google.cloud import bigquery
-from google.cloud import bigquery_datatransfer_v1
-from google.cloud.exceptions import NotFound
-from google.protobuf.timestamp_pb2 import Timestamp
 from .general_tools import fetch_credentials, unicode_to_ascii
+from .metrics_tools import instrument_methods, add_file_bytes
 
 
 # Logging Configuration
+# Handlers and level are set for the whole package by general_tools.configure_logging
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.WARNING)
-
-formatter = logging.Formatter("%(asctime)s:%(name)s:%(levelname)s: %(message)s")
-
-LOG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'logs')
-os.makedirs(LOG_DIR, exist_ok=True)
-file_handler = logging.FileHandler(os.path.join(LOG_DIR, "bigquery_tools.log"))
-file_handler.setFormatter(formatter)
-
-logger.addHandler(file_handler)
 
 
 # PostgreSQL reference: https://www.postgresql.org/docs/9.5/datatype.html
@@ -87,6 +74,7 @@ JSON_TO_BIGQUERY_TYPE_CONVERTER = {
 }
 
 
+@instrument_methods
 class BigQueryTool(object):
     """This class handle most of the interaction needed with BigQuery,
     so the base code becomes more readable and straightforward."""
@@ -115,6 +103,8 @@ class BigQueryTool(object):
             project = None
 
         # Initiating client
+        from google.cloud import bigquery
+
         logger.debug("Initiating BigQuery Client")
         try:
             bq_client = bigquery.Client()
@@ -130,7 +120,7 @@ class BigQueryTool(object):
     def query(self, sql_query):
         """Run a query and return the results as a Pandas Dataframe"""
 
-        logger.debug(f"Initiating query: {sql_query}")
+        logger.debug("Initiating query: %s", sql_query)
         try:
             result = self.client.query(sql_query).to_dataframe()
             logger.debug("Query returned successfully.")
@@ -160,6 +150,9 @@ class BigQueryTool(object):
         Defaults to False.
         """
 
+        from google.cloud import bigquery
+        from google.cloud.exceptions import NotFound
+
         # Job preparation
         job_config = bigquery.QueryJobConfig()
 
@@ -212,6 +205,8 @@ class BigQueryTool(object):
     def create_dataset(self, dataset, location="US"):
         """Creates a new dataset."""
 
+        from google.cloud import bigquery
+
         dataset_ref = self.client.dataset(dataset)
         dataset = bigquery.Dataset(dataset_ref)
 
@@ -240,6 +235,8 @@ class BigQueryTool(object):
         - 'view'
         """
 
+        from google.cloud import bigquery
+
         dataset_ref = self.client.get_dataset(dataset)
         entries = list(dataset_ref.access_entries)
 
@@ -294,6 +291,8 @@ class BigQueryTool(object):
         - dataframe: Pandas DataFrame.
         """
 
+        import pandas as pd
+
         tables_list = []
         tables = {
             "clustering_fields": [],
@@ -331,8 +330,9 @@ class BigQueryTool(object):
         if return_type.lower() in ["dict", "dataframe"] or len(tables) == 1:
             for table_info in self.client.list_tables(dataset):  # Will fail here if dataset doesn't exist
                 for key, list_value in tables.items():
-                    logger.debug("eval result = {result}".format(result=eval(f"table_info.{key}")))
-                    list_value.append(eval(f"table_info.{key}"))  # Adding each parameter to its respective key list
+                    value = eval(f"table_info.{key}")
+                    logger.debug("eval result = %s", value)
+                    list_value.append(value)  # Adding each parameter to its respective key list
 
             if return_type.lower() == "dataframe":
                 logger.debug("Returning dataframe...")
@@ -518,6 +518,9 @@ class BigQueryTool(object):
         The complete documentation of this method can be found here:
         https://pandas.pydata.org/pandas-docs/stable/reference/api/pandas.to_numeric.html
         """
+
+        import pandas as pd
+
         object_cols = dataframe.columns[dataframe.dtypes.eq('object')]
         cols = [x for x in object_cols if x not in exclude_columns]
         dataframe[cols] = dataframe[cols].apply(pd.to_numeric, **kwargs)
@@ -542,7 +545,7 @@ class BigQueryTool(object):
                 clean_data = "_" + clean_data
             column_map[raw_data] = clean_data
 
-        logger.debug(f"column_map = {column_map}")
+        logger.debug("column_map = %s", column_map)
         return dataframe.rename(column_map, axis=1)
 
     def upload(self, dataframe, dataset, table, **kwargs):
@@ -564,6 +567,8 @@ class BigQueryTool(object):
         BigQuery API format for the (also private) __job_preparation_file_upload method.
         """
 
+        from google.cloud import bigquery
+
         job_schema = []
 
         if type(schema) is dict:
@@ -579,12 +584,13 @@ class BigQueryTool(object):
             except KeyError:
                 raise ValueError("Field incomplete. Doesn't have name and/or type parameters.")
 
-            logger.debug("Field parameters: name={name}, type={type}, mode={mode}, description={description}".format(
-                name=column_info["name"],
-                type=column_info["type"],
-                mode=column_info["mode"],
-                description=column_info.get("description")
-            ))
+            logger.debug(
+                "Field parameters: name=%s, type=%s, mode=%s, description=%s",
+                column_info["name"],
+                column_info["type"],
+                column_info["mode"],
+                column_info.get("description")
+            )
 
             if column_info["type"].upper() == "RECORD":
                 fields = []
@@ -610,6 +616,8 @@ class BigQueryTool(object):
     def create_empty_table(self, dataset, table, schema):
         """Creates an empty table at dataset.table location, based on schema given"""
 
+        from google.cloud import bigquery
+
         schema = self.__parse_schema(schema=schema)
 
         table_ref = self.client.dataset(dataset).table(table)
@@ -627,6 +635,9 @@ class BigQueryTool(object):
         upload_from_gcs and upload_from_file methods.
         """
 
+        from google.cloud import bigquery
+        from google.cloud.exceptions import NotFound
+
         # ------- Start of Job preparation -------
         job_config = bigquery.LoadJobConfig()
 
@@ -813,6 +824,7 @@ class BigQueryTool(object):
         # Job execution
         with open(file_location, "rb") as source_file:
             load_job = self.client.load_table_from_file(source_file, table_ref, job_config=job_config)  # API request
+        add_file_bytes(file_location)
 
         print("Starting job {}".format(load_job.job_id))
         start_time = time.time()
@@ -825,6 +837,9 @@ class BigQueryTool(object):
         API documentation: https://googleapis.dev/python/bigquerydatatransfer/latest/gapic/v1/api.html
         """
 
+        from google.cloud import bigquery_datatransfer_v1
+        from google.protobuf.timestamp_pb2 import Timestamp
+
         # Initiating client
         if self.transfer_client is None:
             self.transfer_client = bigquery_datatransfer_v1.DataTransferServiceClient()
@@ -1,25 +1,16 @@
 import os
 import logging
-import pandas as pd
 from io import StringIO
-from google.cloud import storage
 from .general_tools import fetch_credentials, parse_remote_uri
+from .metrics_tools import instrument_methods, add_bytes, add_file_bytes
 
 
 # Logging Configuration
+# Handlers and level are set for the whole package by general_tools.configure_logging
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.WARNING)
-
-formatter = logging.Formatter("%(asctime)s:%(name)s:%(levelname)s: %(message)s")
-
-LOG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'logs')
-os.makedirs(LOG_DIR, exist_ok=True)
-file_handler = logging.FileHandler(os.path.join(LOG_DIR, "gcloudstorage_tools.log"))
-file_handler.setFormatter(formatter)
-
-logger.addHandler(file_handler)
 
 
+@instrument_methods
 class GCloudStorageTool(object):
     """This class handle most of the interaction needed with Google Cloud Storage,
     so the base code becomes more readable and straightforward."""
@@ -62,6 +53,8 @@ class GCloudStorageTool(object):
             project = None
 
         # Initiating client
+        from google.cloud import storage
+
         logger.debug("Initiating Google Cloud Storage Client")
         try:
             storage_client = storage.Client()
@@ -214,7 +207,7 @@ class GCloudStorageTool(object):
                         yield self.__get_blob_info(blob)
 
                 else:
-                    logger.debug(f"subfolder '{self.subfolder}' found, yielding all matching files in bucket")
+                    logger.debug("subfolder '%s' found, yielding all matching files in bucket", self.subfolder)
 
                     for blob in self.client.list_blobs(self.bucket_name, prefix=self.subfolder):
                         blob_dict = self.__get_blob_info(blob)
@@ -235,7 +228,7 @@ class GCloudStorageTool(object):
                     contents.append(self.__get_blob_info(blob))
 
             else:
-                logger.debug(f"subfolder '{self.subfolder}' found, listing all matching files in bucket")
+                logger.debug("subfolder '%s' found, listing all matching files in bucket", self.subfolder)
 
                 for blob in self.client.list_blobs(self.bucket_name, prefix=self.subfolder):
                     blob_dict = self.__get_blob_info(blob)
@@ -300,6 +293,7 @@ class GCloudStorageTool(object):
         print('Uploading file {} to gs://{}/{}'.format(filename, self.bucket_name, remote_path))
 
         blob.upload_from_filename(filename)
+        add_file_bytes(filename)
 
     def upload_subfolder(self, folder_path):
         """Uploads a local folder to with prefix as currently set enviroment (bucket and subfolder).
@@ -314,19 +308,20 @@ class GCloudStorageTool(object):
             # Getting only folder name
             folder_path = folder_path.replace("\\", "/")
             folder_path = folder_path + "/" if folder_path[-1] != "/" else folder_path
-            upload_folder = folder_path.split[-2]
+            upload_folder = folder_path.split("/")[-2]
 
             print('Uploading local folder {} to gs://{}/{}\n'.format(folder_path, self.bucket_name, self.subfolder + upload_folder))
 
-            for root, dirs, files in os.walk():
+            for root, dirs, files in os.walk(new_root):
                 for file in files:
-                    local_filename = root + file
-                    remote_path = self.subfolder + upload_folder + root.replace(new_root, "").replace("\\", "/") + file
+                    local_filename = os.path.join(root, file)
+                    remote_path = self.subfolder + upload_folder + root.replace(new_root, "").replace("\\", "/") + "/" + file
 
                     blob = self.bucket.blob(remote_path)
                     print('Uploading file {} to gs://{}/{}'.format(local_filename, self.bucket_name, remote_path))
 
                     blob.upload_from_filename(local_filename)
+                    add_file_bytes(local_filename)
         except Exception as e:
             raise e
         else:
@@ -362,6 +357,7 @@ class GCloudStorageTool(object):
             raise ValueError(f"File format {file_format} not supported. Supported format are 'CSV' and 'JSON'.")
 
         # Sets the pointer to the start of the in-memory file object
+        file_size = f.tell()
         f.seek(0)
 
         # Defines blob object and upload location
@@ -376,6 +372,7 @@ class GCloudStorageTool(object):
 
         # If everything is right, it'll finally upload the file.
         blob.upload_from_file(f)
+        add_bytes(file_size)
 
     def download_file(self, download_to=None, remote_filename=None, replace=False):
         """Downloads remote gs file to local path.
@@ -400,8 +397,8 @@ class GCloudStorageTool(object):
         if download_to is not None:
             local_filename = download_to.replace(local_filename, "") + local_filename
 
-        logger.debug(f"Blob name: {blob.name}")
-        logger.debug(f"Local filename: {local_filename}")
+        logger.debug("Blob name: %s", blob.name)
+        logger.debug("Local filename: %s", local_filename)
 
         # If this filename exists in set destination and replace is set to False, aborts the download
         if os.path.exists(local_filename) and not replace:
@@ -412,6 +409,7 @@ class GCloudStorageTool(object):
 
         # Downloads the file
         blob.download_to_filename(local_filename)
+        add_file_bytes(local_filename)
         logger.info("File downloaded successfully")
 
     def download_subfolder(self, download_to=None):
@@ -438,7 +436,7 @@ class GCloudStorageTool(object):
         print("Downloading files...")
         for blob in blobs_to_download:
             # Creating local folder structure
-            *folders, filename = blob.replace(self.subfolder, "", 1).split("/")
+            *folders, filename = blob.name.replace(self.subfolder, "", 1).split("/")
             local_folder = os.path.join(download_dir, *folders)
             os.makedirs(local_folder, exist_ok=True)
 
@@ -447,6 +445,7 @@ class GCloudStorageTool(object):
 
             print(f"Downloading remote file gs://{self.bucket_name}/{blob.name} to {local_filename}")
             blob.download_to_filename(local_filename)
+            add_file_bytes(local_filename)
 
     def download_on_dataframe(self, **kwargs):
         """Use currently file set information to download file and use it directly on a Pandas DataFrame
@@ -457,10 +456,12 @@ class GCloudStorageTool(object):
         https://pandas.pydata.org/pandas-docs/stable/reference/api/pandas.read_csv.html
         """
 
+        import pandas as pd
+
         if self.blob is None:
             raise ValueError("No file selected. Set it with select_file method first.")
 
-        logger.debug(f"gs path: {self.uri}")
+        logger.debug("gs path: %s", self.uri)
         return pd.read_csv(self.uri, **kwargs)
 
     def download_as_string(self, remote_filename=None, encoding="UTF-8"):
@@ -473,7 +474,9 @@ class GCloudStorageTool(object):
         else:
             blob = self.bucket.blob(self.subfolder + remote_filename)
 
-        return blob.download_as_string().decode(encoding)
+        content = blob.download_as_string()
+        add_bytes(len(content))
+        return content.decode(encoding)
 
     def delete_file(self):
         """Deletes the selected file from Google Cloud Storage."""
@@ -1,22 +1,153 @@
 import os
+import copy
 import json
-import yaml
+import queue
+import atexit
 import logging
+import logging.handlers
+import threading
 import unicodedata
 
 
 # Logging Configuration
+# Handlers and level are set for the whole package by configure_logging
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.WARNING)
 
-formatter = logging.Formatter("%(asctime)s:%(name)s:%(levelname)s: %(message)s")
+LOG_FORMAT = "%(asctime)s:%(name)s:%(levelname)s: %(message)s"
 
-LOG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'logs')
-os.makedirs(LOG_DIR, exist_ok=True)
-file_handler = logging.FileHandler(os.path.join(LOG_DIR, "general_tools.log"))
-file_handler.setFormatter(formatter)
+# Queue handler attached to the package logger, the listener that consumes it
+# and the handlers created by configure_logging (which are closed on shutdown)
+_log_queue_handler = None
+_log_listener = None
+_log_owned_handlers = []
+_log_lock = threading.Lock()
 
-logger.addHandler(file_handler)
+
+def configure_logging(level=logging.WARNING, filename=None, handlers=None, log_format=LOG_FORMAT):
+    """Sets up logging for all instackup modules. Nothing is logged (or written to disk) until this is called.
+
+    Records are put in a queue by the calling thread and written by a background thread,
+    so logging doesn't add I/O to the code being logged.
+
+    level parameter sets the minimum level logged, either as an int or a name like "DEBUG".
+    If filename is given, logs are written to that file (its directory is created if needed);
+    otherwise they're written to stderr. Use the handlers parameter to pass a list of custom
+    logging.Handler objects instead; in that case, filename and log_format are ignored.
+
+    Calling it again replaces the previous configuration.
+    """
+
+    global _log_queue_handler, _log_listener, _log_owned_handlers
+
+    owned_handlers = []
+    if handlers is None:
+        if filename is None:
+            handler = logging.StreamHandler()
+        else:
+            log_dir = os.path.dirname(os.path.abspath(filename))
+            os.makedirs(log_dir, exist_ok=True)
+            handler = logging.FileHandler(filename)
+
+        handler.setFormatter(logging.Formatter(log_format))
+        handlers = owned_handlers = [handler]
+
+    with _log_lock:
+        _stop_log_listener()
+        _log_owned_handlers = owned_handlers
+
+        log_queue = queue.Queue(-1)
+        _log_queue_handler = logging.handlers.QueueHandler(log_queue)
+        _log_listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _log_listener.start()
+
+        package_logger = logging.getLogger(__name__.split(".")[0])
+        package_logger.addHandler(_log_queue_handler)
+        package_logger.setLevel(level)
+
+
+def shutdown_logging():
+    """Writes any pending log records and removes the configuration set by configure_logging.
+    It's called automatically when the interpreter exits."""
+
+    with _log_lock:
+        _stop_log_listener()
+
+
+def _stop_log_listener():
+    """Detaches the queue handler from the package logger and stops its listener. Must be called holding _log_lock."""
+
+    global _log_queue_handler, _log_listener, _log_owned_handlers
+
+    if _log_listener is None:
+        return
+
+    package_logger = logging.getLogger(__name__.split(".")[0])
+    package_logger.removeHandler(_log_queue_handler)
+    package_logger.setLevel(logging.NOTSET)
+
+    # Stopping the listener processes every record still in the queue before returning
+    _log_listener.stop()
+    for handler in _log_owned_handlers:
+        handler.close()
+
+    _log_queue_handler = None
+    _log_listener = None
+    _log_owned_handlers = []
+
+
+atexit.register(shutdown_logging)
+
+
+class _SecretsCache(object):
+    """Process-wide cache of parsed secret files.
+
+    Each entry is keyed by the file path and stores the file size and modification time
+    it was parsed with, so a changed file is parsed again on its next access.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, secrets_path):
+        """Returns the parsed content of the secrets file, reading it only if it changed."""
+
+        stat = os.stat(secrets_path)
+        signature = (stat.st_size, stat.st_mtime_ns)
+
+        with self._lock:
+            entry = self._entries.get(secrets_path)
+            if entry is not None and entry[0] == signature:
+                return entry[1]
+
+            # If file extension is ".json", tries to read as a JSON. If not, tries to read as a YAML file.
+            _, file_extension = os.path.splitext(secrets_path)
+
+            # Retrieving secrets from file
+            with open(secrets_path, "r") as stream:
+                if file_extension.lower() == ".json":
+                    secrets = json.load(stream)
+                else:
+                    import yaml
+                    secrets = yaml.safe_load(stream)
+
+            self._entries[secrets_path] = (signature, secrets)
+            logger.debug("Secrets file parsed: %s", secrets_path)
+
+        return secrets
+
+    def reload(self, secrets_path=None):
+        """Drops the cached content of secrets_path (or of all files if not given),
+        forcing it to be read again on its next access."""
+
+        with self._lock:
+            if secrets_path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(secrets_path, None)
+
+
+_secrets_cache = _SecretsCache()
 
 
 def fetch_credentials(service_name, *args, **kwargs):
@@ -27,12 +158,15 @@ def fetch_credentials(service_name, *args, **kwargs):
     the secret file is located is returned instead.
 
     Parses only 1 kwargs, not necessarily in order. Others are discarded.
+
+    The parsed file is cached for the whole process and only read again when its size
+    or modification time changes (or after a call to reload_credentials).
     """
 
     # Getting credentials' secret file path
     try:
         secrets_path = os.environ["CREDENTIALS_HOME"]
-        logger.debug(f"Environment Variable found: {secrets_path}")
+        logger.debug("Environment Variable found: %s", secrets_path)
     except KeyError:
         logger.exception('Environment Variable "CREDENTIALS_HOME" not found')
         raise KeyError('Environment Variable "CREDENTIALS_HOME" not found')
@@ -41,15 +175,8 @@ def fetch_credentials(service_name, *args, **kwargs):
     if service_name == "credentials_path":
         return os.path.dirname(secrets_path)
 
-    # If file extension is ".json", tries to read as a JSON. If not, tries to read as a YAML file.
-    _, file_extension = os.path.splitext(secrets_path)
-
-    # Retrieving secrets from file
-    with open(secrets_path, "r") as stream:
-        if file_extension.lower() == ".json":
-            secrets = json.load(stream)
-        else:
-            secrets = yaml.safe_load(stream)
+    # Retrieving secrets from the cache, which only reads the file again if it has changed
+    secrets = _secrets_cache.get(secrets_path)
 
     # Parses args and kwargs in the order was passed in the function call
     # First resolves all args and them the kwargs. Service Name is the first and only required one.
@@ -63,7 +190,19 @@ def fetch_credentials(service_name, *args, **kwargs):
         for kwarg in kwargs.values():
             return_values = return_values[kwarg]
 
-    return return_values
+    # Returns a copy so changes made by the caller don't leak into the cached secrets
+    return copy.deepcopy(return_values)
+
+
+def reload_credentials():
+    """Clears the parsed secrets cache used by fetch_credentials, so the secrets file
+    is read again on the next call.
+
+    The cache is already invalidated when the file size or modification time changes,
+    so this is only needed when the file is replaced keeping both of them.
+    """
+
+    _secrets_cache.reload()
 
 
 def code_location():
@@ -112,7 +251,7 @@ def parse_remote_uri(uri, service):
     if len(subfolder) != 0 and not subfolder.endswith("/"):
         subfolder += "/"
 
-    logger.debug(f"uri_service: '{uri_service}', bucket: '{bucket}', subfolder: '{subfolder}'")
+    logger.debug("uri_service: '%s', bucket: '%s', subfolder: '%s'", uri_service, bucket, subfolder)
 
     # Check for valid path
     if uri_service[:-1] != service:
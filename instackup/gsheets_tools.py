@@ -1,24 +1,15 @@
 import os
 import logging
-import gspread
-import pandas as pd
 from .general_tools import fetch_credentials
+from .metrics_tools import instrument_methods
 
 
 # Logging Configuration
+# Handlers and level are set for the whole package by general_tools.configure_logging
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.WARNING)
-
-formatter = logging.Formatter("%(asctime)s:%(name)s:%(levelname)s: %(message)s")
-
-LOG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'logs')
-os.makedirs(LOG_DIR, exist_ok=True)
-file_handler = logging.FileHandler(os.path.join(LOG_DIR, "gsheets_tools.log"))
-file_handler.setFormatter(formatter)
-
-logger.addHandler(file_handler)
 
 
+@instrument_methods
 class GSheetsTool(object):
     """This class encapsulates the gspread module to ease the setup process and handle most of the
     interaction needed with Google Sheets, so the base code becomes more readable and straightforward."""
@@ -26,6 +17,8 @@ class GSheetsTool(object):
     def __init__(self, sheet_url=None, sheet_key=None, sheet_gid=None, auth_mode='secret_key', connection="default", read_only=False,
                  scopes=['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']):
 
+        import gspread
+
         # >> Convert scopes into readonly if needed
         if read_only:
             if 'https://www.googleapis.com/auth/drive' in scopes:
@@ -127,6 +120,8 @@ class GSheetsTool(object):
     def download(self):
         """Download the selected worksheet into a Pandas DataFrame. Raises an error if no worksheet is set."""
 
+        import pandas as pd
+
         if self.worksheet is None:
             raise ValueError("No worksheet set. Set it first before downloading.")
         return pd.DataFrame(self.worksheet.get_all_records())
@@ -143,6 +138,8 @@ class GSheetsTool(object):
         in the worksheet and what's in the DataFrame fits.
         """
 
+        import pandas as pd
+
         # Checking worksheet validity
         if self.worksheet is None:
             raise ValueError("No worksheet set. Set it first before uploading.")
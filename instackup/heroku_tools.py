@@ -1,22 +1,14 @@
-import os
 import logging
 import subprocess
+from .metrics_tools import instrument_methods
 
 
 # Logging Configuration
+# Handlers and level are set for the whole package by general_tools.configure_logging
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.WARNING)
-
-formatter = logging.Formatter("%(asctime)s:%(name)s:%(levelname)s: %(message)s")
-
-LOG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'logs')
-os.makedirs(LOG_DIR, exist_ok=True)
-file_handler = logging.FileHandler(os.path.join(LOG_DIR, "heroku_tools.log"))
-file_handler.setFormatter(formatter)
-
-logger.addHandler(file_handler)
 
 
+@instrument_methods
 class HerokuTool(object):
     """This class encapsulates and handle most of the interaction needed with Heroku CLI,
     so the base code becomes more readable and straightforward."""
@@ -0,0 +1,378 @@
+import os
+import time
+import bisect
+import inspect
+import logging
+import functools
+import threading
+
+
+# Logging Configuration
+# Handlers and level are set for the whole package by general_tools.configure_logging
+logger = logging.getLogger(__name__)
+
+
+# Upper bounds, in seconds, of the default histogram buckets. Covers from fast local calls to long queries.
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, float("inf"))
+
+
+def _label_key(labels):
+    """Converts a labels dictionary into a hashable, ordered key."""
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(label_key, extra=()):
+    """Formats a label key in Prometheus text format, e.g. {tool="S3Tool",method="upload_file"}."""
+
+    labels = list(label_key) + list(extra)
+    if not labels:
+        return ""
+
+    escaped = (
+        '{}="{}"'.format(name, value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for name, value in labels
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter(object):
+    """A value that only goes up, kept separately for each combination of labels."""
+
+    metric_type = "counter"
+
+    def __init__(self, name, description=""):
+        self.name = name
+        self.description = description
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        """Increments the counter of the given labels by amount."""
+
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        """Returns the current value of the counter of the given labels."""
+        return self._values.get(_label_key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            return [{"labels": dict(key), "value": value} for key, value in self._values.items()]
+
+    def prometheus_lines(self):
+        with self._lock:
+            return [f"{self.name}{_format_labels(key)} {_format_value(value)}" for key, value in self._values.items()]
+
+
+class Histogram(object):
+    """Distribution of observed values (e.g. latencies), counted in buckets for each combination of labels."""
+
+    metric_type = "histogram"
+
+    def __init__(self, name, description="", buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        if self.buckets[-1] != float("inf"):
+            self.buckets += (float("inf"),)
+
+        # Each value is a list with the count of each bucket (non cumulative), followed by the sum and the total count
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        """Adds value to the distribution of the given labels."""
+
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+
+            state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def _cumulative(self, state):
+        cumulative = []
+        total = 0
+        for upper_bound, count in zip(self.buckets, state):
+            total += count
+            cumulative.append((upper_bound, total))
+        return cumulative
+
+    def samples(self):
+        with self._lock:
+            return [
+                {
+                    "labels": dict(key),
+                    "count": state[-1],
+                    "sum": state[-2],
+                    "buckets": {_format_value(upper_bound): count for upper_bound, count in self._cumulative(state)},
+                }
+                for key, state in self._values.items()
+            ]
+
+    def prometheus_lines(self):
+        lines = []
+        with self._lock:
+            for key, state in self._values.items():
+                for upper_bound, count in self._cumulative(state):
+                    lines.append(f"{self.name}_bucket{_format_labels(key, [('le', _format_value(upper_bound))])} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(state[-2])}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {state[-1]}")
+        return lines
+
+
+class MetricsRegistry(object):
+    """Holds all metrics by name. Metrics are created on their first use.
+
+    Any object with the same counter and histogram methods can be used in its place
+    (see enable_metrics), e.g. to forward the values to another metrics library.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, metric_class, name, description, **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(name)
+                if metric is None:
+                    metric = self._metrics[name] = metric_class(name, description, **kwargs)
+
+        if not isinstance(metric, metric_class):
+            raise ValueError(f"Metric {name} already registered as a {metric.metric_type}.")
+        return metric
+
+    def counter(self, name, description=""):
+        """Returns the counter with the given name, creating it if needed."""
+        return self._get_or_create(Counter, name, description)
+
+    def histogram(self, name, description="", buckets=DEFAULT_BUCKETS):
+        """Returns the histogram with the given name, creating it if needed."""
+        return self._get_or_create(Histogram, name, description, buckets=buckets)
+
+    def timer(self, name, description="", **labels):
+        """Context manager that observes the time spent inside it, in seconds, in the named histogram."""
+        return _Timer(self.histogram(name, description), labels)
+
+    def snapshot(self):
+        """Returns the current values of all metrics in a dictionary, by metric name."""
+
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        return {
+            metric.name: {
+                "type": metric.metric_type,
+                "description": metric.description,
+                "samples": metric.samples(),
+            }
+            for metric in metrics
+        }
+
+    def to_prometheus(self):
+        """Returns the current values of all metrics in Prometheus text exposition format."""
+
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+
+        lines = []
+        for metric in metrics:
+            if metric.description:
+                lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.metric_type}")
+            lines.extend(metric.prometheus_lines())
+
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def reset(self):
+        """Removes all metrics."""
+
+        with self._lock:
+            self._metrics = {}
+
+
+class _Timer(object):
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.elapsed = time.perf_counter() - self.start
+        self.histogram.observe(self.elapsed, **self.labels)
+
+
+# Process-wide registry used by the instrumented tools, and whether they should report to it
+_registry = MetricsRegistry()
+_enabled = False
+
+# Amounts reported by the methods being executed, one entry per nested instrumented call
+_call_stack = threading.local()
+
+
+def enable_metrics(registry=None):
+    """Starts collecting metrics from every tool method call.
+
+    If a registry is given, it replaces the current one; otherwise the current one is kept.
+    Returns the registry in use.
+    """
+
+    global _registry, _enabled
+
+    if registry is not None:
+        _registry = registry
+    _enabled = True
+    return _registry
+
+
+def disable_metrics():
+    """Stops collecting metrics. Already collected values are kept in the registry."""
+
+    global _enabled
+    _enabled = False
+
+
+def metrics_enabled():
+    return _enabled
+
+
+def get_registry():
+    """Returns the registry the tools report to."""
+    return _registry
+
+
+def _current_call():
+    stack = getattr(_call_stack, "calls", None)
+    if stack:
+        return stack[-1]
+    return None
+
+
+def add_bytes(nbytes):
+    """Reports bytes transferred by the tool method currently running. Does nothing if metrics are disabled."""
+
+    if _enabled:
+        call = _current_call()
+        if call is not None:
+            call["bytes"] += nbytes
+
+
+def add_file_bytes(filename):
+    """Reports the size of a file uploaded or downloaded by the tool method currently running.
+    Does nothing (not even reading the file size) if metrics are disabled."""
+
+    if _enabled:
+        add_bytes(os.path.getsize(filename))
+
+
+def add_rows(rows):
+    """Reports rows handled by the tool method currently running, when they can't be counted
+    from its return value. Does nothing if metrics are disabled."""
+
+    if _enabled:
+        call = _current_call()
+        if call is not None:
+            call["rows"] += rows
+
+
+def add_retry():
+    """Reports a retry made by the tool method currently running. Does nothing if metrics are disabled."""
+
+    if _enabled:
+        call = _current_call()
+        if call is not None:
+            call["retries"] += 1
+
+
+def _count_rows(result):
+    """Returns the amount of rows in a method result, if it's a list, tuple, DataFrame or Arrow table."""
+
+    if isinstance(result, (list, tuple)):
+        return len(result)
+
+    shape = getattr(result, "shape", None)
+    if isinstance(shape, tuple) and len(shape) > 0:
+        return shape[0]
+
+    return 0
+
+
+def _call_with_metrics(method, method_name, tool, args, kwargs):
+    registry = _registry
+    labels = {"tool": type(tool).__name__, "method": method_name}
+
+    stack = getattr(_call_stack, "calls", None)
+    if stack is None:
+        stack = _call_stack.calls = []
+
+    call = {"bytes": 0, "rows": 0, "retries": 0}
+    stack.append(call)
+
+    status = "error"
+    start = time.perf_counter()
+    try:
+        result = method(tool, *args, **kwargs)
+        status = "ok"
+        return result
+    finally:
+        elapsed = time.perf_counter() - start
+        stack.pop()
+
+        rows = call["rows"] + (_count_rows(result) if status == "ok" else 0)
+
+        try:
+            registry.counter("instackup_calls_total", "Tool method calls.").inc(status=status, **labels)
+            registry.histogram("instackup_call_duration_seconds", "Tool method call duration in seconds.").observe(elapsed, **labels)
+            if call["bytes"]:
+                registry.counter("instackup_bytes_total", "Bytes transferred by tool methods.").inc(call["bytes"], **labels)
+            if rows:
+                registry.counter("instackup_rows_total", "Rows read or written by tool methods.").inc(rows, **labels)
+            if call["retries"]:
+                registry.counter("instackup_retries_total", "Retries made by tool methods.").inc(call["retries"], **labels)
+        except Exception:
+            # A faulty custom registry must not break the tool call
+            logger.exception("Error recording metrics for %s.%s", labels["tool"], method_name)
+
+
+def _instrument(method, method_name):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if not _enabled:
+            return method(self, *args, **kwargs)
+        return _call_with_metrics(method, method_name, self, args, kwargs)
+
+    wrapper._instackup_instrumented = True
+    return wrapper
+
+
+def instrument_methods(cls):
+    """Class decorator that makes every public method defined in cls report its calls,
+    duration, rows, bytes and retries to the metrics registry while metrics are enabled."""
+
+    for name, attribute in list(vars(cls).items()):
+        if name.startswith("_") or not inspect.isfunction(attribute):
+            continue
+        if getattr(attribute, "_instackup_instrumented", False):
+            continue
+
+        setattr(cls, name, _instrument(attribute, name))
+
+    return cls
@@ -1,36 +1,344 @@
+import io
 import os
+import csv
+import gzip
+import json
+import time
+import uuid
+import itertools
 import logging
-import boto3
-import psycopg2
+import datetime
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from .general_tools import fetch_credentials
-from .sql_tools import PostgreSQLTool
+from .s3_tools import S3Tool
+from .sql_tools import PostgreSQLTool, _database_errors, _copy_source
+from .metrics_tools import instrument_methods, add_bytes
 
 
 # Logging Configuration
+# Handlers and level are set for the whole package by general_tools.configure_logging
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.WARNING)
 
-formatter = logging.Formatter("%(asctime)s:%(name)s:%(levelname)s: %(message)s")
 
-LOG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'logs')
-os.makedirs(LOG_DIR, exist_ok=True)
-file_handler = logging.FileHandler(os.path.join(LOG_DIR, "redshift_tools.log"))
-file_handler.setFormatter(formatter)
+class ClusterCredentialsCache(object):
+    """Process-wide cache of the temporary credentials given by RedShift GetClusterCredentials API,
+    shared by all RedShiftTool objects (and their pooled connections), keyed by cluster, user and database.
 
-logger.addHandler(file_handler)
+    Each entry is kept until its Expiration. An entry used in its last refresh_ahead seconds is refreshed
+    by a background thread while the current credentials are still returned, so callers only wait for
+    the API when an entry is missing or expired. Concurrent callers of the same missing entry share a single call.
+    """
 
+    def __init__(self, refresh_ahead=300, duration_seconds=900, client=None):
+        self.refresh_ahead = refresh_ahead
+        self.duration_seconds = duration_seconds
+        self._client = client
 
+        # Credentials and their expiration (in time.monotonic() seconds) by (cluster_id, user, dbname)
+        self._entries = {}
+        self._refreshing = set()
+        self._key_locks = collections.defaultdict(threading.Lock)
+        self._lock = threading.Lock()
+        self._calls = 0
+
+    def _get_client(self):
+        if self._client is None:
+            import boto3
+
+            with self._lock:
+                if self._client is None:
+                    self._client = boto3.client('redshift')
+                    logger.debug("Connected to RedShift by boto3")
+
+        return self._client
+
+    def _fetch(self, key):
+        """Calls GetClusterCredentials and saves the result as the entry of key."""
+
+        cluster_id, user, dbname = key
+
+        logger.debug("Getting cluster credentials...")
+        response = self._get_client().get_cluster_credentials(
+            DbUser=user,
+            DbName=dbname,
+            ClusterIdentifier=cluster_id,
+            DurationSeconds=self.duration_seconds,
+            AutoCreate=False,
+        )
+        logger.debug("Cluster credentials responded.")
+
+        # Expiration is converted to the monotonic clock, so system clock changes don't affect it
+        remaining = (response["Expiration"] - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+        with self._lock:
+            self._entries[key] = (response, time.monotonic() + remaining)
+            self._calls += 1
+
+        return response
+
+    def _refresh_in_background(self, key):
+        def refresh():
+            try:
+                self._fetch(key)
+            except Exception:
+                # The current credentials are still valid. They're requested again when used after expiring.
+                logger.exception("Error refreshing cluster credentials of %s.", key)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        threading.Thread(target=refresh, name="instackup-redshift-credentials", daemon=True).start()
+
+    def get(self, cluster_id, user, dbname):
+        """Returns the cluster credentials (the GetClusterCredentials response, with DbUser, DbPassword
+        and Expiration) of a user in a database, calling the API only if they're missing or expired."""
+
+        key = (cluster_id, user, dbname)
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            credentials, expires_at = entry
+            remaining = expires_at - time.monotonic()
+
+            # A small margin, so the credentials don't expire while the connection is being opened
+            if remaining > 10:
+                if remaining <= self.refresh_ahead:
+                    self._refresh_in_background(key)
+                return credentials
+
+        with self._lock:
+            key_lock = self._key_locks[key]
+
+        with key_lock:
+            # Another thread may have got them while this one waited
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] - time.monotonic() > 10:
+                return entry[0]
+
+            return self._fetch(key)
+
+    def invalidate(self, cluster_id=None, user=None, dbname=None):
+        """Removes the credentials of a user in a database (or all of them, if no parameter is given),
+        so they're requested again on their next use."""
+
+        with self._lock:
+            if cluster_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop((cluster_id, user, dbname), None)
+
+    def stats(self):
+        """Returns the amount of entries, the API calls made and the seconds until each entry expires, in a dictionary."""
+
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "api_calls": self._calls,
+                "expires_in": {key: expires_at - now for key, (_, expires_at) in self._entries.items()},
+            }
+
+    def _after_fork(self):
+        # Locks may have been held, and refresh threads don't exist in the child process
+        self._lock = threading.Lock()
+        self._key_locks = collections.defaultdict(threading.Lock)
+        self._refreshing = set()
+
+
+_cluster_credentials = ClusterCredentialsCache()
+
+
+def get_credentials_cache():
+    """Returns the ClusterCredentialsCache shared by all RedShiftTool objects."""
+    return _cluster_credentials
+
+
+def configure_credentials_cache(refresh_ahead=None, duration_seconds=None):
+    """Sets how many seconds before expiring the cluster credentials are refreshed, and
+    how long new credentials last (from 900 to 3600 seconds), for all RedShiftTool objects."""
+
+    if refresh_ahead is not None:
+        _cluster_credentials.refresh_ahead = refresh_ahead
+    if duration_seconds is not None:
+        _cluster_credentials.duration_seconds = duration_seconds
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=lambda: _cluster_credentials._after_fork())
+
+
+# Format options of the COPY command by file_format
+_COPY_FORMATS = {
+    "csv": "FORMAT AS CSV",
+    "json": "FORMAT AS JSON 'auto'",
+    "parquet": "FORMAT AS PARQUET",
+}
+
+
+def _split_s3_url(url):
+    """Splits a s3://bucket/key URL into bucket and key (or prefix)."""
+
+    if not url.startswith("s3://"):
+        raise ValueError(f"Invalid S3 URL '{url}'! Format should be like 's3://<bucket>/<key>'")
+
+    bucket, _, key = url[len("s3://"):].partition("/")
+    return bucket, key
+
+
+def _manifest(files):
+    """COPY manifest of the given (url, size) files. Sizes, if known, are required to load Parquet files."""
+
+    entries = []
+    for url, size in files:
+        entry = {"url": url, "mandatory": True}
+        if size is not None:
+            entry["meta"] = {"content_length": size}
+        entries.append(entry)
+
+    return json.dumps({"entries": entries}).encode()
+
+
+def _dataframe_parts(df, parts, file_format):
+    """Yields the DataFrame split in parts with (almost) the same amount of rows, each written in file_format."""
+
+    step, extra = divmod(len(df), parts)
+    start = 0
+    for index in range(parts):
+        end = start + step + (1 if index < extra else 0)
+        part = df.iloc[start:end]
+        start = end
+
+        if file_format == "parquet":
+            buffer = io.BytesIO()
+            part.to_parquet(buffer, index=False)
+            yield buffer.getvalue()
+        elif file_format == "json":
+            yield part.to_json(orient="records", lines=True, date_format="iso").encode()
+        else:
+            yield part.to_csv(index=False, header=False).encode()
+
+
+def _file_parts(filename, parts, file_format, header):
+    """Yields a local file split in parts of (about) the same size. Text files (which are decompressed
+    if their name ends with .gz) are split by lines, and Parquet files by rows."""
+
+    if file_format == "parquet":
+        import pyarrow
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(filename)
+        part_rows = max(-(-parquet_file.metadata.num_rows // parts), 1)
+
+        # Batches end at row group boundaries, so they're joined until a part is complete
+        batches, rows = [], 0
+        for batch in parquet_file.iter_batches(batch_size=part_rows):
+            batches.append(batch)
+            rows += batch.num_rows
+            if rows >= part_rows:
+                buffer = io.BytesIO()
+                pq.write_table(pyarrow.Table.from_batches(batches), buffer)
+                yield buffer.getvalue()
+                batches, rows = [], 0
+
+        if batches:
+            buffer = io.BytesIO()
+            pq.write_table(pyarrow.Table.from_batches(batches), buffer)
+            yield buffer.getvalue()
+        return
+
+    compressed = filename.endswith(".gz")
+    size = os.path.getsize(filename)
+    if compressed:
+        # The uncompressed size (modulo 4 GB) is in the last 4 bytes of a gzip file
+        with open(filename, "rb") as f:
+            f.seek(-4, os.SEEK_END)
+            size = max(int.from_bytes(f.read(4), "little"), size)
+
+    part_size = max(-(-size // parts), 1)
+    with (gzip.open(filename, "rb") if compressed else open(filename, "rb")) as f:
+        if header and file_format == "csv":
+            f.readline()
+
+        lines, buffered, written = [], 0, 0
+        for line in f:
+            lines.append(line)
+            buffered += len(line)
+
+            # The last part takes all the remaining lines
+            if buffered >= part_size and written < parts - 1:
+                yield b"".join(lines)
+                lines, buffered = [], 0
+                written += 1
+
+        if lines:
+            yield b"".join(lines)
+
+
+def _fetched_s3_files(s3, bucket, keys, read, max_workers):
+    """Yields read(key, body) of each S3 file, in order, downloading and reading up to max_workers of them at once."""
+
+    def fetch(key):
+        body = s3.get_object(Bucket=bucket, Key=key)["Body"].read()
+        return len(body), read(key, body)
+
+    keys = iter(keys)
+    futures = collections.deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        try:
+            futures.extend(executor.submit(fetch, key) for key in itertools.islice(keys, max_workers))
+            while futures:
+                size, result = futures.popleft().result()
+
+                # A new download starts as soon as a file is taken, so max_workers files are in progress
+                key = next(keys, None)
+                if key is not None:
+                    futures.append(executor.submit(fetch, key))
+
+                add_bytes(size)
+                yield result
+        finally:
+            # If the caller stops reading, the files not yet downloaded aren't
+            for future in futures:
+                future.cancel()
+
+
+def _delete_s3_prefix(s3, bucket, prefix):
+    """Deletes all files whose keys start with prefix."""
+
+    deleted = 0
+    for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix):
+        keys = [{"Key": item["Key"]} for item in page.get("Contents", [])]
+        if keys:
+            s3.delete_objects(Bucket=bucket, Delete={"Objects": keys})
+            deleted += len(keys)
+
+    logger.debug("%s files deleted from s3://%s/%s", deleted, bucket, prefix)
+
+
+@instrument_methods
 class RedShiftTool(PostgreSQLTool):
     """This class handle most of the interaction needed with RedShift,
     so the base code becomes more readable and straightforward."""
 
-    def __init__(self, connection="default", connect_by_cluster=True):
+    # RedShift exports are written from the rows fetched by the cursor, so there's no binary format
+    _export_formats = ("csv",)
+
+    # Rows fetched at a time by export and export_in_chunks
+    export_fetch_size = 10000
+
+    def __init__(self, connection="default", connect_by_cluster=True, use_pool=True):
         # Code structure based on StackOverFlow answer
         # https://stackoverflow.com/questions/44243169/connect-to-redshift-using-python-using-iam-role
 
         # Getting credentials
         connection_type = "cluster_credentials" if connect_by_cluster else "master_password"
-        logger.debug(f"connection_type = {connection_type}")
+        logger.debug("connection_type = %s", connection_type)
 
         redshift_creds = fetch_credentials(
             service_name="RedShift",
@@ -39,29 +347,22 @@ class RedShiftTool(PostgreSQLTool):
         )
         aws_creds = fetch_credentials("AWS", connection)
 
-        # Getting cluster credentials
-        if connect_by_cluster:
-            client = boto3.client('redshift')
-            logger.debug("Connected to RedShift by boto3")
-
-            logger.debug("Getting cluster credentials...")
-            cluster_creds = client.get_cluster_credentials(DbUser=redshift_creds["user"],
-                                                           DbName=redshift_creds["dbname"],
-                                                           ClusterIdentifier=redshift_creds["cluster_id"],
-                                                           AutoCreate=False)
-            logger.debug("Cluster credentials responded.")
-
+        self.sql_type = "RedShift"
+        self.connection_name = connection
         self.dbname = redshift_creds["dbname"]
         self.user = redshift_creds["user"]
         self.password = redshift_creds.get("password")
         self.cluster_id = redshift_creds.get("cluster_id")
         self.host = redshift_creds["host"]
         self.port = redshift_creds["port"]
-        self.cluster_creds = cluster_creds
         self.connect_by_cluster = connect_by_cluster
         self.access_key = aws_creds["access_key"]
         self.secret_key = aws_creds["secret_key"]
 
+        self.use_pool = use_pool
+        self._pooled = None
+        self._connection_info = None
+
         # Attibutes ready to be set in connection
         self.connection = None
         self.cursor = None
@@ -69,41 +370,135 @@ class RedShiftTool(PostgreSQLTool):
         # Not used, but making it compatible with inherited class
         self.filename = None
 
-    def connect(self, fail_silently=False):
-        """Create the connection using the __init__ attributes.
-        If fail_silently parameter is set to True, any errors will be surpressed and not stop the code execution."""
+        # ID of the last query, read from the session only when it's needed (see last_query_id)
+        self._last_query_id = None
+        self._query_id_pending = False
 
-        if self.connect_by_cluster:
-            logger.debug("Connecting by cluster...")
-            user = self.cluster_creds['DbUser']
-            password = self.cluster_creds['DbPassword']
-        else:
+    @property
+    def cluster_creds(self):
+        """Temporary credentials of the cluster user, from the process-wide ClusterCredentialsCache
+        (None if not connecting by cluster). They're only requested from the API when missing or expired."""
+
+        if not self.connect_by_cluster:
+            return None
+        return _cluster_credentials.get(self.cluster_id, self.user, self.dbname)
+
+    @property
+    def last_query_id(self):
+        """ID of the last query run by query or execute_sql methods in the cluster, to be used in get_query_report.
+        It's only read from the session (with pg_last_query_id()) when this attribute is used, so it's None
+        if the connection was closed after the query. Queries that only run in the leader node don't have one.
+        It's also None if the last call failed, or didn't run in this session (result cache hits and replica reads)."""
+
+        if self._query_id_pending and self.connection is not None:
+            # Another cursor, so the results (and rowcount) of the last query are kept
+            with self.connection.cursor() as cursor:
+                cursor.execute("SELECT pg_last_query_id()")
+                query_id = cursor.fetchone()[0]
+            self._last_query_id = query_id if query_id != -1 else None
+            self._query_id_pending = False
+
+        return self._last_query_id
+
+    def _statement_started(self):
+        # Result cache hits, reads in a replica and failed statements don't run in this session,
+        # so they leave no last query instead of the one before them
+        self._last_query_id = None
+        self._query_id_pending = False
+
+    def _log_if_slow(self, sql, params, seconds, rows):
+        # Called after every statement run by query and execute_sql methods in this session
+        self._query_id_pending = True
+        super()._log_if_slow(sql, params, seconds, rows)
+
+    def _statement_id(self):
+        return self.last_query_id
+
+    def close_connection(self):
+        # The ID of a query not read yet is lost with the session
+        if self._query_id_pending:
+            self._last_query_id = None
+            self._query_id_pending = False
+
+        super().close_connection()
+
+    def _pool_key(self):
+        """Key of the pool shared by all tools connecting to the same cluster with the same user type."""
+        return (self.sql_type, self.connection_name, self.connect_by_cluster)
+
+    def _open_connection(self):
+        """Opens a new connection to the cluster, without using the pool."""
+
+        import psycopg2
+
+        if not self.connect_by_cluster:
             logger.debug("Connecting by MasterUser and password...")
-            user = self.user
-            password = self.password
+            return self._connect_as(self.user, self.password)
 
+        logger.debug("Connecting by cluster...")
+        cluster_creds = self.cluster_creds
         try:
-            conn = psycopg2.connect(
-                host=self.host,
-                port=self.port,
-                user=user,
-                password=password,
-                database=self.dbname
-            )
-            logger.info("Connected!")
-
-            self.connection = conn
-            self.cursor = self.connection.cursor()
-            return self
-
-        except psycopg2.Error as e:
-            print('Failed to open database connection.')
-            logger.exception('Failed to open database connection.')
+            return self._connect_as(cluster_creds['DbUser'], cluster_creds['DbPassword'])
+        except psycopg2.OperationalError as e:
+            if "password authentication failed" not in str(e):
+                raise
 
-            if not fail_silently:
-                raise e
-            else:
-                logger.error("ATENTION: Failing Silently")
+            # The cached credentials were refused (e.g. revoked), so new ones are requested once
+            logger.warning("Cluster credentials refused. Requesting new ones.")
+            _cluster_credentials.invalidate(self.cluster_id, self.user, self.dbname)
+            cluster_creds = self.cluster_creds
+            return self._connect_as(cluster_creds['DbUser'], cluster_creds['DbPassword'])
+
+    def _connect_as(self, user, password):
+        import psycopg2
+
+        return psycopg2.connect(
+            host=self.host,
+            port=self.port,
+            user=user,
+            password=password,
+            database=self.dbname
+        )
+
+    def _insert_batch(self, table, columns, batch):
+        """Inserts a list of rows in table with multi-row INSERTs, since RedShift doesn't support COPY FROM STDIN.
+        For big loads, it's faster to upload the data to S3 and load it with a COPY command."""
+
+        from psycopg2.extras import execute_values
+
+        columns_sql = f" ({', '.join(columns)})" if columns else ""
+
+        # Each page is sent as one INSERT statement, kept well below RedShift's 16 MB statement limit
+        execute_values(self.cursor, f"INSERT INTO {table}{columns_sql} VALUES %s", batch, page_size=1000)
+
+    def _copy_to(self, query, output, file_format="csv", header=True):
+        # RedShift doesn't support COPY TO STDOUT, so the rows are fetched with a server-side cursor
+        # (as in stream_query) and written as CSV as they come
+        source = _copy_source(query)
+        sql_query = query if source.startswith("(") else f"SELECT * FROM {source}"
+
+        cursor = self._stream_cursor(self.export_fetch_size)
+        text = io.TextIOWrapper(output, encoding="utf-8", newline="", write_through=True)
+        try:
+            cursor.execute(sql_query)
+            logger.debug("Query Executed: %s", sql_query)
+
+            writer = csv.writer(text)
+            rows = cursor.fetchmany(self.export_fetch_size)
+            if header:
+                # Named cursors only have a description after the first fetch
+                writer.writerow([description[0] for description in cursor.description])
+
+            total = 0
+            while rows:
+                writer.writerows(rows)
+                total += len(rows)
+                rows = cursor.fetchmany(self.export_fetch_size)
+            return total
+        finally:
+            # Leaves output open, as COPY TO STDOUT does
+            text.detach()
+            self._close_stream_cursor(cursor)
 
     def unload_to_S3(self, redshift_query, s3_path, filename, unload_options="MANIFEST GZIP ALLOWOVERWRITE REGION 'us-east-2'"):
         """Executes an unload command in RedShift database to copy data to S3.
@@ -127,3 +522,559 @@ class RedShiftTool(PostgreSQLTool):
 
         logger.debug("Unloading Query...")
         self.execute_sql(unload_query)
+
+    def _load_errors(self, query_id=None):
+        """Returns the rows of stl_load_errors of a COPY (the last one in the session, if query_id isn't given)."""
+
+        query_filter = int(query_id) if query_id is not None else "pg_last_copy_id()"
+        cursor = self._execute(f"""
+            SELECT query, TRIM(filename), line_number, TRIM(colname), TRIM(type), TRIM(raw_field_value),
+                err_code, TRIM(err_reason), TRIM(raw_line)
+            FROM stl_load_errors
+            WHERE query = {query_filter}
+            ORDER BY starttime, line_number
+        """)
+
+        names = ["query", "filename", "line_number", "colname", "type", "raw_field_value", "err_code", "err_reason", "raw_line"]
+        return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def _upload_parts(self, s3, bucket, prefix, parts, extension, compress, max_workers, uploaded):
+        """Uploads each part (bytes) to S3 with max_workers threads, keeping at most 2 * max_workers
+        parts in memory. Returns the S3 URL and size of each uploaded file, in order.
+
+        The URL of each file uploaded is added to the uploaded list, even if another upload fails,
+        so the caller can delete them."""
+
+        def upload(key, body):
+            if compress:
+                body = gzip.compress(body)
+            s3.put_object(Bucket=bucket, Key=key, Body=body)
+            return len(body)
+
+        futures = []
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                pending = set()
+                for index, body in enumerate(parts):
+                    while len(pending) >= 2 * max_workers:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+                        # Raises the error of a failed upload, so no more parts are uploaded
+                        for future in done:
+                            future.result()
+
+                    key = f"{prefix}part_{index:04d}{extension}"
+                    future = executor.submit(upload, key, body)
+                    futures.append((f"s3://{bucket}/{key}", future))
+                    pending.add(future)
+        finally:
+            # Leaving the with block waits for the uploads in progress
+            uploaded.extend(url for url, future in futures if not future.cancelled() and future.exception() is None)
+
+        files = [(url, future.result()) for url, future in futures]
+        add_bytes(sum(size for _, size in files))
+        logger.debug("%s parts uploaded to s3://%s/%s", len(files), bucket, prefix)
+
+        return files
+
+    def copy_from_S3(self, table, source=None, data=None, s3_path=None, file_format="csv", compress=False, header=False,
+                     columns=None, manifest=False, generate_manifest=False, parts_per_slice=1, max_workers=8,
+                     copy_options="", cleanup=True, commit=True, fail_silently=False):
+        """Loads data from S3 into a table with a COPY command, the counterpart of unload_to_S3.
+
+        Either source or data parameter must be given:
+        source parameter is the data in S3: a prefix (all files whose keys start with it are loaded),
+        the URL of a manifest file (if manifest parameter is True) or a list of file URLs.
+        data parameter is a local file path or a DataFrame. It's split in a multiple (parts_per_slice) of
+        the number of slices in the cluster, so all of them load in parallel, and the parts are uploaded
+        to the s3_path prefix with max_workers threads. Text files are split by lines, so CSV values can't
+        have line breaks.
+
+        file_format parameter can be "csv", "json" (one object per line, with the column names as keys) or "parquet".
+        compress parameter sets if the files in S3 are compressed with gzip (uploaded parts are compressed if True).
+        header parameter sets if the CSV files (or the local file) have the column names in the first line.
+        columns parameter is the list of table columns the values are loaded into (the DataFrame columns, if not set).
+
+        For lists of files (and prefixes, if generate_manifest parameter is True), a manifest is generated,
+        so only the files listed are loaded and a missing file stops the load. It's written to s3_path,
+        or next to the (first) file if not set. Uploaded parts and generated manifests are deleted
+        after the load, unless cleanup parameter is False.
+
+        copy_options parameter is added to the other COPY options (e.g. "REGION 'us-east-2' MAXERROR 10").
+        Load options can be better understood in this link:
+        https://docs.aws.amazon.com/redshift/latest/dg/r_COPY.html
+
+        If commit parameter is True, the load is committed; otherwise, it's left to the caller.
+
+        If fail_silently parameter is set to True, any errors will be surpressed
+        and not stop the code execution.
+
+        Returns a dictionary with the amount of rows loaded, the number of files (None for prefixes),
+        the COPY query_id, the errors of the load (from stl_load_errors, as dictionaries) and the seconds taken.
+        The errors of a failed load are also logged.
+        """
+
+        file_format = file_format.lower()
+        if file_format not in _COPY_FORMATS:
+            raise ValueError(f"Unsupported format {file_format}. Formats available: {list(_COPY_FORMATS)}")
+        if (source is None) == (data is None):
+            raise ValueError("Specify either source or data.")
+        if data is not None and s3_path is None:
+            raise ValueError("s3_path is required to upload data.")
+        if manifest and (generate_manifest or not isinstance(source, str)):
+            raise ValueError("manifest parameter is only valid with the URL of a manifest file as source.")
+
+        if data is not None and not isinstance(data, (str, os.PathLike)) and columns is None:
+            columns = list(data.columns)
+
+        start = time.perf_counter()
+        s3 = S3Tool(connection=self.connection_name).s3.meta.client
+
+        # Uploaded parts and generated manifests, deleted at the end
+        created = []
+        try:
+            if data is not None:
+                bucket, prefix = _split_s3_url(s3_path)
+                if prefix and not prefix.endswith("/"):
+                    prefix += "/"
+                prefix += f"{table}_{uuid.uuid4().hex[:8]}_"
+
+                slices = self._execute("SELECT COUNT(*) FROM stv_slices").fetchone()[0]
+                parts = max(slices * parts_per_slice, 1)
+                logger.debug("Splitting data in %s parts for %s slices...", parts, slices)
+
+                if isinstance(data, (str, os.PathLike)):
+                    parts = _file_parts(os.fspath(data), parts, file_format, header)
+                else:
+                    parts = _dataframe_parts(data, max(min(parts, len(data)), 1), file_format)
+
+                compress = compress and file_format != "parquet"
+                extension = f".{file_format}" + (".gz" if compress else "")
+                files = self._upload_parts(s3, bucket, prefix, parts, extension, compress, max_workers, created)
+
+                # The header was removed when splitting
+                header = False
+
+            elif isinstance(source, str) and not generate_manifest:
+                files = None
+
+            elif isinstance(source, str):
+                bucket, key_prefix = _split_s3_url(source)
+                files = []
+                for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=key_prefix):
+                    files.extend(
+                        (f"s3://{bucket}/{item['Key']}", item["Size"])
+                        for item in page.get("Contents", []) if not item["Key"].endswith("/")
+                    )
+                prefix = key_prefix.rpartition("/")[0] + "/" if "/" in key_prefix else ""
+
+            else:
+                files = []
+                for url in source:
+                    # Only Parquet manifests need the file sizes
+                    if file_format == "parquet":
+                        bucket, key = _split_s3_url(url)
+                        files.append((url, s3.head_object(Bucket=bucket, Key=key)["ContentLength"]))
+                    else:
+                        files.append((url, None))
+
+                bucket, key = _split_s3_url(files[0][0])
+                prefix = key.rpartition("/")[0] + "/" if "/" in key else ""
+
+            if files is None:
+                source_url = source
+            else:
+                if s3_path is not None:
+                    bucket, prefix = _split_s3_url(s3_path)
+                    if prefix and not prefix.endswith("/"):
+                        prefix += "/"
+
+                source_url = f"s3://{bucket}/{prefix}{table}_{uuid.uuid4().hex[:8]}.manifest"
+                s3.put_object(Bucket=bucket, Key=_split_s3_url(source_url)[1], Body=_manifest(files))
+                created.append(source_url)
+                manifest = True
+
+            options = [_COPY_FORMATS[file_format]]
+            if compress and file_format != "parquet":
+                options.append("GZIP")
+            if header and file_format == "csv":
+                options.append("IGNOREHEADER 1")
+            if manifest:
+                options.append("MANIFEST")
+            options.append(copy_options)
+
+            columns_sql = f" ({', '.join(columns)})" if columns else ""
+            copy_query = f"""
+                COPY {table}{columns_sql}
+                FROM '{source_url}'
+                WITH CREDENTIALS
+                'aws_access_key_id={self.access_key};aws_secret_access_key={self.secret_key}'
+                {' '.join(options)};
+            """
+
+            report = {"rows": 0, "files": None if files is None else len(files), "query_id": None, "errors": []}
+
+            logger.debug("Copying from S3...")
+            try:
+                self.execute_sql(copy_query)
+                report["rows"], report["query_id"] = self._execute("SELECT pg_last_copy_count(), pg_last_copy_id()").fetchone()
+
+                # Rows rejected by a MAXERROR option don't stop the load
+                report["errors"] = self._load_errors(report["query_id"])
+                if commit:
+                    self.commit()
+
+            except _database_errors(self.sql_type) as e:
+                self.rollback()
+                try:
+                    report["errors"] = self._load_errors()
+                except _database_errors(self.sql_type):
+                    logger.exception("Error reading stl_load_errors!")
+
+                for error in report["errors"]:
+                    logger.error(
+                        "Load error in %s, line %s, column %s: %s (%s)",
+                        error["filename"], error["line_number"], error["colname"], error["err_reason"], error["raw_field_value"],
+                    )
+
+                if not fail_silently:
+                    raise e
+                else:
+                    logger.error("ATENTION: Failing Silently")
+
+            report["seconds"] = time.perf_counter() - start
+            return report
+
+        finally:
+            if cleanup and created:
+                for bucket, keys in itertools.groupby(sorted(map(_split_s3_url, created)), key=lambda item: item[0]):
+                    keys = [{"Key": key} for _, key in keys]
+                    for index in range(0, len(keys), 1000):
+                        s3.delete_objects(Bucket=bucket, Delete={"Objects": keys[index:index + 1000]})
+                logger.debug("%s files deleted from S3.", len(created))
+
+    def unload_and_fetch(self, redshift_query, s3_path, file_format="parquet", fetch_as="pandas", destination=None,
+                         yield_results=False, max_workers=8, unload_options="", cleanup=True):
+        """Runs redshift_query with an UNLOAD command and reads its results from S3. For big results, it's
+        faster than fetching them through the connection, since all slices write their parts in parallel.
+
+        The parts are unloaded to a new prefix inside s3_path, then listed in the manifest,
+        and downloaded and decoded by max_workers threads.
+        file_format parameter can be "parquet" (typed columns, recommended) or "csv" (with a header, gzip compressed;
+        all columns are read as text, since the files don't have their types).
+        unload_options parameter is added to the other UNLOAD options (e.g. "REGION 'us-east-2' MAXFILESIZE 100 MB").
+        Parts are read in the manifest order; to keep the order of an ORDER BY, add "PARALLEL OFF".
+
+        fetch_as parameter sets the result format: "pandas", "arrow" (a pyarrow Table)
+        or "pandas_arrow" (a DataFrame with pandas.ArrowDtype columns).
+        If destination parameter (a local directory) is given, the parts are written there instead,
+        without decoding them, and their paths are returned.
+        If yield_results parameter is True, it returns a generator with the result (or path) of each part,
+        so the whole result doesn't need to fit in memory. Otherwise, all parts are joined in a single result.
+
+        If cleanup parameter is True, the unloaded files are deleted after being read
+        (for generators, after the last part is read).
+        """
+
+        file_format = file_format.lower()
+        if file_format == "parquet":
+            format_options = "FORMAT AS PARQUET"
+        elif file_format == "csv":
+            format_options = "FORMAT AS CSV HEADER GZIP"
+        else:
+            raise ValueError(f"Unsupported format {file_format}. Formats available: ['parquet', 'csv']")
+
+        if fetch_as not in ("pandas", "arrow", "pandas_arrow"):
+            raise ValueError(f"Unsupported fetch_as {fetch_as}. Formats available: ['pandas', 'arrow', 'pandas_arrow']")
+
+        import pyarrow as pa
+        import pandas as pd
+
+        def to_result(table):
+            if fetch_as == "pandas":
+                return table.to_pandas()
+            if fetch_as == "pandas_arrow":
+                return table.to_pandas(types_mapper=pd.ArrowDtype)
+            return table
+
+        def read(key, body):
+            if destination is not None:
+                path = os.path.join(destination, os.path.basename(key))
+                with open(path, "wb") as f:
+                    f.write(body)
+                return path
+
+            if file_format == "parquet":
+                import pyarrow.parquet as pq
+                table = pq.read_table(pa.BufferReader(body))
+            else:
+                import pyarrow.csv
+
+                # Types inferred from each part could differ (e.g. a part with only integers in a decimal
+                # column), so all columns are read as text, with empty fields as nulls (as UNLOAD writes them)
+                data = gzip.decompress(body)
+                names = next(csv.reader([data.split(b"\n", 1)[0].decode()]))
+                convert_options = pyarrow.csv.ConvertOptions(
+                    column_types={name: pa.string() for name in names},
+                    strings_can_be_null=True,
+                    quoted_strings_can_be_null=False,
+                )
+                table = pyarrow.csv.read_csv(pa.BufferReader(data), convert_options=convert_options)
+
+            # Converted in the download threads if each part is returned, or all at once if they're joined
+            return to_result(table) if yield_results else table
+
+        bucket, prefix = _split_s3_url(s3_path)
+        if prefix and not prefix.endswith("/"):
+            prefix += "/"
+        prefix += f"unload_{uuid.uuid4().hex}/"
+
+        s3 = S3Tool(connection=self.connection_name).s3.meta.client
+        if destination is not None:
+            os.makedirs(destination, exist_ok=True)
+
+        # Deleting the unloaded files is left to the generator, once it's returned
+        returned_generator = False
+        try:
+            self.unload_to_S3(redshift_query, f"s3://{bucket}/{prefix}", "part", f"{format_options} MANIFEST {unload_options}")
+
+            manifest = json.loads(s3.get_object(Bucket=bucket, Key=f"{prefix}part_manifest")["Body"].read())
+            keys = [_split_s3_url(entry["url"])[1] for entry in manifest["entries"]]
+            logger.debug("%s parts unloaded to s3://%s/%s", len(keys), bucket, prefix)
+
+            parts = _fetched_s3_files(s3, bucket, keys, read, max_workers)
+
+            if yield_results:
+                def fetch_parts_as_generator():
+                    try:
+                        yield from parts
+                    finally:
+                        if cleanup:
+                            _delete_s3_prefix(s3, bucket, prefix)
+
+                returned_generator = True
+                return fetch_parts_as_generator()
+
+            results = list(parts)
+            if destination is not None:
+                return results
+
+            if not results:
+                return to_result(pa.table({}))
+
+            return to_result(pa.concat_tables(results, promote_options="default"))
+
+        finally:
+            if cleanup and not returned_generator:
+                _delete_s3_prefix(s3, bucket, prefix)
+
+    def upsert_dataframe(self, df, table, keys, s3_path, method="merge", file_format="parquet", parts_per_slice=1,
+                         max_workers=8, copy_options="", commit=True, fail_silently=False):
+        """Inserts the rows of a DataFrame in a table, replacing the rows with the same keys, in a single transaction.
+
+        The DataFrame is loaded by copy_from_S3 method (split in parts, compressed and uploaded to the s3_path prefix)
+        into a temporary table like table, and then applied to it, so millions of rows can be upserted at once.
+        keys parameter is the column (or list of columns) that identifies a row. If the DataFrame has rows with
+        the same keys, only the last one is used. Columns of table missing in the DataFrame are kept in
+        updated rows and get their default value in inserted ones (so columns declared NOT NULL, without
+        a default value, can't be missing).
+
+        method parameter can be "merge" (a MERGE command) or "delete_insert" (the rows with the same keys are deleted,
+        then all rows are inserted, which works in clusters without MERGE). If all columns are keys, rows are only inserted.
+        file_format, parts_per_slice, max_workers and copy_options parameters are passed to copy_from_S3 method.
+        Parquet keeps the nulls of text columns; in CSV files they're empty fields, loaded as empty strings
+        unless copy_options has EMPTYASNULL.
+
+        If commit parameter is True, the transaction is committed; otherwise, it's left to the caller.
+
+        If fail_silently parameter is set to True, any errors will be surpressed
+        and not stop the code execution.
+
+        Returns a dictionary with the amount of rows loaded in the temporary table, the rows affected
+        in table (updated and inserted, or deleted and inserted) and the seconds taken.
+        """
+
+        if method not in ("merge", "delete_insert"):
+            raise ValueError(f"Unsupported method {method}. Methods available: ['merge', 'delete_insert']")
+
+        if isinstance(keys, str):
+            keys = [keys]
+        missing = [key for key in keys if key not in df.columns]
+        if not keys or missing:
+            raise ValueError(f"Key columns {missing or keys} not found in DataFrame.")
+
+        columns = list(df.columns)
+        values = [column for column in columns if column not in keys]
+
+        start = time.perf_counter()
+
+        # MERGE fails if a row of table matches more than one row of the staging table
+        df = df.drop_duplicates(subset=keys, keep="last")
+
+        staging = f"instackup_staging_{uuid.uuid4().hex[:8]}"
+        join_condition = " AND ".join(f"{table}.{key} = {staging}.{key}" for key in keys)
+        report = {"rows": 0, "affected": 0}
+
+        try:
+            self.execute_sql(f"CREATE TEMP TABLE {staging} (LIKE {table})")
+            report["rows"] = self.copy_from_S3(
+                staging, data=df, s3_path=s3_path, file_format=file_format, compress=True, columns=columns,
+                parts_per_slice=parts_per_slice, max_workers=max_workers, copy_options=copy_options, commit=False,
+            )["rows"]
+
+            if method == "merge" and values:
+                self.execute_sql(f"""
+                    MERGE INTO {table}
+                    USING {staging}
+                    ON {join_condition}
+                    WHEN MATCHED THEN UPDATE SET {', '.join(f"{column} = {staging}.{column}" for column in values)}
+                    WHEN NOT MATCHED THEN INSERT ({', '.join(columns)}) VALUES ({', '.join(f"{staging}.{column}" for column in columns)})
+                """)
+                report["affected"] = self.cursor.rowcount
+
+            else:
+                if values:
+                    self.execute_sql(f"DELETE FROM {table} USING {staging} WHERE {join_condition}")
+                    report["affected"] = self.cursor.rowcount
+                else:
+                    # Rows with all columns in the keys are only inserted if they aren't in table yet
+                    self.execute_sql(f"DELETE FROM {staging} USING {table} WHERE {join_condition}")
+
+                self.execute_sql(f"INSERT INTO {table} ({', '.join(columns)}) SELECT {', '.join(columns)} FROM {staging}")
+                report["affected"] += self.cursor.rowcount
+
+            self.execute_sql(f"DROP TABLE {staging}")
+            logger.debug("%s rows upserted in %s.", report["rows"], table)
+
+            if commit:
+                self.commit()
+
+        except Exception as e:
+            # Any error (including S3 errors uploading the staging data) rolls back the whole transaction,
+            # which also removes the staging table
+            self.rollback()
+
+            if fail_silently and isinstance(e, _database_errors(self.sql_type)):
+                logger.error("ATENTION: Failing Silently")
+            else:
+                raise e
+
+        report["seconds"] = time.perf_counter() - start
+        return report
+
+    def _system_rows(self, query):
+        """Runs a query in the system tables and returns its rows as dictionaries, bypassing the result cache
+        (system tables get new rows as queries complete)."""
+
+        cursor = self._execute(query)
+        names = [column[0] for column in cursor.description]
+        return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def get_query_report(self, query_id=None, skew_threshold=2, fail_silently=False):
+        """Returns the execution details of a query, read from the STL_QUERY, STL_WLM_QUERY, SVL_QUERY_SUMMARY
+        and SVL_QUERY_REPORT system tables, to find out why it's slow (e.g. to choose distribution and sort keys).
+
+        query_id parameter is the query ID (the last query run by this tool, if not given, see last_query_id attribute).
+        skew_threshold parameter sets how many times the rows of the slowest slice in a step have to be greater
+        than the average rows per slice for the step to be reported as skewed.
+
+        If fail_silently parameter is set to True, any errors will be surpressed
+        and not stop the code execution.
+
+        Returns a dictionary with:
+        query_id, sql, starttime, endtime and aborted (from STL_QUERY);
+        queue_seconds, execution_seconds, service_class and slot_count (from STL_WLM_QUERY);
+        steps, a list with each step of the plan (from SVL_QUERY_SUMMARY);
+        disk_based_steps, the steps that ran out of memory and wrote to disk;
+        skewed_steps, the steps where some slice had more rows than the others (from SVL_QUERY_REPORT), most skewed first;
+        and rows_per_slice, a dictionary with the rows read by the scan steps of each slice, showing the data distribution.
+        """
+
+        if query_id is None:
+            query_id = self.last_query_id
+            if query_id is None:
+                raise ValueError("No query ID given, and no query run by this tool in the current connection.")
+
+        query_id = int(query_id)
+
+        try:
+            query_rows = self._system_rows(f"""
+                SELECT query, TRIM(querytxt) AS sql, starttime, endtime, aborted
+                FROM stl_query
+                WHERE query = {query_id}
+            """)
+            wlm_rows = self._system_rows(f"""
+                SELECT service_class, slot_count, total_queue_time, total_exec_time
+                FROM stl_wlm_query
+                WHERE query = {query_id}
+                ORDER BY queue_start_time
+            """)
+            steps = self._system_rows(f"""
+                SELECT stm, seg, step, TRIM(label) AS label, maxtime, avgtime, rows, bytes, rate_row,
+                    is_diskbased = 't' AS is_diskbased, workmem
+                FROM svl_query_summary
+                WHERE query = {query_id}
+                ORDER BY stm, seg, step
+            """)
+            slice_rows = self._system_rows(f"""
+                SELECT slice, segment, step, TRIM(label) AS label, rows, bytes, elapsed_time
+                FROM svl_query_report
+                WHERE query = {query_id}
+            """)
+
+        except _database_errors(self.sql_type) as e:
+            logger.exception("Error reading query report!")
+
+            if not fail_silently:
+                raise e
+            else:
+                logger.error("ATENTION: Failing Silently")
+                return None
+
+        report = {"query_id": query_id, "sql": None, "starttime": None, "endtime": None, "aborted": None}
+        if query_rows:
+            report.update({key: query_rows[0][key] for key in ["sql", "starttime", "endtime"]})
+            report["aborted"] = bool(query_rows[0]["aborted"])
+        else:
+            logger.warning("Query %s not found in stl_query.", query_id)
+
+        # A query may be queued and run more than once, if it hops between WLM queues. Times are in microseconds.
+        report["queue_seconds"] = sum(row["total_queue_time"] for row in wlm_rows) / 1e6 if wlm_rows else None
+        report["execution_seconds"] = sum(row["total_exec_time"] for row in wlm_rows) / 1e6 if wlm_rows else None
+        report["service_class"] = wlm_rows[-1]["service_class"] if wlm_rows else None
+        report["slot_count"] = wlm_rows[-1]["slot_count"] if wlm_rows else None
+
+        report["steps"] = steps
+        report["disk_based_steps"] = [step for step in steps if step["is_diskbased"]]
+
+        slices_by_step = collections.defaultdict(list)
+        rows_per_slice = collections.Counter()
+        for row in slice_rows:
+            slices_by_step[(row["segment"], row["step"], row["label"])].append(row)
+            if row["label"].startswith("scan"):
+                rows_per_slice[row["slice"]] += row["rows"]
+
+        skewed_steps = []
+        for (segment, step, label), rows in slices_by_step.items():
+            average_rows = sum(row["rows"] for row in rows) / len(rows)
+            slowest = max(rows, key=lambda row: row["elapsed_time"])
+            max_rows = max(row["rows"] for row in rows)
+
+            if average_rows > 0 and max_rows / average_rows >= skew_threshold:
+                skewed_steps.append({
+                    "segment": segment,
+                    "step": step,
+                    "label": label,
+                    "slices": len(rows),
+                    "max_rows": max_rows,
+                    "average_rows": average_rows,
+                    "skew": max_rows / average_rows,
+                    "slowest_slice": slowest["slice"],
+                    "max_seconds": slowest["elapsed_time"] / 1e6,
+                    "average_seconds": sum(row["elapsed_time"] for row in rows) / len(rows) / 1e6,
+                })
+
+        report["skewed_steps"] = sorted(skewed_steps, key=lambda step: step["skew"], reverse=True)
+        report["rows_per_slice"] = dict(sorted(rows_per_slice.items()))
+
+        return report
@@ -1,24 +1,15 @@
 import os
 import logging
-import boto3
-from botocore.exceptions import ClientError
 from .general_tools import fetch_credentials, parse_remote_uri
+from .metrics_tools import instrument_methods, add_file_bytes
 
 
 # Logging Configuration
+# Handlers and level are set for the whole package by general_tools.configure_logging
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.WARNING)
-
-formatter = logging.Formatter("%(asctime)s:%(name)s:%(levelname)s: %(message)s")
-
-LOG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'logs')
-os.makedirs(LOG_DIR, exist_ok=True)
-file_handler = logging.FileHandler(os.path.join(LOG_DIR, "s3_tools.log"))
-file_handler.setFormatter(formatter)
-
-logger.addHandler(file_handler)
 
 
+@instrument_methods
 class S3Tool(object):
     """This class handle most of the interaction needed with S3,
     so the base code becomes more readable and straightforward.
@@ -45,6 +36,9 @@ class S3Tool(object):
     easier to write and the code easier to read."""
 
     def __init__(self, uri=None, bucket=None, subfolder="", connection="default"):
+        import boto3
+        from botocore.exceptions import ClientError
+
         if all(param is not None for param in [bucket, uri]):
             logger.error("Specify either bucket name or an URI.")
             raise ValueError("Specify either bucket name or an URI.")
@@ -147,11 +141,11 @@ class S3Tool(object):
 
         for old_key in contents:
             new_key = old_key.replace(self.subfolder, new_subfolder, 1)
-            logger.debug(f"old_key: {old_key}")
-            logger.debug(f"new_key: {new_key}")
+            logger.debug("old_key: %s", old_key)
+            logger.debug("new_key: %s", new_key)
 
             source_file = f"{self.bucket_name}/{old_key}"
-            logger.debug(f"source_file: {source_file}")
+            logger.debug("source_file: %s", source_file)
 
             self.s3.Object(self.bucket_name, new_key).copy_from(CopySource=source_file)
             self.s3.Object(self.bucket_name, old_key).delete()
@@ -184,7 +178,7 @@ class S3Tool(object):
                         yield file.key
 
                 else:
-                    logger.debug(f"subfolder '{self.subfolder}' found, yielding all matching files in bucket")
+                    logger.debug("subfolder '%s' found, yielding all matching files in bucket", self.subfolder)
 
                     for file in self.bucket.objects.filter(Prefix=self.subfolder, Delimiter="/"):
                         if file.key != self.subfolder:
@@ -204,7 +198,7 @@ class S3Tool(object):
                     contents.append(file.key)
 
             else:
-                logger.debug(f"subfolder '{self.subfolder}' found, listing all matching files in bucket")
+                logger.debug("subfolder '%s' found, listing all matching files in bucket", self.subfolder)
 
                 for file in self.bucket.objects.filter(Prefix=self.subfolder, Delimiter="/"):
                     contents.append(file.key)
@@ -240,11 +234,12 @@ class S3Tool(object):
                 # Since this is a file, the "/" must be removed.
                 remote_path = subfolder[:-1]
 
-        logger.debug(f"remote_path: {remote_path}")
+        logger.debug("remote_path: %s", remote_path)
 
         # self.s3.meta.client.upload_file(filename, bucket, remote_path)
 
         self.bucket.upload_file(filename, remote_path)
+        add_file_bytes(filename)
 
     def upload_subfolder(self, folder_path):
         """Uploads a local folder to with prefix as currently set enviroment (bucket and subfolder).
@@ -259,17 +254,18 @@ class S3Tool(object):
             # Getting only folder name
             folder_path = folder_path.replace("\\", "/")
             folder_path = folder_path + "/" if folder_path[-1] != "/" else folder_path
-            upload_folder = folder_path.split[-2]
+            upload_folder = folder_path.split("/")[-2]
 
             print('Uploading local folder {} to s3://{}/{}\n'.format(folder_path, self.bucket_name, self.subfolder + upload_folder))
 
-            for root, dirs, files in os.walk():
+            for root, dirs, files in os.walk(new_root):
                 for file in files:
-                    local_filename = root + file
-                    remote_path = self.subfolder + upload_folder + root.replace(new_root, "").replace("\\", "/") + file
+                    local_filename = os.path.join(root, file)
+                    remote_path = self.subfolder + upload_folder + root.replace(new_root, "").replace("\\", "/") + "/" + file
 
                     print('Uploading file {} to s3://{}/{}'.format(local_filename, self.bucket_name, remote_path))
                     self.bucket.upload_file(local_filename, remote_path)
+                    add_file_bytes(local_filename)
         except Exception as e:
             raise e
         else:
@@ -303,11 +299,11 @@ class S3Tool(object):
             # Since this is a file, the "/" must be removed.
             remote_path = subfolder[:-1]
 
-        logger.debug(f"remote_path: {remote_path}")
+        logger.debug("remote_path: %s", remote_path)
 
         path, filename = os.path.split(filename)
-        logger.debug(f"Path: {path}")
-        logger.debug(f"Filename: {filename}")
+        logger.debug("Path: %s", path)
+        logger.debug("Filename: %s", filename)
 
         # If this filename exists in this directory (yes, the one where this code lays), aborts the download
         if filename in next(os.walk(os.getcwd()))[2]:
@@ -320,6 +316,7 @@ class S3Tool(object):
         # Move the downloaded file to specified directory
         os.makedirs(path, exist_ok=True)
         os.replace(filename, os.path.join(path, filename))
+        add_file_bytes(os.path.join(path, filename))
 
     def download_subfolder(self, download_to=None):
         """Downloads remote S3 files in currently set enviroment (bucket and subfolder)
@@ -354,12 +351,13 @@ class S3Tool(object):
 
             print(f"Downloading remote file s3://{self.bucket_name}/{remote_filename} to {local_filename}")
             self.bucket.download_file(remote_filename, local_filename)
+            add_file_bytes(local_filename)
 
     def delete_file(self, filename, fail_silently=False):
         """Deletes file. Raises an error if file doesn't exist and fail_silently parameter is set to False."""
 
         key = self.subfolder + filename
-        logger.debug(f"key: {key}")
+        logger.debug("key: %s", key)
 
         if key in self.list_contents():
             self.s3.Object(self.bucket, key).delete()
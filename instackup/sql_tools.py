@@ -1,160 +1,2817 @@
+import io
 import os
+import copy
+import re
+import gzip
+import json
+import time
+import decimal
+import datetime
+import sys
+import uuid
+import queue
+import hashlib
+import itertools
+import collections
+import atexit
 import logging
 import sqlite3
-import psycopg2
-import mysql.connector
-import pandas as pd
+import threading
+import weakref
+import contextlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from .general_tools import fetch_credentials
+from .metrics_tools import instrument_methods, add_rows, add_retry
 
 
 # Logging Configuration
+# Handlers and level are set for the whole package by general_tools.configure_logging
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.WARNING)
 
-formatter = logging.Formatter("%(asctime)s:%(name)s:%(levelname)s: %(message)s")
 
-LOG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'logs')
-os.makedirs(LOG_DIR, exist_ok=True)
-file_handler = logging.FileHandler(os.path.join(LOG_DIR, "sql_tools.log"))
-file_handler.setFormatter(formatter)
+def _database_errors(sql_type):
+    """Returns a tuple with the base exception classes of the driver used by sql_type.
 
-logger.addHandler(file_handler)
+    Database drivers are imported here instead of at the top of the module, so only
+    the driver actually used is loaded (and paid for at import time).
+    """
 
+    if sql_type == "SQLite":
+        return (sqlite3.Error,)
 
+    elif sql_type == "MySQL":
+        import mysql.connector
+        return (mysql.connector.Error,)
+
+    else:  # PostgreSQL and RedShift
+        import psycopg2
+        return (psycopg2.Error,)
+
+
+def _connection_errors(sql_type):
+    """Returns a tuple with the exception classes of the driver used by sql_type that mean
+    the connection to the database failed (as opposed to an error in the statement)."""
+
+    if sql_type == "SQLite":
+        return ()
+
+    elif sql_type == "MySQL":
+        import mysql.connector
+        return (mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError)
+
+    else:  # PostgreSQL and RedShift
+        import psycopg2
+        return (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+
+def _is_connection_failure(sql_type, error):
+    """Tells if error means the connection failed, and not a bad statement or one canceled by a timeout or cancel()."""
+
+    connection_errors = _connection_errors(sql_type)
+
+    # pandas wraps the driver errors in its own
+    if not isinstance(error, connection_errors):
+        error = error.__cause__
+        if not isinstance(error, connection_errors):
+            return False
+
+    if sql_type == "MySQL":
+        # ER_QUERY_INTERRUPTED and ER_QUERY_TIMEOUT
+        return getattr(error, "errno", None) not in (1317, 3024)
+
+    import psycopg2.extensions
+    return not isinstance(error, psycopg2.extensions.QueryCanceledError)
+
+
+def _copy_text(value):
+    """Formats a value as a field of PostgreSQL COPY text format."""
+
+    if value is None:
+        return "\\N"
+    if isinstance(value, str):
+        return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        # bytea hex format, with its backslash escaped
+        return "\\\\x" + bytes(value).hex()
+    if isinstance(value, (dict, list)):
+        return _copy_text(json.dumps(value))
+    return str(value)
+
+
+def _copy_source(query):
+    """Returns the source of a COPY TO command: a table name as it is, or a query between parentheses."""
+
+    query = query.strip().rstrip(";")
+    if re.fullmatch(r'[\w."$]+', query):
+        return query
+    return f"({query})"
+
+
+def _insert_rows(data, columns):
+    """Returns the columns and an iterator of rows (tuples or lists) of the data given to bulk_insert."""
+
+    if hasattr(data, "itertuples"):  # DataFrame
+        if columns is None:
+            columns = [str(column) for column in data.columns]
+
+        # Missing values (NaN, NaT and None) are inserted as NULL
+        data = data.astype(object).where(data.notna(), None)
+        return columns, data.itertuples(index=False, name=None)
+
+    return columns, iter(data)
+
+
+# Formats a query result can be fetched as (see SQLTool.query)
+_FETCH_FORMATS = ("pandas", "tuples", "arrow", "pandas_arrow")
+
+
+def _fetch_format(fetch_as, fetch_through_pandas):
+    """Returns the result format set by fetch_as, or by fetch_through_pandas if fetch_as is None."""
+
+    if fetch_as is None:
+        return "pandas" if fetch_through_pandas else "tuples"
+    if fetch_as not in _FETCH_FORMATS:
+        raise ValueError(f"Unsupported fetch_as {fetch_as}. Formats available: {list(_FETCH_FORMATS)}")
+    return fetch_as
+
+
+# Arrow type of the columns of each database, by the type code in the cursor description, as the name
+# of the pyarrow function that creates it and its arguments. Other columns get their type from their values.
+_ARROW_TYPE_CODES = {
+    "PostgreSQL": {  # Type OIDs
+        16: ("bool_",),
+        20: ("int64",),
+        21: ("int16",),
+        23: ("int32",),
+        700: ("float32",),
+        701: ("float64",),
+        25: ("string",),
+        1042: ("string",),
+        1043: ("string",),
+        2950: ("string",),
+        1082: ("date32",),
+        1114: ("timestamp", "us"),
+        1184: ("timestamp", "us", "UTC"),
+    },
+    "MySQL": {  # mysql.connector FieldType
+        1: ("int64",),
+        2: ("int64",),
+        3: ("int64",),
+        9: ("int64",),
+        13: ("int64",),
+        4: ("float64",),
+        5: ("float64",),
+        10: ("date32",),
+        7: ("timestamp", "us"),
+        12: ("timestamp", "us"),
+    },
+}
+_ARROW_TYPE_CODES["RedShift"] = _ARROW_TYPE_CODES["PostgreSQL"]
+
+# Rows fetched from the cursor at a time when building an Arrow table
+_ARROW_FETCH_SIZE = 100000
+
+
+def _arrow_types(sql_type, description):
+    """Returns the Arrow type of each column of a cursor description, or None for the columns
+    whose type has to be inferred from their values."""
+
+    import pyarrow as pa
+
+    type_codes = _ARROW_TYPE_CODES.get(sql_type, {})
+    types = []
+    for column in description:
+        type_code, precision, scale = column[1], column[4], column[5]
+
+        # PostgreSQL numeric columns declared with a precision
+        if sql_type in ("PostgreSQL", "RedShift") and type_code == 1700 and precision and precision <= 38:
+            types.append(pa.decimal128(precision, scale or 0))
+        elif type_code in type_codes:
+            function_name, *args = type_codes[type_code]
+            types.append(getattr(pa, function_name)(*args))
+        else:
+            types.append(None)
+
+    return types
+
+
+def _arrow_batch(rows, names, types):
+    """Builds a pyarrow RecordBatch from a list of rows, converting each column to its type in types.
+
+    Columns whose type is None get it inferred from their values, and it's saved in types (unless all values
+    are null), so the next batches of the same query get the same types.
+    """
+
+    import pyarrow as pa
+
+    columns = zip(*rows) if rows else [()] * len(names)
+    arrays = []
+    for index, values in enumerate(columns):
+        if types[index] is not None:
+            arrays.append(pa.array(values, type=types[index]))
+            continue
+
+        array = pa.array(values)
+        if pa.types.is_decimal(array.type):
+            # The precision inferred only fits the values seen so far
+            array = array.cast(pa.decimal128(38, array.type.scale))
+        if not pa.types.is_null(array.type):
+            types[index] = array.type
+        arrays.append(array)
+
+    return pa.RecordBatch.from_arrays(arrays, names=names)
+
+
+def _arrow_table(batches):
+    """Joins RecordBatches into a pyarrow Table. Columns that were only null in
+    the first batches get the type they have in the later ones."""
+
+    import pyarrow as pa
+
+    return pa.concat_tables([pa.Table.from_batches([batch]) for batch in batches], promote_options="default")
+
+
+# Placeholders of the pyformat paramstyle used by psycopg2: %s, %(name)s and the escaped %%
+_PYFORMAT_PLACEHOLDERS = re.compile(r"%\((\w+)\)s|%s|%%")
+
+
+# Markers kept in the StatementCache of PostgreSQL and RedShift connections instead of a prepared statement,
+# for statements that only ran once so far and for the ones PREPARE failed for (see SQLTool._prepare)
+_SEEN_STATEMENT = object()
+_UNPREPARABLE_STATEMENT = object()
+
+
+def _numbered_placeholders(sql):
+    """Converts a statement with psycopg2 placeholders to one with PostgreSQL's $1, $2... placeholders,
+    used by PREPARE. Returns it and the keys (positions or names) of the parameters of each number."""
+
+    keys = []
+    position = itertools.count()
+
+    def replace(match):
+        if match.group(0) == "%%":
+            return "%"
+
+        key = match.group(1) if match.group(1) is not None else next(position)
+        if isinstance(key, int) or key not in keys:
+            keys.append(key)
+            return f"${len(keys)}"
+        return f"${keys.index(key) + 1}"
+
+    return _PYFORMAT_PLACEHOLDERS.sub(replace, sql), keys
+
+
+class StatementCache(object):
+    """LRU cache of the prepared statements of a connection, by SQL statement, with hit and miss counters.
+
+    When the cache is full, the least recently used statement is removed and passed to on_evict
+    (if given) as on_evict(sql, statement), so it can be released in the database.
+    """
+
+    def __init__(self, max_size=128, on_evict=None):
+        self.max_size = max_size
+        self.on_evict = on_evict
+        self.hits = 0
+        self.misses = 0
+        self._statements = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._statements)
+
+    def __contains__(self, sql):
+        return sql in self._statements
+
+    def get(self, sql):
+        """Returns the statement prepared for sql, or None if it's not in the cache."""
+
+        statement = self._statements.get(sql)
+        if statement is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._statements.move_to_end(sql)
+        return statement
+
+    def put(self, sql, statement):
+        """Adds a prepared statement to the cache, evicting the least recently used one if it's full."""
+
+        self._statements[sql] = statement
+        self._statements.move_to_end(sql)
+
+        while len(self._statements) > self.max_size:
+            evicted_sql, evicted_statement = self._statements.popitem(last=False)
+            logger.debug("Prepared statement evicted: %s", evicted_sql)
+            if self.on_evict is not None:
+                self.on_evict(evicted_sql, evicted_statement)
+
+    def clear(self):
+        """Removes all statements, passing each one to on_evict."""
+
+        while self._statements:
+            sql, statement = self._statements.popitem(last=False)
+            if self.on_evict is not None:
+                self.on_evict(sql, statement)
+
+    def stats(self):
+        """Returns the cache size, hits, misses and hit ratio in a dictionary."""
+
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._statements),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else None,
+        }
+
+
+class _PooledConnection(object):
+    """A connection kept by a ConnectionPool, along with what the pool needs to manage it."""
+
+    def __init__(self, connection, pool):
+        self.connection = connection
+        self.pool = pool
+        self.pid = os.getpid()
+        self.last_used = time.monotonic()
+
+        # Data that lives as long as the connection, kept by the tools that borrow it
+        self.info = {}
+
+
+# Every pool created, so they can be reset in a forked child process
+_all_pools = weakref.WeakSet()
+
+
+class ConnectionPool(object):
+    """Thread-safe pool of open connections to a database.
+
+    connect_function is called without arguments to open a new connection; it can also be given
+    on each acquire call. At most max_size connections are open at the same time (in use or idle),
+    and idle ones are closed after idle_timeout seconds, keeping at least min_size of them open.
+
+    If health_check is True, idle connections are tested with a "SELECT 1" before being handed out,
+    and replaced if the test fails. If all connections are in use, acquire waits up to
+    checkout_timeout seconds for one to be released before raising a TimeoutError.
+
+    Connections are never shared between processes: after a fork, the child process
+    starts with an empty pool and leaves the connections inherited from the parent untouched.
+    """
+
+    def __init__(self, connect_function=None, min_size=1, max_size=10, idle_timeout=300, checkout_timeout=30, health_check=True):
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError(f"Invalid pool size: min_size={min_size}, max_size={max_size}.")
+
+        self.connect_function = connect_function
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self.health_check = health_check
+
+        # Idle connections, oldest first. The most recently used one is handed out first.
+        self._idle = []
+        # Amount of connections open by this process, either idle or in use
+        self._size = 0
+        self._closed = False
+        self._condition = threading.Condition()
+
+        self._pid = os.getpid()
+        self._inherited = []
+        _all_pools.add(self)
+
+    @property
+    def size(self):
+        """Amount of connections currently open, either idle or in use."""
+        return self._size
+
+    @property
+    def idle(self):
+        """Amount of connections currently idle in the pool."""
+        return len(self._idle)
+
+    def _after_fork(self):
+        """Resets the pool in a child process.
+
+        The inherited connections share their sockets with the parent process, so closing them
+        here would break the parent's connections. They're kept referenced instead, so they're never
+        closed by the garbage collector either.
+        """
+
+        self._inherited.extend(self._idle)
+        self._idle = []
+        self._size = 0
+        self._condition = threading.Condition()
+        self._pid = os.getpid()
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            self._after_fork()
+
+    def _close(self, pooled):
+        try:
+            pooled.connection.close()
+        except Exception:
+            logger.debug("Error closing pooled connection.", exc_info=True)
+
+    def _discard(self, pooled):
+        """Closes a connection that won't return to the pool, freeing its place."""
+
+        self._close(pooled)
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
+
+    def _expired_connections(self):
+        """Removes and returns the idle connections past idle_timeout, keeping at least min_size open.
+        Must be called holding _condition."""
+
+        expired = []
+        limit = time.monotonic() - self.idle_timeout
+        while self._idle and self._size > self.min_size and self._idle[0].last_used < limit:
+            expired.append(self._idle.pop(0))
+            self._size -= 1
+        return expired
+
+    def _is_alive(self, connection):
+        if getattr(connection, "closed", False):
+            return False
+
+        # Any error means the connection can't be used, whatever the driver raises
+        try:
+            cursor = connection.cursor()
+            try:
+                cursor.execute("SELECT 1")
+                cursor.fetchall()
+            finally:
+                cursor.close()
+            connection.rollback()
+        except Exception:
+            return False
+
+        return True
+
+    def _checkout(self):
+        """Returns an idle connection, or None if a place for a new one was reserved."""
+
+        # Computed once, so closing expired connections doesn't extend the wait
+        deadline = None if self.checkout_timeout is None else time.monotonic() + self.checkout_timeout
+
+        while True:
+            with self._condition:
+                if self._closed:
+                    raise ValueError("Connection pool is closed.")
+
+                while True:
+                    expired = self._expired_connections()
+                    if expired:
+                        break
+
+                    if self._idle:
+                        return self._idle.pop()
+
+                    if self._size < self.max_size:
+                        self._size += 1
+                        return None
+
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise TimeoutError(f"No connection released in {self.checkout_timeout} seconds (max_size={self.max_size}).")
+                    self._condition.wait(remaining)
+
+            # Closing expired connections out of the lock, then trying again
+            for pooled in expired:
+                self._close(pooled)
+            logger.debug("%s idle connections closed.", len(expired))
+
+    def _open(self, connect_function):
+        """Opens a new connection in the place reserved by _checkout."""
+
+        try:
+            connection = connect_function()
+        except BaseException:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+
+        logger.debug("New pooled connection opened.")
+        return _PooledConnection(connection, self)
+
+    def acquire(self, connect_function=None):
+        """Returns a connection from the pool (as a _PooledConnection), opening a new one if needed.
+        It must be given back with the release method."""
+
+        connect_function = connect_function or self.connect_function
+        self._check_pid()
+
+        while True:
+            pooled = self._checkout()
+            if pooled is None:
+                return self._open(connect_function)
+
+            if not self.health_check or self._is_alive(pooled.connection):
+                return pooled
+
+            logger.warning("Pooled connection failed health check. Reconnecting.")
+            add_retry()
+            self._discard(pooled)
+
+    def release(self, pooled, discard=False):
+        """Gives a connection back to the pool, rolling back any pending transaction.
+        If discard is True or the rollback fails, the connection is closed instead."""
+
+        if pooled.pid != os.getpid():
+            # Borrowed before a fork. Only the parent process can use or close it.
+            self._inherited.append(pooled)
+            return
+
+        if not discard:
+            try:
+                pooled.connection.rollback()
+            except Exception:
+                logger.warning("Failed to reset pooled connection. Closing it.")
+                discard = True
+
+        if discard or self._closed:
+            self._discard(pooled)
+            return
+
+        pooled.last_used = time.monotonic()
+        with self._condition:
+            self._idle.append(pooled)
+            self._condition.notify()
+
+    def fill(self, connect_function=None):
+        """Opens connections until there are at least min_size of them, e.g. to warm up the pool
+        when a service starts."""
+
+        connect_function = connect_function or self.connect_function
+        self._check_pid()
+
+        opened = []
+        try:
+            while True:
+                with self._condition:
+                    if self._size >= self.min_size:
+                        break
+                    self._size += 1
+                opened.append(self._open(connect_function))
+        finally:
+            for pooled in opened:
+                self.release(pooled)
+
+    def close(self):
+        """Closes all idle connections. Connections in use are closed when released."""
+
+        self._check_pid()
+
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+
+        for pooled in idle:
+            self._close(pooled)
+
+
+# Pools used by the tools, by pool key, and the settings for the pools not created yet
+_pools = {}
+_pool_settings = {}
+_pools_lock = threading.Lock()
+
+
+def configure_pool(sql_type, connection="default", **settings):
+    """Sets the settings (any ConnectionPool parameter but connect_function) of the pool used by the tools
+    with the given sql_type and connection. For SQLite, connection is the database filename.
+
+    Settings of a pool already in use are updated, but they take effect only on its next operations.
+    """
+
+    with _pools_lock:
+        _pool_settings[(sql_type, connection)] = settings
+        pools = [pool for key, pool in _pools.items() if key[:2] == (sql_type, connection)]
+
+    for pool in pools:
+        with pool._condition:
+            for name, value in settings.items():
+                setattr(pool, name, value)
+
+
+def get_pool(key):
+    """Returns the pool of the given key, creating it if needed. The first 2 items of
+    the key are the sql_type and connection used to find its settings."""
+
+    pool = _pools.get(key)
+    if pool is None or pool._closed:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None or pool._closed:
+                pool = _pools[key] = ConnectionPool(**_pool_settings.get(key[:2], {}))
+    return pool
+
+
+def close_all_pools():
+    """Closes the idle connections of every pool used by the tools and removes them.
+    It's called automatically when the interpreter exits."""
+
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+
+    for pool in pools:
+        pool.close()
+
+
+class ReplicaSet(object):
+    """Read replicas of a database, chosen for each read either in turns (selection="round_robin")
+    or by the lowest average read time (selection="least_latency").
+
+    replicas is a list of connection parameter dictionaries. A replica that fails to connect or loses
+    its connection is ejected from the rotation for eject_seconds, and then tried again.
+    latency_decay is the weight of each new read time in the average kept for least_latency.
+    """
+
+    def __init__(self, replicas, selection="round_robin", eject_seconds=30, latency_decay=0.2):
+        if selection not in ("round_robin", "least_latency"):
+            raise ValueError(f"Unsupported selection {selection}. Selections available: ['round_robin', 'least_latency']")
+
+        self.replicas = list(replicas)
+        self.selection = selection
+        self.eject_seconds = eject_seconds
+        self.latency_decay = latency_decay
+
+        self._latencies = [None] * len(self.replicas)
+        self._ejected_until = [0.0] * len(self.replicas)
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def healthy(self):
+        """Returns the indexes of the replicas currently in the rotation."""
+
+        now = time.monotonic()
+        return [index for index, ejected_until in enumerate(self._ejected_until) if ejected_until <= now]
+
+    def choose(self):
+        """Returns the index of the replica for the next read, or None if all replicas are ejected."""
+
+        with self._lock:
+            healthy = self.healthy()
+            if not healthy:
+                return None
+
+            if self.selection == "least_latency":
+                # Replicas without a read time yet are tried first
+                return min(healthy, key=lambda index: -1 if self._latencies[index] is None else self._latencies[index])
+
+            index = healthy[self._next % len(healthy)]
+            self._next += 1
+            return index
+
+    def record_read(self, index, seconds):
+        """Adds the time of a successful read to the average of the replica."""
+
+        with self._lock:
+            latency = self._latencies[index]
+            self._latencies[index] = seconds if latency is None else latency + self.latency_decay * (seconds - latency)
+
+    def eject(self, index):
+        """Takes a replica out of the rotation for eject_seconds."""
+
+        with self._lock:
+            self._ejected_until[index] = time.monotonic() + self.eject_seconds
+        logger.warning("Replica %s ejected from the rotation for %s seconds.", index, self.eject_seconds)
+
+    def stats(self):
+        """Returns the average read time (in seconds) and whether it's in the rotation, for each replica."""
+
+        healthy = set(self.healthy())
+        return [
+            {"latency": latency, "healthy": index in healthy}
+            for index, latency in enumerate(self._latencies)
+        ]
+
+
+# Replica sets used by the tools, by the pool key of their primary, and the settings for the ones not created yet
+_replica_sets = {}
+_replica_settings = {}
+
+
+def configure_replicas(sql_type, connection="default", **settings):
+    """Sets the settings (any ReplicaSet parameter but replicas) of the read replicas
+    used by the tools with the given sql_type and connection."""
+
+    with _pools_lock:
+        _replica_settings[(sql_type, connection)] = settings
+        _replica_sets.pop((sql_type, connection), None)
+
+
+def get_replica_set(key, replicas):
+    """Returns the replica set of the given primary pool key, creating it if needed
+    (or if its replicas changed in the secrets file)."""
+
+    replica_set = _replica_sets.get(key)
+    if replica_set is None or replica_set.replicas != replicas:
+        with _pools_lock:
+            replica_set = _replica_sets.get(key)
+            if replica_set is None or replica_set.replicas != replicas:
+                replica_set = _replica_sets[key] = ReplicaSet(replicas, **_replica_settings.get(key[:2], {}))
+    return replica_set
+
+
+def _reset_pools_after_fork():
+    global _pools_lock, _replica_sets
+
+    _pools_lock = threading.Lock()
+    _replica_sets = {}
+    for pool in list(_all_pools):
+        pool._after_fork()
+
+
+atexit.register(close_all_pools)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_pools_after_fork)
+
+
+# Quoted strings and identifiers, kept as they are when normalizing a statement
+_QUOTED_OR_SPACES = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*"|`[^`]*`)|\s+""")
+_TABLE_NAME = r"""((?:[\w$]+|"[^"]+"|`[^`]+`)(?:\.(?:[\w$]+|"[^"]+"|`[^`]+`))*)"""
+_READ_TABLES = re.compile(r"\b(?:FROM|JOIN)\s+" + _TABLE_NAME, re.IGNORECASE)
+_WRITTEN_TABLES = re.compile(
+    r"\b(?:INSERT\s+INTO|UPDATE|DELETE\s+FROM|TRUNCATE(?:\s+TABLE)?|DROP\s+TABLE(?:\s+IF\s+EXISTS)?|"
+    r"ALTER\s+TABLE|MERGE\s+INTO|COPY|REPLACE\s+INTO|LOAD\s+DATA.*?\s+INTO\s+TABLE)\s+" + _TABLE_NAME,
+    re.IGNORECASE | re.DOTALL
+)
+_READ_ONLY_KEYWORDS = {"select", "with", "show", "describe", "values", "explain"}
+
+
+def _normalize_sql(sql):
+    """Collapses whitespace outside quotes and removes the trailing semicolon, so equivalent statements match."""
+    return _QUOTED_OR_SPACES.sub(lambda match: match.group(1) or " ", sql).strip().rstrip(";").strip()
+
+
+def _table_names(pattern, sql):
+    """Returns the unqualified, unquoted and lowercase names of the tables matched by pattern in sql."""
+    return {match.split(".")[-1].strip('"`').lower() for match in pattern.findall(sql)}
+
+
+def _is_read_only(sql):
+    words = sql.split(None, 1)
+    return bool(words) and words[0].lower() in _READ_ONLY_KEYWORDS and not _table_names(_WRITTEN_TABLES, sql)
+
+
+class QueryResultCache(object):
+    """Cache of query results, by normalized SQL, parameters and connection.
+
+    Results expire after ttl seconds (never, if it's None) and the least recently used ones are evicted
+    when there are more than max_entries of them (or, if max_bytes is set, when they take more than
+    about max_bytes of memory). If disk_dir is given, DataFrame results are also saved there as Parquet
+    files, so they can be read back after the memory entry is evicted or the process restarts.
+
+    Entries are invalidated by the tables their query reads: writes made by the tools
+    (execute_sql, bulk_insert and queries that aren't read-only) invalidate the entries of the tables written.
+    """
+
+    def __init__(self, ttl=300, max_entries=256, max_bytes=None, disk_dir=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        # Entries by key: (result, expires_at, tables, connection, nbytes), least recently used first
+        self._entries = collections.OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        if disk_dir is not None:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def make_key(self, connection, sql, params=None, fetch_as="pandas"):
+        """Returns the cache key of a query: a hash of its connection, normalized SQL, parameters and result format."""
+
+        key_data = json.dumps([connection, _normalize_sql(sql), params, fetch_as], default=str)
+        return hashlib.sha256(key_data.encode()).hexdigest()
+
+    @staticmethod
+    def _copy(result):
+        # Callers get their own copy, so changing it doesn't change the cached result
+        if hasattr(result, "copy"):
+            return result.copy()
+        if hasattr(result, "to_batches"):  # Arrow tables can't be changed
+            return result
+        return list(result)
+
+    @staticmethod
+    def _size(result):
+        if hasattr(result, "memory_usage"):
+            return int(result.memory_usage(deep=True).sum())
+        if hasattr(result, "nbytes"):
+            return result.nbytes
+        return sys.getsizeof(result) + sum(sys.getsizeof(row) for row in result)
+
+    def _disk_paths(self, key):
+        return os.path.join(self.disk_dir, f"{key}.parquet"), os.path.join(self.disk_dir, f"{key}.json")
+
+    def get(self, key):
+        """Returns a copy of the cached result of key, or None if it's not cached or has expired."""
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] is None or entry[1] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return self._copy(entry[0])
+                self._remove(key)
+
+        if self.disk_dir is not None:
+            result = self._get_from_disk(key)
+            if result is not None:
+                return result
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _get_from_disk(self, key):
+        import pandas as pd
+
+        parquet_path, metadata_path = self._disk_paths(key)
+        try:
+            with open(metadata_path, "r") as metadata_file:
+                metadata = json.load(metadata_file)
+
+            if metadata["expires_at"] is not None and metadata["expires_at"] <= time.time():
+                self._remove_from_disk(key)
+                return None
+
+            result = pd.read_parquet(parquet_path)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            logger.warning("Failed to read cached result %s from disk.", key, exc_info=True)
+            return None
+
+        # JSON turns the connection key tuple into a list
+        connection = metadata["connection"]
+        if isinstance(connection, list):
+            connection = tuple(connection)
+
+        ttl = None if metadata["expires_at"] is None else metadata["expires_at"] - time.time()
+        self._put_in_memory(key, result, ttl, set(metadata["tables"]), connection)
+        with self._lock:
+            self.disk_hits += 1
+        return self._copy(result)
+
+    def put(self, key, result, tables=(), connection=None):
+        """Caches a copy of result under key, recording the tables it depends on."""
+
+        result = self._copy(result)
+        tables = set(tables)
+        self._put_in_memory(key, result, self.ttl, tables, connection)
+
+        if self.disk_dir is not None and hasattr(result, "to_parquet"):
+            parquet_path, metadata_path = self._disk_paths(key)
+            try:
+                result.to_parquet(parquet_path)
+                with open(metadata_path, "w") as metadata_file:
+                    json.dump({
+                        "expires_at": None if self.ttl is None else time.time() + self.ttl,
+                        "tables": sorted(tables),
+                        "connection": connection,
+                    }, metadata_file, default=str)
+            except Exception:
+                # E.g. pyarrow not installed or a column type that Parquet doesn't support
+                logger.warning("Failed to save cached result %s to disk.", key, exc_info=True)
+                self._remove_from_disk(key)
+
+    def _put_in_memory(self, key, result, ttl, tables, connection):
+        nbytes = self._size(result) if self.max_bytes is not None else 0
+        expires_at = None if ttl is None else time.monotonic() + ttl
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = (result, expires_at, tables, connection, nbytes)
+            self._bytes += nbytes
+
+            while len(self._entries) > 1 and (
+                len(self._entries) > self.max_entries
+                or (self.max_bytes is not None and self._bytes > self.max_bytes)
+            ):
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        """Removes an entry from memory. Must be called holding _lock."""
+        entry = self._entries.pop(key)
+        self._bytes -= entry[4]
+
+    def _remove_from_disk(self, key):
+        for path in self._disk_paths(key):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def invalidate(self, tables=None, connection=None):
+        """Removes the entries that read any of the given tables (or all entries, if tables is None),
+        from memory and disk. If connection is given, only the entries of that connection are removed."""
+
+        if tables is not None:
+            tables = {table.split(".")[-1].strip('"`').lower() for table in tables}
+
+        def matches(entry_tables, entry_connection, connection):
+            if connection is not None and entry_connection != connection:
+                return False
+            return tables is None or bool(tables & entry_tables)
+
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if matches(entry[2], entry[3], connection)]:
+                self._remove(key)
+
+        if self.disk_dir is not None:
+            # Connections are saved as JSON, so they're compared the same way
+            saved_connection = json.loads(json.dumps(connection, default=str))
+            for filename in os.listdir(self.disk_dir):
+                if not filename.endswith(".json"):
+                    continue
+                try:
+                    with open(os.path.join(self.disk_dir, filename), "r") as metadata_file:
+                        metadata = json.load(metadata_file)
+                except (OSError, ValueError):
+                    continue
+                if matches(set(metadata["tables"]), metadata["connection"], saved_connection):
+                    self._remove_from_disk(filename[:-len(".json")])
+
+    def invalidate_for_command(self, command, connection=None):
+        """Removes the entries that read the tables written by a SQL command.
+        If the tables can't be found in the command, all entries of the connection are removed."""
+
+        tables = _table_names(_WRITTEN_TABLES, command)
+        self.invalidate(tables or None, connection)
+
+    def clear(self):
+        """Removes all entries, from memory and disk."""
+        self.invalidate()
+
+    def stats(self):
+        """Returns the amount of entries, hits (from memory and disk) and misses in a dictionary."""
+
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes if self.max_bytes is not None else None,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+            }
+
+
+class SlowQueryLog(object):
+    """Record of the statements run by the tools that took at least threshold seconds, used by
+    the query and execute_sql methods when set in their slow_query_log attribute.
+
+    Only the last max_entries statements are kept. If explain is True, the plan of each slow read-only
+    query is recorded as well, running EXPLAIN (or EXPLAIN ANALYZE, if analyze is True, which runs
+    the query again) right after it.
+    """
+
+    def __init__(self, threshold=1.0, max_entries=1000, explain=False, analyze=False):
+        self.threshold = threshold
+        self.explain = explain
+        self.analyze = analyze
+        self._entries = collections.deque(maxlen=max_entries)
+        self._lock = threading.Lock()
+
+    def record(self, sql, seconds, rows=None, params=None, connection=None, plan=None, query_id=None):
+        """Adds a statement to the log."""
+
+        entry = {
+            "sql": sql,
+            "params": params,
+            "seconds": seconds,
+            "rows": rows,
+            "connection": connection,
+            "plan": plan,
+            "query_id": query_id,
+            "timestamp": time.time(),
+        }
+        with self._lock:
+            self._entries.append(entry)
+
+        logger.warning("Slow statement (%.3f seconds): %s", seconds, sql)
+
+    def entries(self):
+        """Returns the logged statements, oldest first, each in a dictionary with its sql, params, duration
+        in seconds, rows (returned or affected), connection, plan (if explain is set), query_id
+        (the ID given by the database, only in RedShift) and timestamp."""
+
+        with self._lock:
+            return list(self._entries)
+
+    def clear(self):
+        """Removes all entries."""
+
+        with self._lock:
+            self._entries.clear()
+
+
+# Statement timeout of a session that may have been rolled back, so it's always set again
+_UNKNOWN_TIMEOUT = object()
+
+
+# Schema snapshot entries built by SchemaCatalog. Catalog rows have the same fields in every dialect:
+# (kind, schema, table, name, detail, flag, extra, position), where kind is "column" or "index". Columns have
+# the data type as detail, nullability as flag and the default value as extra; indexes have one row per
+# indexed column, with the column name as detail, uniqueness as flag and extra set to "primary" for primary keys.
+CatalogColumn = collections.namedtuple("CatalogColumn", ["name", "data_type", "nullable", "default"])
+CatalogIndex = collections.namedtuple("CatalogIndex", ["name", "columns", "unique", "primary"])
+CatalogTable = collections.namedtuple("CatalogTable", ["schema", "name", "columns", "primary_key", "indexes"])
+
+# Columns of the results returned by SchemaCatalog.describe
+_CATALOG_DESCRIBE_COLUMNS = ["column_name", "data_type", "is_nullable", "column_default", "primary_key"]
+
+
+# Query that reads the whole schema of each database, with the rows described above (see SQLTool._catalog_query)
+_CATALOG_QUERIES = {
+    # Table-valued PRAGMA functions list the columns and indexes of every table in one query.
+    # INTEGER PRIMARY KEY columns have no index, so the primary key is read from the columns instead.
+    "SQLite": """
+        SELECT 'column', 'main', m.name, p.name, p.type, NOT p."notnull", p.dflt_value, p.cid
+        FROM sqlite_master AS m JOIN pragma_table_info(m.name) AS p
+        WHERE m.type IN ('table', 'view') AND m.name NOT LIKE 'sqlite_%'
+        UNION ALL
+        SELECT 'index', 'main', m.name, 'PRIMARY', p.name, 1, 'primary', p.pk
+        FROM sqlite_master AS m JOIN pragma_table_info(m.name) AS p
+        WHERE m.type = 'table' AND m.name NOT LIKE 'sqlite_%' AND p.pk > 0
+        UNION ALL
+        SELECT 'index', 'main', m.name, l.name, i.name, l."unique", NULL, i.seqno
+        FROM sqlite_master AS m JOIN pragma_index_list(m.name) AS l JOIN pragma_index_info(l.name) AS i
+        WHERE m.type = 'table' AND m.name NOT LIKE 'sqlite_%' AND l.origin != 'pk'
+    """,
+    "MySQL": """
+        SELECT 'column', table_schema, table_name, column_name, column_type, is_nullable = 'YES', column_default, ordinal_position
+        FROM information_schema.columns
+        WHERE table_schema = DATABASE()
+        UNION ALL
+        SELECT 'index', table_schema, table_name, index_name, column_name, non_unique = 0,
+            IF(index_name = 'PRIMARY', 'primary', NULL), seq_in_index
+        FROM information_schema.statistics
+        WHERE table_schema = DATABASE()
+    """,
+    # One row per column of each index, in the order of the index key. Expression index columns are left out.
+    "PostgreSQL": """
+        SELECT 'column', table_schema::text, table_name::text, column_name::text, data_type::text,
+            is_nullable = 'YES', column_default::text, ordinal_position::int
+        FROM information_schema.columns
+        WHERE table_schema NOT IN ('pg_catalog', 'information_schema')
+        UNION ALL
+        SELECT 'index', n.nspname::text, t.relname::text, i.relname::text, a.attname::text,
+            x.indisunique, CASE WHEN x.indisprimary THEN 'primary' END, k.position::int
+        FROM pg_index AS x
+        JOIN pg_class AS i ON i.oid = x.indexrelid
+        JOIN pg_class AS t ON t.oid = x.indrelid
+        JOIN pg_namespace AS n ON n.oid = t.relnamespace
+        CROSS JOIN LATERAL unnest(x.indkey::int2[]) WITH ORDINALITY AS k(attnum, position)
+        JOIN pg_attribute AS a ON a.attrelid = t.oid AND a.attnum = k.attnum
+        WHERE n.nspname NOT IN ('pg_catalog', 'information_schema', 'pg_toast')
+    """,
+    # RedShift has no indexes, so only the primary keys (informational constraints) are read
+    "RedShift": """
+        SELECT 'column', table_schema::text, table_name::text, column_name::text, data_type::text,
+            is_nullable = 'YES', column_default::text, ordinal_position::int
+        FROM information_schema.columns
+        WHERE table_schema NOT IN ('pg_catalog', 'information_schema')
+        UNION ALL
+        SELECT 'index', k.table_schema::text, k.table_name::text, k.constraint_name::text, k.column_name::text,
+            TRUE, 'primary', k.ordinal_position::int
+        FROM information_schema.table_constraints AS c
+        JOIN information_schema.key_column_usage AS k
+            ON k.constraint_schema = c.constraint_schema AND k.constraint_name = c.constraint_name
+        WHERE c.constraint_type = 'PRIMARY KEY'
+    """,
+}
+
+# Schema looked up by the catalog of each database when a table name doesn't include one
+_CATALOG_DEFAULT_SCHEMAS = {"PostgreSQL": "public", "RedShift": "public"}
+
+
+class SchemaCatalog(object):
+    """Snapshot of the tables of a database, with their columns, primary keys and indexes,
+    read with a single query (see SQLTool.get_catalog)."""
+
+    def __init__(self, tables, default_schema=None):
+        # CatalogTable entries by (schema, table name)
+        self.tables = tables
+        self.default_schema = default_schema
+        self.created_at = time.monotonic()
+
+    @classmethod
+    def from_rows(cls, rows, default_schema=None):
+        """Builds a catalog from the rows of a catalog query, in any order."""
+
+        columns = collections.defaultdict(list)
+        indexes = collections.defaultdict(dict)
+
+        for kind, schema, table, name, detail, flag, extra, position in rows:
+            if kind == "column":
+                columns[(schema, table)].append((position, CatalogColumn(name, detail, bool(flag), extra)))
+            else:
+                index_columns, unique, primary = indexes[(schema, table)].setdefault(name, ([], bool(flag), extra == "primary"))
+                index_columns.append((position, detail))
+
+        tables = {}
+        for key, table_columns in columns.items():
+            table_indexes = tuple(
+                CatalogIndex(name, tuple(column for _, column in sorted(index_columns)), unique, primary)
+                for name, (index_columns, unique, primary) in sorted(indexes.get(key, {}).items())
+            )
+            primary_key = next((index.columns for index in table_indexes if index.primary), ())
+            tables[key] = CatalogTable(
+                key[0], key[1], tuple(column for _, column in sorted(table_columns)), primary_key, table_indexes
+            )
+
+        return cls(tables, default_schema)
+
+    def age(self):
+        """Seconds since the catalog was read."""
+        return time.monotonic() - self.created_at
+
+    def table(self, table, schema=None):
+        """Returns the CatalogTable of a table, given either as "schema.table" or with the schema parameter.
+        If no schema is given, the default one is used, or any schema if the table name is unique in the catalog.
+        Raises KeyError if the table isn't found."""
+
+        if schema is None and "." in table:
+            schema, table = table.split(".", 1)
+
+        if schema is None:
+            entry = self.tables.get((self.default_schema, table))
+            if entry is not None:
+                return entry
+
+            matches = [entry for (_, name), entry in self.tables.items() if name == table]
+            if len(matches) == 1:
+                return matches[0]
+        else:
+            entry = self.tables.get((schema, table))
+            if entry is not None:
+                return entry
+
+        raise KeyError(f"Table {table} not found in the schema catalog.")
+
+    def __contains__(self, table):
+        try:
+            self.table(table)
+        except KeyError:
+            return False
+        return True
+
+    def __len__(self):
+        return len(self.tables)
+
+    def describe(self, table, schema=None, fetch_through_pandas=True):
+        """Returns the columns of a table, with their data type, nullability, default value and whether
+        they're part of the primary key, in a DataFrame or a list of tuples. It's empty if the table isn't found."""
+
+        try:
+            entry = self.table(table, schema)
+        except KeyError:
+            rows = []
+        else:
+            rows = [
+                (column.name, column.data_type, column.nullable, column.default, column.name in entry.primary_key)
+                for column in entry.columns
+            ]
+
+        if not fetch_through_pandas:
+            return rows
+
+        import pandas as pd
+        return pd.DataFrame(rows, columns=_CATALOG_DESCRIBE_COLUMNS)
+
+
+# Catalogs read by SQLTool.get_catalog, by the database they describe (see SQLTool._catalog_key)
+_catalogs = {}
+
+# Statements that may change the schema, dropping the cached catalog of the database
+_SCHEMA_CHANGE = re.compile(r"\s*(?:CREATE|ALTER|DROP|RENAME)\b", re.IGNORECASE)
+
+
+def _encode_watermark(value):
+    """Converts a watermark value into something JSON can hold, keeping its type."""
+
+    if isinstance(value, datetime.datetime):
+        return {"datetime": value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {"date": value.isoformat()}
+    if isinstance(value, decimal.Decimal):
+        return {"decimal": str(value)}
+    return value
+
+
+def _decode_watermark(value):
+    """Reverses _encode_watermark."""
+
+    if isinstance(value, dict):
+        if "datetime" in value:
+            return datetime.datetime.fromisoformat(value["datetime"])
+        if "date" in value:
+            return datetime.date.fromisoformat(value["date"])
+        if "decimal" in value:
+            return decimal.Decimal(value["decimal"])
+    return value
+
+
+class JSONWatermarkStore(object):
+    """Keeps the watermarks of incremental extractions (see SQLTool.extract_incremental) in a local JSON file.
+
+    The file is rewritten on every change through a temporary file, so it's never left half written.
+    Integer, float, string, date, datetime and Decimal watermarks are supported.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _read(self):
+        try:
+            with open(self.path, "r") as watermarks_file:
+                return json.load(watermarks_file)
+        except FileNotFoundError:
+            return {}
+
+    def _write(self, watermarks):
+        # Replacing the file at once, so readers see either the old or the new content
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        temp_path = os.path.join(directory, f".{os.path.basename(self.path)}.{uuid.uuid4().hex}.tmp")
+        with open(temp_path, "w") as watermarks_file:
+            json.dump(watermarks, watermarks_file, indent=2)
+        os.replace(temp_path, self.path)
+
+    def get(self, key):
+        """Returns the watermark saved with key, or None if there's none."""
+
+        with self._lock:
+            return _decode_watermark(self._read().get(key))
+
+    def set(self, key, value):
+        """Saves value as the watermark of key."""
+
+        with self._lock:
+            watermarks = self._read()
+            watermarks[key] = _encode_watermark(value)
+            self._write(watermarks)
+
+    def delete(self, key):
+        """Removes the watermark of key, so the next extraction starts from the beginning."""
+
+        with self._lock:
+            watermarks = self._read()
+            if key in watermarks:
+                del watermarks[key]
+                self._write(watermarks)
+
+
+class SQLiteWatermarkStore(object):
+    """Keeps the watermarks of incremental extractions (see SQLTool.extract_incremental) in a table of a SQLite file,
+    which can be shared by many processes. Each change is a single transaction.
+    Supports the same watermark types as JSONWatermarkStore."""
+
+    def __init__(self, filename, table="instackup_watermarks"):
+        if not re.fullmatch(r"\w+", table):
+            raise ValueError(f"Invalid watermark table name: {table}")
+
+        self.filename = filename
+        self.table = table
+
+        with contextlib.closing(self._connect()) as connection, connection:
+            connection.execute(f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT, updated_at TEXT)")
+
+    def _connect(self):
+        # Waits up to 30 seconds for another process writing to the file
+        return sqlite3.connect(self.filename, timeout=30)
+
+    def get(self, key):
+        """Returns the watermark saved with key, or None if there's none."""
+
+        with contextlib.closing(self._connect()) as connection:
+            row = connection.execute(f"SELECT value FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        return None if row is None else _decode_watermark(json.loads(row[0]))
+
+    def set(self, key, value):
+        """Saves value as the watermark of key."""
+
+        with contextlib.closing(self._connect()) as connection, connection:
+            connection.execute(
+                f"INSERT INTO {self.table} (key, value, updated_at) VALUES (?, ?, datetime('now')) "
+                "ON CONFLICT (key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+                (key, json.dumps(_encode_watermark(value))),
+            )
+
+    def delete(self, key):
+        """Removes the watermark of key, so the next extraction starts from the beginning."""
+
+        with contextlib.closing(self._connect()) as connection, connection:
+            connection.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+
+class IncrementalBatch(object):
+    """Chunk of rows yielded by SQLTool.extract_incremental.
+
+    data attribute has the rows, in the format requested; rows is their amount and watermark
+    is the highest value of the watermark column among them. Calling commit saves that watermark,
+    so the next extraction starts after these rows (and all the ones yielded before them).
+    """
+
+    def __init__(self, data, rows, watermark, store, key):
+        self.data = data
+        self.rows = rows
+        self.watermark = watermark
+        self._store = store
+        self._key = key
+        self.committed = False
+
+    def commit(self):
+        """Saves the watermark of this batch in the store."""
+
+        self._store.set(self._key, self.watermark)
+        self.committed = True
+        logger.debug("Watermark of %s advanced to %s.", self._key, self.watermark)
+
+    def __repr__(self):
+        return f"IncrementalBatch(rows={self.rows}, watermark={self.watermark!r}, committed={self.committed})"
+
+
+# Outcome of each job run by run_concurrent_queries. error is None if the job succeeded; otherwise, result is None.
+QueryJobResult = collections.namedtuple("QueryJobResult", ["key", "result", "error", "seconds"])
+
+
+def _run_query_job(key, job, fetch_through_pandas, fetch_as):
+    """Runs a single job of run_concurrent_queries in a session of its own, returning its QueryJobResult."""
+
+    tool, sql_query = job[0], job[1]
+    params = job[2] if len(job) > 2 else None
+
+    start = time.perf_counter()
+    session = None
+    try:
+        session = tool._new_session()
+        result = session.query(sql_query, fetch_through_pandas=fetch_through_pandas, params=params, fetch_as=fetch_as)
+    except Exception as e:
+        # Already logged by connect or query
+        return QueryJobResult(key, None, e, time.perf_counter() - start)
+    finally:
+        if session is not None:
+            try:
+                session.close_connection()
+            except Exception:
+                logger.warning("Failed to close the connection of query job %r.", key, exc_info=True)
+
+    return QueryJobResult(key, result, None, time.perf_counter() - start)
+
+
+def _completed_query_jobs(executor, futures):
+    try:
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        # Jobs not started yet are dropped if the iteration stops early
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+def run_concurrent_queries(jobs, max_workers=8, fetch_through_pandas=True, yield_results=False, fetch_as=None):
+    """Runs many queries at the same time, in up to max_workers threads, each query with a connection of its own.
+
+    jobs parameter is either a list of jobs or a dictionary of jobs by any key. Each job is a tuple of
+    a tool (e.g. a PostgreSQLTool, connected or not) and a query, optionally followed by its params.
+    The tool of a job is copied and connected again for the job, so the same tool can be used in many jobs.
+    When the tool uses the connection pool, the jobs borrow their connections from it.
+
+    Each job outcome is a QueryJobResult, with the job key (its position, if jobs is a list), the query result
+    (a DataFrame if fetch_through_pandas parameter is True or a list of tuples otherwise; fetch_as parameter
+    sets another format, as in SQLTool.query), the exception raised by the job (or None) and the seconds
+    it took. A failed job doesn't stop the others.
+
+    Returns a dictionary with the outcome of each job by its key, in the same order as the jobs, after all
+    of them finish. If yield_results parameter is True, returns an iterator with each outcome as soon
+    as its job finishes instead.
+    """
+
+    items = list(jobs.items()) if isinstance(jobs, dict) else list(enumerate(jobs))
+
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="instackup")
+    futures = [executor.submit(_run_query_job, key, job, fetch_through_pandas, fetch_as) for key, job in items]
+    results = _completed_query_jobs(executor, futures)
+
+    if yield_results:
+        return results
+
+    outcomes = {outcome.key: outcome for outcome in results}
+    return {key: outcomes[key] for key, _ in items}
+
+
+# Column type families recognized in the data types of a SchemaCatalog, tried in order (full match, lowercase)
+_TYPE_FAMILIES = [
+    ("boolean", re.compile(r"bool(ean)?|tinyint\(1\)")),
+    ("integer", re.compile(r"((tiny|small|medium|big)?int(eger)?|int[248])(\(\d+\))?( unsigned)?|(small|big)?serial")),
+    ("decimal", re.compile(r"(numeric|decimal)(\(\d+(,\s*\d+)?\))?( unsigned)?")),
+    ("float", re.compile(r"(real|float[48]?|double( precision)?)(\(\d+(,\s*\d+)?\))?( unsigned)?")),
+    ("timestamptz", re.compile(r"timestamp(\(\d\))? with time zone|timestamptz")),
+    ("timestamp", re.compile(r"timestamp(\(\d\))?( without time zone)?|datetime(\(\d\))?")),
+    ("date", re.compile(r"date")),
+    ("json", re.compile(r"jsonb?|super")),
+    ("binary", re.compile(r"bytea|(tiny|medium|long)?blob|(var)?binary(\(\d+\))?|varbyte(\(\d+\))?")),
+]
+
+# Column type created in each destination database for each family ("text" for anything else)
+_DESTINATION_TYPES = {
+    "SQLite": {
+        "boolean": "INTEGER", "integer": "INTEGER", "decimal": "NUMERIC", "float": "REAL", "timestamptz": "TIMESTAMP",
+        "timestamp": "TIMESTAMP", "date": "DATE", "json": "TEXT", "binary": "BLOB", "text": "TEXT",
+    },
+    "MySQL": {
+        "boolean": "BOOLEAN", "integer": "BIGINT", "decimal": "DECIMAL(38, 10)", "float": "DOUBLE", "timestamptz": "DATETIME(6)",
+        "timestamp": "DATETIME(6)", "date": "DATE", "json": "JSON", "binary": "LONGBLOB", "text": "LONGTEXT",
+    },
+    "PostgreSQL": {
+        "boolean": "BOOLEAN", "integer": "BIGINT", "decimal": "NUMERIC", "float": "DOUBLE PRECISION", "timestamptz": "TIMESTAMPTZ",
+        "timestamp": "TIMESTAMP", "date": "DATE", "json": "JSONB", "binary": "BYTEA", "text": "TEXT",
+    },
+    "RedShift": {
+        "boolean": "BOOLEAN", "integer": "BIGINT", "decimal": "DECIMAL(38, 10)", "float": "DOUBLE PRECISION", "timestamptz": "TIMESTAMPTZ",
+        "timestamp": "TIMESTAMP", "date": "DATE", "json": "VARCHAR(65535)", "binary": "VARBYTE", "text": "VARCHAR(65535)",
+    },
+}
+
+# Families of Python values, for columns whose declared type doesn't tell (e.g. untyped SQLite columns)
+_VALUE_FAMILIES = [
+    (bool, "boolean"), (int, "integer"), (float, "float"), (decimal.Decimal, "decimal"), (datetime.datetime, "timestamp"),
+    (datetime.date, "date"), ((bytes, bytearray, memoryview), "binary"), ((dict, list), "json"),
+]
+
+
+def _type_family(data_type):
+    """Returns the family of a column data type, "text" if it's unknown, or None if the type is empty."""
+
+    data_type = (data_type or "").strip().lower()
+    if not data_type:
+        return None
+
+    for family, pattern in _TYPE_FAMILIES:
+        if pattern.fullmatch(data_type):
+            return family
+    return "text"
+
+
+def _value_family(values):
+    """Returns the family of the first value that isn't None, or "text" if all of them are."""
+
+    for value in values:
+        if value is None:
+            continue
+        for value_type, family in _VALUE_FAMILIES:
+            if isinstance(value, value_type):
+                return family
+        return "text"
+    return "text"
+
+
+def _destination_type(sql_type, family, source_type, primary_key):
+    """Returns the type of a column created by copy_table, keeping the precision of decimals when it's known."""
+
+    if family == "decimal" and sql_type != "SQLite":
+        precision = re.search(r"\(\d+(,\s*\d+)?\)", source_type or "")
+        if precision:
+            return ("DECIMAL" if sql_type == "MySQL" else "NUMERIC") + precision.group(0)
+
+    # MySQL can't index a LONGTEXT column without a prefix length
+    if family == "text" and sql_type == "MySQL" and primary_key:
+        return "VARCHAR(255)"
+
+    return _DESTINATION_TYPES[sql_type][family]
+
+
+def _quote_identifier(sql_type, name):
+    if sql_type == "MySQL":
+        return "`" + name.replace("`", "``") + "`"
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _quote_table(sql_type, table):
+    """Quotes each part of a table name that may include its schema, like schema.table."""
+    return ".".join(_quote_identifier(sql_type, part) for part in table.split("."))
+
+
+def _portable_value(sql_type, value):
+    """Converts a value read from one database into one the driver of sql_type can write."""
+
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    if isinstance(value, uuid.UUID):
+        return str(value)
+
+    if sql_type == "SQLite":
+        # sqlite3 only binds numbers, strings and bytes (its date adapters are deprecated)
+        if isinstance(value, decimal.Decimal):
+            return str(value)
+        if isinstance(value, datetime.datetime):
+            return value.isoformat(" ")
+        if isinstance(value, (datetime.date, datetime.time)):
+            return value.isoformat()
+        if isinstance(value, memoryview):
+            return bytes(value)
+
+    return value
+
+
+def _needs_conversion(sql_type, values):
+    """Tells if the values of a column must go through _portable_value before being written to sql_type."""
+
+    for value in values:
+        if value is not None:
+            return _portable_value(sql_type, value) is not value
+    return False
+
+
+def _read_chunks(tool, sql_query, chunksize):
+    """Yields the rows of a query in lists of up to chunksize rows, read with a stream cursor."""
+
+    cursor = tool._stream_cursor(chunksize)
+    try:
+        cursor.execute(sql_query)
+        while True:
+            rows = cursor.fetchmany(chunksize)
+            if not rows:
+                return
+            yield rows
+    finally:
+        tool._close_stream_cursor(cursor)
+
+
+# Marks the end of the chunks put in the queue by the reader thread of copy_table
+_END_OF_CHUNKS = object()
+
+
+def _pipelined_chunks(chunks, queue_size):
+    """Reads chunks in a separate thread, up to queue_size chunks ahead of the consumer.
+    Errors of the reader are raised in the consumer. Closing the generator stops the reader."""
+
+    pending = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    def put(item):
+        # Gives up if the consumer stopped, instead of waiting forever for room in the queue
+        while not stop.is_set():
+            try:
+                pending.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def read():
+        try:
+            for chunk in chunks:
+                if not put(chunk):
+                    return
+        finally:
+            chunks.close()
+            put(_END_OF_CHUNKS)
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="instackup-copy") as executor:
+        reader = executor.submit(read)
+        try:
+            while True:
+                chunk = pending.get()
+                if chunk is _END_OF_CHUNKS:
+                    break
+                yield chunk
+        finally:
+            stop.set()
+
+    # Raises the error of the reader, if there was one
+    reader.result()
+
+
+def copy_table(source, destination, table, destination_table=None, columns=None, where=None, chunksize=10000, queue_size=4,
+               if_exists="append", commit=True):
+    """Copies a table between any two SQLTool objects (even of different databases), in constant memory.
+
+    Rows are read from source in chunks of chunksize rows by a separate thread, in a connection of its own,
+    while the calling thread writes the previous chunks with destination bulk_insert method (COPY in PostgreSQL,
+    multi-row INSERTs in MySQL and RedShift). Up to queue_size chunks wait to be written at a time. In-memory
+    SQLite databases can't be read from another connection, so reading and writing alternate in that case.
+
+    The destination table (named destination_table, or as the source table if not set) is created if it doesn't
+    exist, with the column types mapped from the source ones, their nullability and the primary key.
+    if_exists parameter sets what happens if it already exists: "append" rows to it, "replace" it or "fail".
+    columns parameter is the list of columns copied (all, by default) and where parameter
+    is a SQL condition the source rows must match.
+
+    If commit parameter is True, the destination is committed once, after all rows are written (or rolled back
+    on any error); otherwise, committing is left to the caller.
+
+    Returns a dictionary with the amount of rows and chunks copied, the total seconds and rows per second,
+    and the seconds spent writing and waiting for rows from the source.
+    """
+
+    if if_exists not in ("append", "replace", "fail"):
+        raise ValueError(f"Unsupported if_exists {if_exists}. Options are: ['append', 'replace', 'fail']")
+
+    start = time.perf_counter()
+    stats = {"rows": 0, "chunks": 0, "seconds": 0.0, "rows_per_sec": None, "write_seconds": 0.0, "read_wait_seconds": 0.0}
+
+    source_table = source.get_catalog().table(table)
+    source_columns = {column.name: column for column in source_table.columns}
+    if columns is None:
+        columns = list(source_columns)
+    else:
+        missing = [column for column in columns if column not in source_columns]
+        if missing:
+            raise KeyError(f"Columns {missing} not found in table {table}.")
+
+    if destination_table is None:
+        destination_table = source_table.name
+
+    exists = destination_table in destination.get_catalog(refresh=True)
+    if exists and if_exists == "fail":
+        raise ValueError(f"Table {destination_table} already exists in the destination.")
+
+    select = ", ".join(_quote_identifier(source.sql_type, column) for column in columns)
+    sql_query = f"SELECT {select} FROM {table}" + (f" WHERE {where}" if where else "")
+    insert_columns = [_quote_identifier(destination.sql_type, column) for column in columns]
+
+    def create_table(rows):
+        column_definitions = []
+        primary_key = [column for column in source_table.primary_key if column in columns]
+        for index, name in enumerate(columns):
+            column = source_columns[name]
+            family = _type_family(column.data_type) or _value_family(row[index] for row in rows)
+            column_type = _destination_type(destination.sql_type, family, column.data_type, name in primary_key)
+            not_null = "" if column.nullable else " NOT NULL"
+            column_definitions.append(f"{_quote_identifier(destination.sql_type, name)} {column_type}{not_null}")
+
+        if len(primary_key) == len(source_table.primary_key) and primary_key:
+            quoted_key = ", ".join(_quote_identifier(destination.sql_type, name) for name in primary_key)
+            column_definitions.append(f"PRIMARY KEY ({quoted_key})")
+
+        if exists:
+            destination.execute_sql(f"DROP TABLE {destination_table}")
+        destination.execute_sql(f"CREATE TABLE {destination_table} ({', '.join(column_definitions)})")
+        logger.info("Table %s created in the destination.", destination_table)
+
+    # Keeping the source connection in this thread if it's an in-memory SQLite database
+    reader_session = None
+    if source.sql_type == "SQLite" and source.filename == ":memory:":
+        chunks = _read_chunks(source, sql_query, chunksize)
+    else:
+        reader_session = source._new_session()
+        chunks = _pipelined_chunks(_read_chunks(reader_session, sql_query, chunksize), queue_size)
+
+    try:
+        created = exists and if_exists == "append"
+        converters = None
+
+        while True:
+            wait_start = time.perf_counter()
+            rows = next(chunks, None)
+            stats["read_wait_seconds"] += time.perf_counter() - wait_start
+            if rows is None:
+                break
+
+            if not created:
+                create_table(rows)
+                created = True
+
+            if converters is None:
+                converters = [_needs_conversion(destination.sql_type, values) for values in zip(*rows)]
+            if any(converters):
+                rows = [
+                    tuple(_portable_value(destination.sql_type, value) if convert else value for value, convert in zip(row, converters))
+                    for row in rows
+                ]
+
+            write_start = time.perf_counter()
+            destination.bulk_insert(rows, destination_table, columns=insert_columns, batch_size=len(rows), commit=False)
+            stats["write_seconds"] += time.perf_counter() - write_start
+            stats["rows"] += len(rows)
+            stats["chunks"] += 1
+            logger.debug("%s rows copied to %s.", stats["rows"], destination_table)
+
+        if not created:
+            create_table([])
+
+        if commit:
+            destination.commit()
+
+    except BaseException:
+        if commit:
+            destination.rollback()
+        raise
+
+    finally:
+        chunks.close()
+        if reader_session is not None:
+            reader_session.close_connection()
+
+    stats["seconds"] = time.perf_counter() - start
+    if stats["seconds"]:
+        stats["rows_per_sec"] = stats["rows"] / stats["seconds"]
+
+    logger.info("%s rows copied from %s to %s in %.2f seconds.", stats["rows"], table, destination_table, stats["seconds"])
+    return stats
+
+
+@instrument_methods
 class SQLTool(object):
     """Base class for the different types of SQL databases."""
 
-    def __init__(self, sql_type, filename=None, connection='default'):
-        if sql_type == "SQLite":
-            sql_credentials = {}
-            if filename is None:
-                filename = ':memory:'
-        else:
-            # Getting credentials
-            sql_credentials = fetch_credentials(service_name=sql_type, connection=connection)
+    # Maximum amount of prepared statements kept by each connection. Set to 0 to disable preparing statements
+    # (e.g. behind PgBouncer in transaction mode, where they can't be shared between transactions).
+    statement_cache_size = 128
+
+    # QueryResultCache used by the query method, if set (either for all tools or for a single one)
+    result_cache = None
+
+    # Default statement timeout in seconds (None to use the database default) and the SlowQueryLog
+    # used by the query and execute_sql methods, if set (either for all tools or for a single one)
+    statement_timeout = None
+    slow_query_log = None
+
+    # Seconds a SchemaCatalog read by get_catalog is reused before being read again
+    catalog_ttl = 300
+
+    # Session copy running a query in a read replica, which cancel() must reach
+    _replica_session = None
+
+    # Set in the copies made by _new_session, which run in worker threads
+    _worker_session = False
+
+    # Connection parameters of each read replica, the index of the replica a session copy connects to,
+    # and whether a write or a transaction is pending, so reads stay in the primary until it ends
+    _replicas = ()
+    _replica_index = None
+    _in_transaction = False
+    read_from_replicas = False
+
+    def __init__(self, sql_type, filename=None, connection='default', use_pool=None, read_from_replicas=False):
+        if sql_type == "SQLite":
+            sql_credentials = {}
+            if filename is None:
+                filename = ':memory:'
+        else:
+            # Getting credentials
+            sql_credentials = fetch_credentials(service_name=sql_type, connection=connection)
+
+        # Each replica only lists the parameters that differ from the primary, or just its host
+        replicas = sql_credentials.pop("replicas", None) or []
+        self._replicas = [
+            dict(sql_credentials, **(replica if isinstance(replica, dict) else {"host": replica}))
+            for replica in replicas
+        ]
+        self.read_from_replicas = read_from_replicas
+
+        self.sql_type = sql_type
+        self.connection_name = connection
+
+        # SQLite
+        self.filename = filename
+
+        # PostgreSQL and others
+        self.connection_parameters = sql_credentials
+
+        # Pooling is enabled by default for server databases, where opening a connection is expensive
+        self.use_pool = sql_type != "SQLite" if use_pool is None else use_pool
+        self._pooled = None
+
+        # Data that lives as long as the connection, like its prepared statements
+        self._connection_info = None
+
+        # Attibutes ready to be set in connection
+        self.connection = None
+        self.cursor = None
+
+    def _pool_key(self):
+        """Key of the pool shared by all tools connecting to the same database."""
+
+        if self.sql_type == "SQLite":
+            return (self.sql_type, self.filename)
+        if self._replica_index is not None:
+            return (self.sql_type, self.connection_name, "replica", self._replica_index)
+        return (self.sql_type, self.connection_name)
+
+    def _open_connection(self):
+        """Opens a new connection to the database, without using the pool."""
+
+        if self.sql_type == "SQLite":
+            # Pooled connections may be used by a different thread each time they're borrowed,
+            # and the ones of worker sessions are closed by the thread that started the workers
+            return sqlite3.connect(
+                self.filename,
+                check_same_thread=not (self.use_pool or self._worker_session),
+                cached_statements=max(self.statement_cache_size, 1),
+            )
+
+        elif self.sql_type == "MySQL":
+            import mysql.connector
+            return mysql.connector.connect(**self.connection_parameters)
+
+        else:  # PostgreSQL
+            import psycopg2
+            return psycopg2.connect(**self.connection_parameters)
+
+    def connect(self, fail_silently=False):
+        """Create the connection using the __init__ attributes.
+        If use_pool is set, the connection is borrowed from the pool instead.
+
+        If fail_silently parameter is set to True, any errors will be surpressed
+        and not stop the code execution.
+        """
+
+        try:
+            if self.use_pool:
+                self._pooled = get_pool(self._pool_key()).acquire(self._open_connection)
+                conn = self._pooled.connection
+            else:
+                conn = self._open_connection()
+
+            logger.info("Connected!")
+        except _database_errors(self.sql_type) as e:
+            print('Failed to open database connection.')
+            logger.exception('Failed to open database connection.')
+
+            if not fail_silently:
+                raise e
+            else:
+                logger.error("ATENTION: Failing Silently")
+        else:
+            self.connection = conn
+            self.cursor = self.connection.cursor()
+            self._connection_info = self._pooled.info if self._pooled is not None else {}
+            return self
+
+    @property
+    def statement_cache(self):
+        """The prepared statement cache (a StatementCache) of the current connection, or None if not connected."""
+
+        if self._connection_info is None:
+            return None
+
+        cache = self._connection_info.get("statement_cache")
+        if cache is None:
+            cache = self._connection_info["statement_cache"] = StatementCache(
+                self.statement_cache_size, on_evict=self._statement_evictor()
+            )
+        return cache
+
+    def _statement_evictor(self):
+        """Returns the function that releases an evicted prepared statement in the database.
+        It only references the connection, since the cache may outlive this tool in a pool."""
+
+        connection = self.connection
+
+        if self.sql_type == "SQLite":
+            return None
+
+        elif self.sql_type == "MySQL":
+            return lambda sql, prepared_cursor: prepared_cursor.close()
+
+        else:  # PostgreSQL and RedShift
+            def deallocate(sql, statement):
+                if statement in (_SEEN_STATEMENT, _UNPREPARABLE_STATEMENT):
+                    return
+                name, _ = statement
+                cursor = connection.cursor()
+                try:
+                    cursor.execute(f"DEALLOCATE {name}")
+                finally:
+                    cursor.close()
+
+            return deallocate
+
+    def _execute(self, sql, params=None):
+        """Executes sql with the given parameters, using a prepared statement from the cache when possible.
+        Returns the cursor with the results."""
+
+        if params is None:
+            self.cursor.execute(sql)
+            return self.cursor
+
+        if self.statement_cache_size <= 0:
+            self.cursor.execute(sql, params)
+            return self.cursor
+
+        cache = self.statement_cache
+
+        if self.sql_type == "SQLite":
+            # sqlite3 keeps the compiled statements itself (see cached_statements), the cache only tracks them
+            if cache.get(sql) is None:
+                cache.put(sql, sql)
+            self.cursor.execute(sql, params)
+            return self.cursor
+
+        elif self.sql_type == "MySQL":
+            # A prepared cursor keeps the last statement it executed prepared, so there's one for each statement
+            prepared_cursor = cache.get(sql)
+            if prepared_cursor is None:
+                prepared_cursor = self.connection.cursor(prepared=True)
+                cache.put(sql, prepared_cursor)
+            prepared_cursor.execute(sql, params)
+            return prepared_cursor
+
+        else:  # PostgreSQL and RedShift
+            statement = cache.get(sql)
+            if statement is None:
+                # A statement run only once isn't worth the extra round trip, so it's only prepared when it runs again
+                cache.put(sql, _SEEN_STATEMENT)
+            elif statement is _SEEN_STATEMENT:
+                statement = self._prepare(sql)
+                cache.put(sql, statement)
+
+            if statement in (None, _SEEN_STATEMENT, _UNPREPARABLE_STATEMENT):
+                self.cursor.execute(sql, params)
+                return self.cursor
+
+            name, keys = statement
+            if keys:
+                values = [params[key] for key in keys]
+                self.cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(values))})", values)
+            else:
+                self.cursor.execute(f"EXECUTE {name}")
+            return self.cursor
+
+    def _prepare(self, sql):
+        """Prepares a PostgreSQL or RedShift statement and returns its name and parameter keys.
+
+        Some statements that psycopg2 binds in the client can't be prepared, like the ones with parameters
+        whose type PostgreSQL can't infer (SELECT %s) or with tuples (IN %s). A failed PREPARE aborts the
+        transaction, so it runs in a savepoint, and the statement is marked to always run without PREPARE.
+        RedShift has no savepoints, so there it's only prepared when no transaction would be lost.
+        """
+
+        import psycopg2
+        from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+        idle = self.connection.autocommit or self.connection.get_transaction_status() == TRANSACTION_STATUS_IDLE
+        if not idle and self.sql_type != "PostgreSQL":
+            return _SEEN_STATEMENT
+
+        name = f"instackup_{uuid.uuid4().hex}"
+        numbered_sql, keys = _numbered_placeholders(sql)
+
+        if not idle:
+            self.cursor.execute("SAVEPOINT instackup_prepare")
+        try:
+            self.cursor.execute(f"PREPARE {name} AS {numbered_sql}")
+        except psycopg2.Error:
+            logger.debug("Statement can't be prepared, running it without PREPARE: %s", sql, exc_info=True)
+            if not idle:
+                self.cursor.execute("ROLLBACK TO SAVEPOINT instackup_prepare")
+            elif not self.connection.autocommit:
+                self.connection.rollback()
+            return _UNPREPARABLE_STATEMENT
+
+        if not idle:
+            self.cursor.execute("RELEASE SAVEPOINT instackup_prepare")
+        return (name, keys)
+
+    def _new_session(self):
+        """Returns a copy of this tool with a connection of its own, so it can be used by another thread."""
+
+        tool = copy.copy(self)
+        tool.connection = None
+        tool.cursor = None
+        tool._pooled = None
+        tool._connection_info = None
+        tool._worker_session = True
+        tool._in_transaction = False
+        return tool.connect()
+
+    def _run_in_sessions(self, function, items, max_workers):
+        """Calls function(tool, item) for each item in up to max_workers threads, each thread using
+        a tool (and connection) of its own. Returns the results in the same order as the items."""
+
+        local = threading.local()
+        sessions = []
+        sessions_lock = threading.Lock()
+
+        def run(item):
+            tool = getattr(local, "tool", None)
+            if tool is None:
+                tool = local.tool = self._new_session()
+                with sessions_lock:
+                    sessions.append(tool)
+            return function(tool, item)
+
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="instackup") as executor:
+                return list(executor.map(run, items))
+        finally:
+            for tool in sessions:
+                tool.close_connection()
+
+    def commit(self):
+        """Commit any pending transaction to the database."""
+        self.connection.commit()
+        self._in_transaction = False
+        logger.info("Transaction commited.")
+
+    def rollback(self):
+        """Roll back to the start of any pending transaction."""
+        self.connection.rollback()
+        self._in_transaction = False
+
+        # A statement timeout set in the transaction is rolled back too (in PostgreSQL)
+        self._forget_statement_timeout()
+        logger.info("Roll back current transaction.")
+
+    def _forget_statement_timeout(self):
+        """Marks the statement timeout of the session as unknown, so it's sent again before the next statement."""
+
+        if self._connection_info is not None and "statement_timeout" in self._connection_info:
+            self._connection_info["statement_timeout"] = _UNKNOWN_TIMEOUT
+
+    @contextlib.contextmanager
+    def _statement_timeout(self, timeout):
+        """Limits the statements run inside the with block to timeout seconds (or statement_timeout
+        attribute, if None). Server databases keep the setting in the session, so it's only sent
+        when it changes; SQLite checks the time from a progress handler."""
+
+        if timeout is None:
+            timeout = self.statement_timeout
+
+        if self.sql_type == "SQLite":
+            if timeout is not None:
+                deadline = time.monotonic() + timeout
+                # A true return value interrupts the statement, every 1000 virtual machine instructions
+                self.connection.set_progress_handler(lambda: time.monotonic() > deadline, 1000)
+            try:
+                yield
+            finally:
+                if timeout is not None:
+                    self.connection.set_progress_handler(None, 1000)
+            return
+
+        if timeout != self._connection_info.get("statement_timeout"):
+            value = "DEFAULT" if timeout is None else max(int(timeout * 1000), 1)
+            if self.sql_type == "MySQL":
+                # Only applies to SELECT statements
+                self.cursor.execute(f"SET SESSION max_execution_time = {value}")
+            else:  # PostgreSQL and RedShift
+                self.cursor.execute(f"SET statement_timeout = {value}")
+            self._connection_info["statement_timeout"] = timeout
+
+        yield
+
+    def cancel(self):
+        """Cancels the statement running in this tool, from another thread. The canceled call raises
+        the database error for it (and, in PostgreSQL, the transaction must be rolled back).
+        Does nothing if no statement is running."""
+
+        tool = self._replica_session or self
+        connection = tool.connection
+        if connection is None:
+            return
+
+        if tool.sql_type == "SQLite":
+            connection.interrupt()
+
+        elif tool.sql_type == "MySQL":
+            # MySQL only kills a statement from another connection
+            import mysql.connector
+
+            killer = mysql.connector.connect(**tool.connection_parameters)
+            try:
+                killer.cursor().execute(f"KILL QUERY {connection.connection_id}")
+            finally:
+                killer.close()
+
+        else:  # PostgreSQL and RedShift
+            connection.cancel()
+
+        logger.info("Statement cancel requested.")
+
+    def _explain(self, sql, params, analyze):
+        """Returns the plan of a query as text, or None if it can't be explained."""
+
+        if self.sql_type == "SQLite":
+            prefix = "EXPLAIN QUERY PLAN "
+        elif analyze:
+            prefix = "EXPLAIN ANALYZE "
+        else:
+            prefix = "EXPLAIN "
+
+        # A failed statement aborts the whole transaction in PostgreSQL, unless it's in a savepoint
+        savepoint = self.sql_type == "PostgreSQL"
+
+        cursor = self.connection.cursor()
+        try:
+            if savepoint:
+                cursor.execute("SAVEPOINT instackup_explain")
+            try:
+                if params is None:
+                    cursor.execute(prefix + sql)
+                else:
+                    cursor.execute(prefix + sql, params)
+                rows = cursor.fetchall()
+            except _database_errors(self.sql_type):
+                logger.warning("Failed to explain slow query.", exc_info=True)
+                if savepoint:
+                    cursor.execute("ROLLBACK TO SAVEPOINT instackup_explain")
+                return None
+            finally:
+                if savepoint:
+                    cursor.execute("RELEASE SAVEPOINT instackup_explain")
+        finally:
+            cursor.close()
+
+        return "\n".join(str(row[0]) if len(row) == 1 else " | ".join(str(value) for value in row) for row in rows)
+
+    def _log_if_slow(self, sql, params, seconds, rows):
+        """Records a statement in the slow query log, if it's set and the statement took long enough."""
+
+        log = self.slow_query_log
+        if log is None or seconds < log.threshold:
+            return
+
+        # Read before EXPLAIN, which could run the statement again
+        query_id = self._statement_id()
+
+        plan = None
+        if log.explain and _is_read_only(sql):
+            plan = self._explain(sql, params, log.analyze)
+
+        log.record(sql, seconds, rows=rows, params=params, connection=self._pool_key(), plan=plan, query_id=query_id)
+
+    def _statement_started(self):
+        """Called at the start of the query and execute_sql methods, before the statement runs (see RedShiftTool)."""
+        pass
+
+    def _statement_id(self):
+        """ID the database gave to the last statement, if it has one (see RedShiftTool)."""
+        return None
+
+    def _query_replica(self, sql_query, fetch_as, fail_silently, params, timeout=None):
+        """Runs a read-only query in one of the read replicas, with a connection borrowed for this query only.
+
+        A replica whose connection fails is ejected from the rotation and the query is tried in another one.
+        If all replicas are ejected, the query runs in the primary.
+        """
+
+        replica_set = get_replica_set(self._pool_key(), self._replicas)
+
+        for _ in range(len(self._replicas)):
+            index = replica_set.choose()
+            if index is None:
+                break
+
+            session = copy.copy(self)
+            session.connection_parameters = replica_set.replicas[index]
+            session._replica_index = index
+            session.connection = None
+            session.cursor = None
+            session._pooled = None
+            session._connection_info = None
+
+            start = time.perf_counter()
+            try:
+                session.connect()
+                self._replica_session = session
+                result = session._query(sql_query, fetch_as, False, params, timeout)
+
+            except Exception as e:
+                self._replica_session = None
+                connection_failed = _is_connection_failure(self.sql_type, e)
+
+                if session._pooled is not None:
+                    session._pooled.pool.release(session._pooled, discard=connection_failed)
+                elif session.connection is not None:
+                    session.connection.close()
+
+                if not connection_failed:
+                    if not fail_silently:
+                        raise e
+                    logger.error("ATENTION: Failing Silently")
+                    return None
+
+                replica_set.eject(index)
+                add_retry()
+                continue
+
+            self._replica_session = None
+            session.close_connection()
+            replica_set.record_read(index, time.perf_counter() - start)
+            logger.debug("Query ran in replica %s.", index)
+            return result
+
+        logger.warning("No read replica available. Running query in the primary.")
+        return self._query(sql_query, fetch_as, fail_silently, params, timeout)
+
+    def execute_sql(self, command, fail_silently=False, params=None, timeout=None):
+        """Execute a SQL command (CREATE, UPDATE and DROP).
+
+        params parameter is a sequence or dictionary of values bound to the placeholders in command,
+        in the database driver style: ? or :name in SQLite and %s or %(name)s in the others.
+        Commands with parameters are prepared once per connection and reused (see statement_cache).
+        In PostgreSQL and RedShift, they're only prepared when they run for the second time.
+        timeout parameter limits how many seconds the command can run (statement_timeout attribute, if None).
+        In MySQL, it only limits SELECT statements.
+
+        If fail_silently parameter is set to True, any errors will be surpressed
+        and not stop the code execution.
+        """
+
+        self._statement_started()
+
+        # Reads that follow a write see it, by running in the primary until the transaction ends
+        self._in_transaction = True
+
+        start = time.perf_counter()
+        try:
+            with self._statement_timeout(timeout):
+                cursor = self._execute(command, params)
+            logger.debug("Command Executed: %s", command)
+            self._log_if_slow(command, params, time.perf_counter() - start, cursor.rowcount)
+
+            if self.result_cache is not None:
+                self.result_cache.invalidate_for_command(command, connection=self._pool_key())
+            if _SCHEMA_CHANGE.match(command):
+                _catalogs.pop(self._catalog_key(), None)
+
+            # Rows affected by INSERT, UPDATE and DELETE commands (-1 for other commands)
+            if cursor.rowcount > 0:
+                add_rows(cursor.rowcount)
+
+        except _database_errors(self.sql_type) as e:
+            logger.exception("Error running command!")
+
+            if not fail_silently:
+                raise e
+            else:
+                logger.error("ATENTION: Failing Silently")
+
+    def query(self, sql_query, fetch_through_pandas=True, fail_silently=False, params=None, fetch_as=None, timeout=None):
+        """Run a query and return the results.
+
+        fetch_through_pandas parameter tells if the query should be parsed by the cursor or pandas.
+        fetch_as parameter, if given, sets the result format instead: "pandas", "tuples", "arrow" (a pyarrow
+        Table, with typed columns built straight from the cursor rows) or "pandas_arrow" (a DataFrame
+        backed by that Arrow Table, with pandas.ArrowDtype columns).
+        params parameter is a sequence or dictionary of values bound to the placeholders in sql_query,
+        in the database driver style: ? or :name in SQLite and %s or %(name)s in the others.
+        Queries with parameters are prepared once per connection and reused (see statement_cache).
+        In PostgreSQL and RedShift, they're only prepared when they run for the second time.
+        timeout parameter limits how many seconds the query can run (statement_timeout attribute, if None).
+        If fail_silently parameter is set to True, any errors will be surpressed
+        and not stop the code execution.
+
+        If slow_query_log attribute is set, queries that take longer than its threshold are recorded in it.
+        If result_cache attribute is set, results of read-only queries are served from it when possible,
+        and queries that write (like INSERT ... RETURNING) invalidate the results of the tables they write.
+        If read_from_replicas attribute is set, read-only queries run in one of the read replicas, unless
+        a write (execute_sql, bulk_insert or a query that isn't read-only) wasn't committed or rolled back yet.
+
+        Returns either a DataFrame (if fetch_through_pandas parameter is set to True)
+        or a list of tuples, each representing a row, with their position in the same order
+        as in the columns of the SELECT statement in the sql_query parameter.
+        """
+
+        self._statement_started()
+
+        fetch_as = _fetch_format(fetch_as, fetch_through_pandas)
+        read_only = _is_read_only(sql_query)
+
+        if not read_only:
+            self._in_transaction = True
+            result = self._query(sql_query, fetch_as, fail_silently, params, timeout)
+
+            # Writes with results (e.g. INSERT ... RETURNING) invalidate the tables written, as in execute_sql
+            if result is not None and self.result_cache is not None:
+                self.result_cache.invalidate_for_command(sql_query, connection=self._pool_key())
+            return result
+
+        if self.read_from_replicas and self._replicas and not self._in_transaction:
+            run_query = self._query_replica
+        else:
+            run_query = self._query
+
+        cache = self.result_cache
+        if cache is None:
+            return run_query(sql_query, fetch_as, fail_silently, params, timeout)
+
+        key = cache.make_key(self._pool_key(), sql_query, params, fetch_as)
+        result = cache.get(key)
+        if result is not None:
+            logger.debug("Query result served from cache: %s", sql_query)
+            return result
+
+        result = run_query(sql_query, fetch_as, fail_silently, params, timeout)
+        if result is not None:
+            cache.put(key, result, tables=_table_names(_READ_TABLES, sql_query), connection=self._pool_key())
+        return result
+
+    def _query(self, sql_query, fetch_as, fail_silently, params, timeout=None):
+        """Runs a query without the result cache. See query method."""
+
+        # Eliminating SQL table quotes that can't be handled by PostgreSQL
+        sql_query = sql_query.replace("`", "")
+
+        errors = _database_errors(self.sql_type)
+        if fetch_as == "pandas" and params is None:
+            import pandas as pd
+            errors += (pd.io.sql.DatabaseError,)
+
+        start = time.perf_counter()
+        try:
+            with self._statement_timeout(timeout):
+                result = self._fetch_result(sql_query, fetch_as, params)
+
+        except errors as e:
+            logger.exception("Error running query!")
+
+            if not fail_silently:
+                raise e
+            else:
+                logger.error("ATENTION: Failing Silently")
+                return None
+
+        self._log_if_slow(sql_query, params, time.perf_counter() - start, len(result))
+        return result
+
+    def _fetch_result(self, sql_query, fetch_as, params):
+        """Runs a query and returns its results in the fetch_as format."""
+
+        if fetch_as == "pandas" and params is None:
+            import pandas as pd
+            return pd.read_sql_query(sql_query, self.connection)
+
+        cursor = self._execute(sql_query, params)
+        logger.debug("Query Executed: %s", sql_query)
+
+        if fetch_as in ("arrow", "pandas_arrow"):
+            # Fetching in batches, so the rows as Python objects and as Arrow arrays are never all in memory
+            result = _arrow_table(self._fetch_arrow(cursor, _ARROW_FETCH_SIZE))
 
-        self.sql_type = sql_type
+            if fetch_as == "pandas_arrow":
+                import pandas as pd
+                result = result.to_pandas(types_mapper=pd.ArrowDtype)
+            return result
 
-        # SQLite
-        self.filename = filename
+        result = cursor.fetchall()
 
-        # PostgreSQL and others
-        self.connection_parameters = sql_credentials
+        if fetch_as == "pandas":
+            import pandas as pd
 
-        # Attibutes ready to be set in connection
-        self.connection = None
-        self.cursor = None
+            columns = [column[0] for column in cursor.description]
+            result = pd.DataFrame.from_records(result, columns=columns, coerce_float=True)
 
-    def connect(self, fail_silently=False):
-        """Create the connection using the __init__ attributes.
+        return result
+
+    def _stream_cursor(self, chunksize):
+        """Opens a cursor that gets the rows from the database as they're fetched, instead of all at once."""
+
+        if self.sql_type == "SQLite":
+            # SQLite cursors already step through the results one row at a time
+            return self.connection.cursor()
+
+        elif self.sql_type == "MySQL":
+            return self.connection.cursor(buffered=False)
+
+        else:  # PostgreSQL and RedShift
+            # Named cursors are server-side cursors, which send the rows in batches of itersize
+            cursor = self.connection.cursor(name=f"instackup_stream_{uuid.uuid4().hex}")
+            cursor.itersize = chunksize
+            return cursor
+
+    def _close_stream_cursor(self, cursor):
+        try:
+            cursor.close()
+        except _database_errors(self.sql_type):
+            # MySQL refuses to close an unbuffered cursor with rows left to read, so they're discarded first
+            self.connection.consume_results()
+            cursor.close()
+
+    def _fetch_arrow(self, cursor, chunksize):
+        """Yields the rows of an executed cursor as pyarrow RecordBatches of up to chunksize rows.
+        A result without rows yields a single empty batch, so its columns are still known.
+
+        Columns get their types from the cursor description when the driver gives them
+        (PostgreSQL and MySQL); otherwise, from their values in the first batch.
+        """
+
+        types = None
+        while True:
+            rows = cursor.fetchmany(chunksize)
+            if not rows and types is not None:
+                return
+
+            if types is None:
+                # Named cursors only have a description after the first fetch
+                names = [column[0] for column in cursor.description]
+                types = _arrow_types(self.sql_type, cursor.description)
+
+            yield _arrow_batch(rows, names, types)
+
+            if not rows:
+                return
+
+    def stream_query(self, sql_query, chunksize=10000, fetch_through_pandas=True, fail_silently=False, params=None, fetch_as=None):
+        """Run a query and return a generator of its results, in chunks of up to chunksize rows.
+        Only one chunk is held in memory at a time, no matter how many rows the query returns.
+
+        fetch_through_pandas parameter tells if each chunk should be a DataFrame or a list of tuples.
+        fetch_as parameter, if given, sets the format of each chunk instead, as in the query method,
+        with "arrow" chunks being pyarrow RecordBatches. Arrow results without rows yield one empty chunk.
+        params parameter works as in the query method, but the query isn't prepared.
+        If fail_silently parameter is set to True, any errors will be surpressed
+        and not stop the code execution; in that case, an empty generator is returned.
 
+        The query runs in a cursor of its own, which is closed when the generator is exhausted or closed,
+        so other queries can run while it's consumed (except in MySQL, which can't run another query
+        in the same connection until all rows are read).
+        """
+
+        fetch_as = _fetch_format(fetch_as, fetch_through_pandas)
+
+        # Eliminating SQL table quotes that can't be handled by PostgreSQL
+        sql_query = sql_query.replace("`", "")
+
+        cursor = self._stream_cursor(chunksize)
+        try:
+            if params is None:
+                cursor.execute(sql_query)
+            else:
+                cursor.execute(sql_query, params)
+            logger.debug("Query Executed: %s", sql_query)
+
+        except _database_errors(self.sql_type) as e:
+            logger.exception("Error running query!")
+            self._close_stream_cursor(cursor)
+
+            if not fail_silently:
+                raise e
+            else:
+                logger.error("ATENTION: Failing Silently")
+                return iter(())
+
+        if fetch_as in ("pandas", "pandas_arrow"):
+            import pandas as pd
+
+        def fetch_chunks_as_generator(cursor):
+            try:
+                if fetch_as == "arrow":
+                    yield from self._fetch_arrow(cursor, chunksize)
+
+                elif fetch_as == "pandas_arrow":
+                    for batch in self._fetch_arrow(cursor, chunksize):
+                        yield batch.to_pandas(types_mapper=pd.ArrowDtype)
+
+                else:
+                    while True:
+                        rows = cursor.fetchmany(chunksize)
+                        if not rows:
+                            break
+
+                        if fetch_as == "pandas":
+                            # Named cursors only have a description after the first fetch
+                            columns = [column[0] for column in cursor.description]
+                            yield pd.DataFrame.from_records(rows, columns=columns)
+                        else:
+                            yield rows
+            finally:
+                self._close_stream_cursor(cursor)
+
+        return fetch_chunks_as_generator(cursor)
+
+    def query_to_parquet(self, sql_query, destination, chunksize=100000, compression="snappy", fail_silently=False, params=None):
+        """Run a query and write its results to a Parquet file, straight from Arrow batches of up to
+        chunksize rows (one row group each), without going through pandas. Only one batch is held
+        in memory at a time, no matter how many rows the query returns.
+
+        destination parameter is either a file path or a binary file object.
+        compression parameter is passed to pyarrow: "snappy", "gzip", "zstd", None, etc.
+        params parameter works as in the stream_query method.
         If fail_silently parameter is set to True, any errors will be surpressed
         and not stop the code execution.
+
+        Column types are the same as in the query method with fetch_as="arrow". A column whose values
+        are all null in the first batch can't have values in the later ones.
+
+        Returns the amount of rows written.
         """
 
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        rows = 0
+        writer = None
         try:
-            if self.sql_type == "SQLite":
-                conn = sqlite3.connect(self.filename)
+            for batch in self.stream_query(sql_query, chunksize=chunksize, params=params, fetch_as="arrow"):
+                if writer is None:
+                    writer = pq.ParquetWriter(destination, batch.schema, compression=compression)
+                writer.write_batch(batch)
+                rows += batch.num_rows
+                add_rows(batch.num_rows)
+
+        except _database_errors(self.sql_type) + (pa.ArrowException, ValueError) as e:
+            logger.exception("Error writing query results to Parquet!")
 
-            elif self.sql_type == "MySQL":
-                conn = mysql.connector.connect(**self.connection_parameters)
+            if not fail_silently:
+                raise e
+            else:
+                logger.error("ATENTION: Failing Silently")
 
-            else:  # PostgreSQL
-                conn = psycopg2.connect(**self.connection_parameters)
+        finally:
+            if writer is not None:
+                writer.close()
 
-            logger.info("Connected!")
-        except (sqlite3.Error, psycopg2.Error, mysql.connector.Error) as e:
-            print('Failed to open database connection.')
-            logger.exception('Failed to open database connection.')
+        logger.info("%s rows written to Parquet.", rows)
+        return rows
+
+    def extract_incremental(self, table, column, store, key=None, chunksize=10000, columns=None, where=None, params=None,
+                            fetch_through_pandas=True, fetch_as=None, fail_silently=False):
+        """Returns a generator of IncrementalBatch objects with the rows of table added (or updated) since the last
+        extraction, i.e. the ones whose column value is greater than the watermark saved in store.
+
+        column parameter must be a column whose value only grows for new or updated rows, like an id or an updated_at.
+        store parameter is where the watermark is kept: a JSONWatermarkStore, a SQLiteWatermarkStore or any object
+        with the same get and set methods. key parameter identifies the extraction in it; by default,
+        it's made from the database, the table and the column.
+
+        Rows are streamed (as in stream_query) ordered by column, in batches of about chunksize rows. Rows sharing
+        the last value of a batch are moved to the next one, so a batch never ends in the middle of a value.
+        The watermark only advances when commit is called on a batch, after its rows were handled; rows of
+        batches not committed are extracted again next time.
+
+        table, column and columns parameters are quoted, so they must be given as they're named in the database
+        (table may include the schema, as in schema.table).
+        columns parameter is the list of columns selected (all, by default). where parameter is an extra
+        SQL condition the rows must match, with its placeholders bound to params parameter (a sequence).
+        The query is always run with bound parameters, so a literal % in where must be written as %%
+        in PostgreSQL, MySQL and RedShift.
+        fetch_through_pandas and fetch_as parameters set the format of each batch data, as in the query method.
+
+        If fail_silently parameter is set to True, any errors will be surpressed
+        and not stop the code execution; in that case, an empty generator is returned.
+        """
+
+        fetch_as = _fetch_format(fetch_as, fetch_through_pandas)
+        if key is None:
+            key = "/".join(str(part) for part in self._pool_key()) + f"/{table}.{column}"
+
+        if columns is not None and column not in columns:
+            columns = list(columns) + [column]
+        select = "*" if columns is None else ", ".join(_quote_identifier(self.sql_type, name) for name in columns)
+        quoted_column = _quote_identifier(self.sql_type, column)
+
+        watermark = store.get(key)
+        placeholder = "?" if self.sql_type == "SQLite" else "%s"
+        if watermark is None:
+            conditions, query_params = [f"{quoted_column} IS NOT NULL"], []
+        else:
+            conditions, query_params = [f"{quoted_column} > {placeholder}"], [watermark]
+        if where is not None:
+            conditions.append(f"({where})")
+            query_params.extend(params or ())
+
+        sql_query = (
+            f"SELECT {select} FROM {_quote_table(self.sql_type, table)} "
+            f"WHERE {' AND '.join(conditions)} ORDER BY {quoted_column}"
+        )
+        logger.info("Extracting %s rows with %s after %s.", table, column, watermark)
+
+        cursor = self._stream_cursor(chunksize)
+        try:
+            # Always bound (even without parameters), so a % in where is escaped the same way in every run
+            cursor.execute(sql_query, query_params)
+            logger.debug("Query Executed: %s", sql_query)
+
+        except _database_errors(self.sql_type) as e:
+            logger.exception("Error running query!")
+            self._close_stream_cursor(cursor)
 
             if not fail_silently:
                 raise e
             else:
                 logger.error("ATENTION: Failing Silently")
+                return iter(())
+
+        if fetch_as in ("pandas", "pandas_arrow"):
+            import pandas as pd
+
+        def make_batch(rows, names, index, types):
+            if fetch_as == "pandas":
+                data = pd.DataFrame.from_records(rows, columns=names)
+            elif fetch_as == "tuples":
+                data = rows
+            else:
+                data = _arrow_batch(rows, names, types)
+                if fetch_as == "pandas_arrow":
+                    data = data.to_pandas(types_mapper=pd.ArrowDtype)
+
+            return IncrementalBatch(data, len(rows), rows[-1][index], store, key)
+
+        def fetch_batches_as_generator(cursor):
+            try:
+                pending = []
+                names = index = types = None
+                while True:
+                    rows = cursor.fetchmany(chunksize)
+                    if not rows:
+                        break
+
+                    if names is None:
+                        # Named cursors only have a description after the first fetch
+                        names = [description[0] for description in cursor.description]
+                        index = [name.lower() for name in names].index(column.strip('"`').split(".")[-1].lower())
+                        types = _arrow_types(self.sql_type, cursor.description) if fetch_as in ("arrow", "pandas_arrow") else None
+
+                    pending.extend(rows)
+                    if len(rows) < chunksize:
+                        # A short fetch means there are no rows left
+                        break
+
+                    # Rows with the last value may continue in the next fetch, so they're held back
+                    last_value = pending[-1][index]
+                    cut = len(pending)
+                    while cut > 0 and pending[cut - 1][index] == last_value:
+                        cut -= 1
+
+                    if cut > 0:
+                        yield make_batch(pending[:cut], names, index, types)
+                        pending = pending[cut:]
+
+                if pending:
+                    yield make_batch(pending, names, index, types)
+            finally:
+                self._close_stream_cursor(cursor)
+
+        return fetch_batches_as_generator(cursor)
+
+    def _insert_batch(self, table, columns, batch):
+        """Inserts a list of rows in table, in the fastest way supported by the database."""
+
+        columns_sql = f" ({', '.join(columns)})" if columns else ""
+
+        if self.sql_type == "PostgreSQL":
+            buffer = io.StringIO()
+            buffer.writelines("\t".join([_copy_text(value) for value in row]) + "\n" for row in batch)
+            buffer.seek(0)
+            self.cursor.copy_expert(f"COPY {table}{columns_sql} FROM STDIN", buffer)
+
         else:
-            self.connection = conn
-            self.cursor = self.connection.cursor()
-            return self
+            # MySQL connector rewrites executemany INSERTs into a single multi-row INSERT
+            placeholder = "?" if self.sql_type == "SQLite" else "%s"
+            placeholders = ", ".join([placeholder] * len(batch[0]))
+            self.cursor.executemany(f"INSERT INTO {table}{columns_sql} VALUES ({placeholders})", batch)
 
-    def commit(self):
-        """Commit any pending transaction to the database."""
-        self.connection.commit()
-        logger.info("Transaction commited.")
+    def bulk_insert(self, data, table, columns=None, batch_size=10000, commit=True, fail_silently=False):
+        """Inserts many rows in a table at once, using COPY FROM STDIN in PostgreSQL
+        and executemany (a multi-row INSERT in MySQL) in the other databases.
 
-    def rollback(self):
-        """Roll back to the start of any pending transaction."""
-        self.connection.rollback()
-        logger.info("Roll back current transaction.")
+        data parameter can be a DataFrame or any iterable (including generators) of tuples or lists,
+        each with one value per column. Missing values (None, NaN and NaT) are inserted as NULL.
+        columns parameter is the list of table columns the values are inserted into;
+        if not set, the DataFrame columns are used, or all table columns in their order.
 
-    def execute_sql(self, command, fail_silently=False):
-        """Execute a SQL command (CREATE, UPDATE and DROP).
+        Rows are read from data and inserted in batches of batch_size, so data doesn't need to fit in memory.
+        If commit parameter is True, each batch is committed after it's inserted; otherwise,
+        committing (or rolling back) all of them is left to the caller.
 
         If fail_silently parameter is set to True, any errors will be surpressed
         and not stop the code execution.
+
+        Returns the amount of rows inserted.
         """
 
+        columns, rows = _insert_rows(data, columns)
+        inserted = 0
+        self._in_transaction = True
+
         try:
-            self.cursor.execute(command)
-            logger.debug(f"Command Executed: {command}")
+            while True:
+                batch = list(itertools.islice(rows, batch_size))
+                if not batch:
+                    break
 
-        except (sqlite3.Error, psycopg2.Error, mysql.connector.Error) as e:
-            logger.exception("Error running command!")
+                self._insert_batch(table, columns, batch)
+                if commit:
+                    self.commit()
+
+                inserted += len(batch)
+                logger.debug("%s rows inserted in %s.", inserted, table)
+
+        except _database_errors(self.sql_type) as e:
+            logger.exception("Error inserting rows!")
 
             if not fail_silently:
                 raise e
             else:
                 logger.error("ATENTION: Failing Silently")
 
-    def query(self, sql_query, fetch_through_pandas=True, fail_silently=False):
-        """Run a query and return the results.
+        if inserted and self.result_cache is not None:
+            self.result_cache.invalidate([table], connection=self._pool_key())
+
+        add_rows(inserted)
+        return inserted
+
+    def _catalog_key(self):
+        """Key of the cached SchemaCatalog of the database."""
+
+        if self.sql_type == "SQLite" and self.filename == ":memory:":
+            # Each connection to an in-memory database has a database of its own
+            return (self.sql_type, self.filename, id(self.connection))
+        return self._pool_key()
+
+    def _catalog_query(self):
+        """Returns the query that reads the whole schema, with the rows described in SchemaCatalog."""
+
+        try:
+            return _CATALOG_QUERIES[self.sql_type]
+        except KeyError:
+            raise ValueError(f"Schema catalog not available for {self.sql_type}. Databases available: {list(_CATALOG_QUERIES)}")
+
+    @property
+    def _catalog_default_schema(self):
+        """Schema looked up by the catalog when a table name doesn't include one."""
+        return _CATALOG_DEFAULT_SCHEMAS.get(self.sql_type)
+
+    def get_catalog(self, refresh=False, fail_silently=False):
+        """Returns a SchemaCatalog with the columns, primary keys and indexes of all tables, read with a single query.
+
+        The catalog is cached for the whole process and shared by all tools connected to the same database.
+        It's read again after catalog_ttl seconds, after a CREATE, ALTER, DROP or RENAME command
+        is run with execute_sql, or if refresh parameter is True. It's always read from the primary database,
+        without the result_cache.
 
-        fetch_through_pandas parameter tells if the query should be parsed by the cursor or pandas.
         If fail_silently parameter is set to True, any errors will be surpressed
         and not stop the code execution.
-
-        Returns either a DataFrame (if fetch_through_pandas parameter is set to True)
-        or a list of tuples, each representing a row, with their position in the same order
-        as in the columns of the SELECT statement in the sql_query parameter.
         """
 
-        # Eliminating SQL table quotes that can't be handled by PostgreSQL
-        sql_query = sql_query.replace("`", "")
+        key = self._catalog_key()
+        catalog = _catalogs.get(key)
+        if catalog is not None and not refresh and catalog.age() < self.catalog_ttl:
+            return catalog
 
-        if fetch_through_pandas:
-            try:
-                result = pd.read_sql_query(sql_query, self.connection)
+        try:
+            catalog_query = self._catalog_query()
+        except ValueError as e:
+            logger.exception("Error reading the schema catalog!")
 
-            except (sqlite3.Error, psycopg2.Error, mysql.connector.Error, pd.io.sql.DatabaseError) as e:
-                logger.exception("Error running query!")
-                result = None
+            if not fail_silently:
+                raise e
+            else:
+                logger.error("ATENTION: Failing Silently")
+                return None
 
-                if not fail_silently:
-                    raise e
-                else:
-                    logger.error("ATENTION: Failing Silently")
+        # Read from the primary without the result cache, so a refresh sees the current schema
+        self._statement_started()
+        rows = self._query(catalog_query, "tuples", fail_silently, None)
+        if rows is None:
+            return None
 
-        else:
-            try:
-                self.cursor.execute(sql_query)
-                logger.debug(f"Query Executed: {sql_query}")
+        catalog = _catalogs[key] = SchemaCatalog.from_rows(rows, self._catalog_default_schema)
+        logger.debug("Schema catalog read: %s tables.", len(catalog))
+        return catalog
 
-                result = self.cursor.fetchall()
+    def close_connection(self):
+        """Closes Connection with the database.
+        If it was borrowed from the pool, it's given back to it instead."""
 
-            except (sqlite3.Error, psycopg2.Error, mysql.connector.Error) as e:
-                logger.exception("Error running query!")
-                result = None
+        # An in-memory database is gone with its connection
+        if self.sql_type == "SQLite" and self.filename == ":memory:":
+            _catalogs.pop(self._catalog_key(), None)
 
-                if not fail_silently:
-                    raise e
-                else:
-                    logger.error("ATENTION: Failing Silently")
+        # The pool rolls back any pending transaction, which may include a statement timeout set in it
+        self._forget_statement_timeout()
+        self._connection_info = None
+        self._in_transaction = False
 
-        return result
+        if self._pooled is None:
+            self.connection.close()
+            logger.info("Connection closed.")
+            return
 
-    def close_connection(self):
-        """Closes Connection with the database"""
-        self.connection.close()
-        logger.info("Connection closed.")
+        pooled, self._pooled = self._pooled, None
+        discard = False
+        try:
+            self.cursor.close()
+        except _database_errors(self.sql_type):
+            logger.warning("Failed to close cursor. Discarding pooled connection.")
+            discard = True
+
+        pooled.pool.release(pooled, discard=discard)
+        self.connection = None
+        self.cursor = None
+        logger.info("Connection returned to the pool.")
 
     # __enter__ and __exit__ functions for with statement.
     # With statement docs: https://docs.python.org/2.5/whatsnew/pep-343.html
@@ -172,54 +2829,453 @@ class SQLTool(object):
         self.close_connection()
 
 
+# Named sets of PRAGMA settings SQLiteTool applies to every connection it opens (see SQLiteTool.__init__)
+SQLITE_PROFILES = {
+    "default": {},
+    # WAL lets readers run while a write is in progress; NORMAL synchronous can lose the
+    # last transactions on a power loss, but doesn't corrupt the database in WAL mode
+    "fast": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 268435456,  # 256 MiB
+        "cache_size": -65536,  # Negative values are in KiB, so 64 MiB
+        "temp_store": "MEMORY",
+    },
+    "durable": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+    },
+    # For scratch databases that can be rebuilt: a crash in the middle of a write may corrupt them
+    "staging": {
+        "journal_mode": "MEMORY",
+        "synchronous": "OFF",
+        "mmap_size": 268435456,
+        "cache_size": -262144,  # 256 MiB
+        "temp_store": "MEMORY",
+    },
+}
+
+_PRAGMA_NAME = re.compile(r"\w+")
+_PRAGMA_VALUE = re.compile(r"-?\w+")
+
+
+def _sqlite_pragmas(profile, pragmas):
+    """Returns the PRAGMA settings of the profile (a name in SQLITE_PROFILES or a dictionary)
+    updated with pragmas, after checking they can be safely formatted in a statement."""
+
+    if profile is None:
+        profile = "default"
+
+    if isinstance(profile, str):
+        try:
+            settings = dict(SQLITE_PROFILES[profile])
+        except KeyError:
+            raise ValueError(f"Unknown SQLite profile '{profile}'. Options are: {', '.join(SQLITE_PROFILES)}.")
+    else:
+        settings = dict(profile)
+
+    settings.update(pragmas or {})
+
+    for name, value in settings.items():
+        if not _PRAGMA_NAME.fullmatch(str(name)) or not _PRAGMA_VALUE.fullmatch(str(value)):
+            raise ValueError(f"Invalid PRAGMA setting: {name} = {value}")
+
+    return settings
+
+
+@instrument_methods
 class SQLiteTool(SQLTool):
     """This class handle most of the interaction needed with SQLite3 databases,
     so the base code becomes more readable and straightforward."""
 
-    def __init__(self, filename=None):
-        super().__init__("SQLite", filename=filename)
+    # Depth of nested bulk_load blocks. While positive, commit calls are deferred to the end of the outermost one
+    _bulk_load_depth = 0
 
-    def describe_table(self, table, fetch_through_pandas=True, fail_silently=False):
-        """Special query that returns all metadata from a specific table"""
+    def __init__(self, filename=None, use_pool=False, profile=None, pragmas=None):
+        super().__init__("SQLite", filename=filename, use_pool=use_pool)
+        self.pragmas = _sqlite_pragmas(profile, pragmas)
 
-        sql_query = f"""SELECT name FROM sqlite_master WHERE type='{table}';"""
-        return self.query(sql_query, fetch_through_pandas=fetch_through_pandas, fail_silently=fail_silently)
+    def _open_connection(self):
+        connection = super()._open_connection()
+
+        # In-memory databases can't use WAL: SQLite just keeps their "memory" journal mode
+        for name, value in self.pragmas.items():
+            connection.execute(f"PRAGMA {name} = {value}")
+
+        return connection
+
+    def commit(self):
+        """Commit any pending transaction to the database.
+        Inside a bulk_load block, the commit is deferred to the end of the block."""
+
+        if self._bulk_load_depth:
+            logger.debug("Commit deferred to the end of the bulk load.")
+            return
+
+        super().commit()
+
+    @contextlib.contextmanager
+    def bulk_load(self, tables=None, defer_indexes=True):
+        """Context manager that runs all writes made inside it in a single transaction,
+        committed when the block ends (or rolled back, if it raises an exception).
+        Calls to commit inside the block, including the ones made by bulk_insert, are deferred to its end.
+
+        If defer_indexes is True, the indexes of the tables listed in tables parameter (or of all tables,
+        if it's not set) are dropped at the start and created again at the end, so they're built once
+        instead of updated on every row. Violations of a deferred UNIQUE index are only detected
+        at the end, when they make the whole load be rolled back.
+        """
+
+        if self._bulk_load_depth:
+            self._bulk_load_depth += 1
+            try:
+                yield self
+            finally:
+                self._bulk_load_depth -= 1
+            return
+
+        # Starting a new transaction, with any pending changes committed before
+        super().commit()
+        self.cursor.execute("BEGIN")
+        self._in_transaction = True
+        self._bulk_load_depth = 1
+
+        try:
+            indexes = []
+            if defer_indexes:
+                sql_query = "SELECT name, tbl_name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL"
+                self.cursor.execute(sql_query)
+                indexes = [
+                    (name, sql) for name, table, sql in self.cursor.fetchall()
+                    if tables is None or table in tables
+                ]
+
+                for name, _ in indexes:
+                    self.cursor.execute(f'DROP INDEX "{name}"')
+                logger.debug("%s indexes deferred to the end of the bulk load.", len(indexes))
+
+            yield self
+
+            for _, sql in indexes:
+                self.cursor.execute(sql)
+
+        except BaseException:
+            self._bulk_load_depth = 0
+            self.rollback()
+            logger.error("Bulk load rolled back.")
+            raise
+
+        self._bulk_load_depth = 0
+        super().commit()
+        logger.info("Bulk load commited.")
+
+    def backup(self, destination, pages=-1, progress=None, fail_silently=False):
+        """Copies the whole database to destination, which can be a file path or another SQLiteTool,
+        using SQLite online backup API. It's the fast way of saving an in-memory database to disk.
+
+        pages parameter sets how many pages are copied at a time (all at once, by default).
+        If set, progress is called after each step with the status, remaining and total pages.
+
+        If fail_silently parameter is set to True, any errors will be surpressed
+        and not stop the code execution.
+        """
+
+        try:
+            if isinstance(destination, SQLiteTool):
+                self.connection.backup(destination.connection, pages=pages, progress=progress)
+                destination._forget_restored_state()
+            else:
+                target = sqlite3.connect(destination)
+                try:
+                    self.connection.backup(target, pages=pages, progress=progress)
+                finally:
+                    target.close()
+
+            logger.info("Database backed up.")
+
+        except sqlite3.Error as e:
+            logger.exception("Error backing up database!")
+
+            if not fail_silently:
+                raise e
+            else:
+                logger.error("ATENTION: Failing Silently")
+
+    def restore(self, source, pages=-1, progress=None, fail_silently=False):
+        """Replaces the whole database with the content of source, which can be a file path
+        or another SQLiteTool, using SQLite online backup API. It's the fast way of loading
+        a database from disk into an in-memory one, e.g. at startup.
+
+        pages, progress and fail_silently parameters work the same as in the backup method.
+        """
+
+        try:
+            if isinstance(source, SQLiteTool):
+                source.connection.backup(self.connection, pages=pages, progress=progress)
+            else:
+                origin = sqlite3.connect(source)
+                try:
+                    origin.backup(self.connection, pages=pages, progress=progress)
+                finally:
+                    origin.close()
+
+            self._forget_restored_state()
+            logger.info("Database restored.")
+
+        except sqlite3.Error as e:
+            logger.exception("Error restoring database!")
+
+            if not fail_silently:
+                raise e
+            else:
+                logger.error("ATENTION: Failing Silently")
+
+    def _forget_restored_state(self):
+        """Drops the cached results of this database, after its content was replaced by a backup."""
+
+        if self.result_cache is not None:
+            self.result_cache.invalidate(connection=self._pool_key())
+        _catalogs.pop(self._catalog_key(), None)
+
+    def describe_table(self, table, fetch_through_pandas=True, fail_silently=False, use_catalog=False):
+        """Special query that returns all metadata from a specific table.
+
+        If use_catalog parameter is True, the metadata is looked up in the cached schema catalog
+        (see get_catalog) instead, with the columns described in SchemaCatalog.describe."""
+
+        if use_catalog:
+            catalog = self.get_catalog(fail_silently=fail_silently)
+            return None if catalog is None else catalog.describe(table, fetch_through_pandas=fetch_through_pandas)
+
+        sql_query = """SELECT * FROM pragma_table_info(?);"""
+        return self.query(sql_query, fetch_through_pandas=fetch_through_pandas, fail_silently=fail_silently, params=(table,))
 
 
+@instrument_methods
 class MySQLTool(SQLTool):
     """This class handle most of the interaction needed with MySQL databases,
     so the base code becomes more readable and straightforward."""
 
-    def __init__(self, connection='default'):
-        super().__init__("MySQL", connection=connection)
+    def __init__(self, connection='default', use_pool=True, read_from_replicas=False):
+        super().__init__("MySQL", connection=connection, use_pool=use_pool, read_from_replicas=read_from_replicas)
 
-    def describe_table(self, table, fetch_through_pandas=True, fail_silently=False):
-        """Returns all metadata from a specific table"""
+    def describe_table(self, table, fetch_through_pandas=True, fail_silently=False, use_catalog=False):
+        """Returns all metadata from a specific table.
 
+        If use_catalog parameter is True, the metadata is looked up in the cached schema catalog
+        (see get_catalog) instead, with the columns described in SchemaCatalog.describe."""
+
+        if use_catalog:
+            catalog = self.get_catalog(fail_silently=fail_silently)
+            return None if catalog is None else catalog.describe(table, fetch_through_pandas=fetch_through_pandas)
+
+        # Table names can't be bound as parameters
         sql_query = f"DESCRIBE {table}"
         return self.query(sql_query, fetch_through_pandas=fetch_through_pandas, fail_silently=fail_silently)
 
 
+@instrument_methods
 class PostgreSQLTool(SQLTool):
     """This class handle most of the interaction needed with PostgreSQL databases,
     so the base code becomes more readable and straightforward."""
 
-    def __init__(self, connection='default'):
-        super().__init__("PostgreSQL", connection=connection)
+    # Formats of the export method
+    _export_formats = ("csv", "binary")
 
-    def describe_table(self, table, schema="public", fetch_through_pandas=True, fail_silently=False):
-        """Special query that returns all metadata from a specific table"""
+    def __init__(self, connection='default', use_pool=True, read_from_replicas=False):
+        super().__init__("PostgreSQL", connection=connection, use_pool=use_pool, read_from_replicas=read_from_replicas)
 
-        sql_query = f"""SELECT * FROM INFORMATION_SCHEMA.COLUMNS WHERE table_schema='{schema}' AND table_name='{table}'"""
-        return self.query(sql_query, fetch_through_pandas=fetch_through_pandas, fail_silently=fail_silently)
+    def describe_table(self, table, schema="public", fetch_through_pandas=True, fail_silently=False, use_catalog=False):
+        """Special query that returns all metadata from a specific table.
+
+        If use_catalog parameter is True, the metadata is looked up in the cached schema catalog
+        (see get_catalog) instead, with the columns described in SchemaCatalog.describe."""
+
+        if use_catalog:
+            catalog = self.get_catalog(fail_silently=fail_silently)
+            return None if catalog is None else catalog.describe(table, schema, fetch_through_pandas=fetch_through_pandas)
+
+        sql_query = """SELECT * FROM INFORMATION_SCHEMA.COLUMNS WHERE table_schema=%s AND table_name=%s"""
+        return self.query(sql_query, fetch_through_pandas=fetch_through_pandas, fail_silently=fail_silently, params=(schema, table))
+
+    def export(self, query, destination, file_format="csv", compress=False, header=True, fail_silently=False):
+        """Exports the results of a query (or a whole table, if a table name is given) with COPY TO STDOUT,
+        writing the data as it comes from the database, without converting it to Python objects.
+
+        destination parameter can be a file path or a file-like object opened in binary mode
+        (e.g. a file opened with "wb", a BytesIO or a stream to object storage).
+        file_format parameter can be either "csv" or "binary" (PostgreSQL binary COPY format).
+        If compress parameter is True, the data is compressed with gzip on the fly.
+        header parameter sets if the column names are written in the first line (CSV only).
+
+        If fail_silently parameter is set to True, any errors will be surpressed
+        and not stop the code execution.
+
+        Returns the amount of rows exported.
+        """
+
+        file_format = file_format.lower()
+        if file_format not in self._export_formats:
+            raise ValueError(f"Unsupported format {file_format}. Formats available: {list(self._export_formats)}")
+
+        # psycopg2 writes bytes to any file that isn't a text file, so all destinations are opened in binary mode
+        if isinstance(destination, (str, bytes, os.PathLike)):
+            output = gzip.open(destination, "wb") if compress else open(destination, "wb")
+        elif compress:
+            output = gzip.GzipFile(fileobj=destination, mode="wb")
+        else:
+            output = None
+
+        try:
+            rows = self._copy_to(query, output if output is not None else destination, file_format, header)
+
+        except _database_errors(self.sql_type) as e:
+            logger.exception("Error exporting data!")
+            rows = None
+
+            if not fail_silently:
+                raise e
+            else:
+                logger.error("ATENTION: Failing Silently")
 
-    def get_all_db_info(self, get_json_info=True, fetch_through_pandas=True, fail_silently=False):
+        finally:
+            # Closing a GzipFile wrapping a file-like object only writes the gzip trailer, the object remains open
+            if output is not None:
+                output.close()
+
+        if rows is not None and rows > 0:
+            add_rows(rows)
+        return rows
+
+    def _copy_to(self, query, output, file_format="csv", header=True):
+        """Writes the results of a query (or a whole table) to a binary file-like output with COPY TO STDOUT,
+        in a cursor of its own, so it can run in another thread. Returns the amount of rows written."""
+
+        if file_format == "csv":
+            options = f"FORMAT csv, HEADER {str(bool(header)).lower()}"
+        else:  # binary
+            options = "FORMAT binary"
+
+        copy_command = f"COPY {_copy_source(query)} TO STDOUT WITH ({options})"
+        cursor = self.connection.cursor()
+        try:
+            cursor.copy_expert(copy_command, output)
+            logger.debug("Command Executed: %s", copy_command)
+            return cursor.rowcount
+        finally:
+            cursor.close()
+
+    def export_in_chunks(self, query, chunksize=100000, fail_silently=False, **kwargs):
+        """Exports the results of a query (or a whole table) with COPY TO STDOUT and returns
+        a generator of DataFrames of up to chunksize rows, parsed by pandas.read_csv.
+
+        The data is streamed from the database through a pipe, so only about one chunk is held
+        in memory at a time. Any extra kwargs are passed to pandas.read_csv (e.g. parse_dates or dtype).
+
+        If the generator is closed before it's exhausted, the COPY is cancelled and
+        the current transaction must be rolled back before using the connection again.
+
+        If fail_silently parameter is set to True, any errors will be surpressed
+        and not stop the code execution (the generator just stops).
+        """
+
+        import pandas as pd
+
+        errors = []
+
+        def copy_to_pipe(write_fd):
+            try:
+                with os.fdopen(write_fd, "wb") as pipe:
+                    self._copy_to(query, pipe)
+            except Exception as e:
+                errors.append(e)
+
+        def read_chunks_as_generator():
+            read_fd, write_fd = os.pipe()
+            writer = threading.Thread(target=copy_to_pipe, args=(write_fd,), name="instackup-export", daemon=True)
+            writer.start()
+
+            completed = False
+            read_error = None
+            try:
+                with os.fdopen(read_fd, "rb") as pipe:
+                    for chunk in pd.read_csv(pipe, chunksize=chunksize, **kwargs):
+                        yield chunk
+                completed = True
+            except Exception as e:
+                read_error = e
+            finally:
+                # Closing the pipe above makes the COPY fail on its next write, if it's still running
+                if not completed and writer.is_alive():
+                    logger.warning("Export interrupted. Cancelling COPY, the transaction must be rolled back.")
+                    self.connection.cancel()
+                writer.join()
+
+            # A failed COPY closes the pipe, so the error reading it is only a consequence of the COPY error
+            error = errors[0] if errors else read_error
+            if error is None:
+                return
+
+            logger.error("Error exporting data!", exc_info=error)
+            if not fail_silently:
+                if read_error is not None and error is not read_error:
+                    raise error from read_error
+                raise error
+            else:
+                logger.error("ATENTION: Failing Silently")
+
+        return read_chunks_as_generator()
+
+    def _table_row_estimates(self):
+        """Returns the row count estimated by the planner of each table, by (schema, table)."""
+
+        rows = self.query("""
+            SELECT n.nspname, c.relname, c.reltuples
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE c.relkind IN ('r', 'm', 'p')
+        """, fetch_through_pandas=False)
+        return {(schema, table): estimate for schema, table, estimate in rows}
+
+    @staticmethod
+    def _json_keys_query(schema, table, column, json_type, sample_rows=None, sample_percent=None):
+        """Builds the query that returns each key of a json or jsonb column, with the type of its values."""
+
+        def quote(identifier):
+            return '"' + identifier.replace('"', '""') + '"'
+
+        source = f"{quote(schema)}.{quote(table)}"
+        if sample_percent is not None:
+            source += f" TABLESAMPLE SYSTEM ({sample_percent:.6f})"
+        limit = f" LIMIT {int(sample_rows)}" if sample_rows is not None else ""
+
+        return f"""
+            SELECT
+                json_data.key,
+                {json_type}_typeof(json_data.value) AS json_value_data_type,
+                COUNT(*)
+            FROM (
+                SELECT {quote(column)} AS value
+                FROM {source}
+                WHERE {json_type}_typeof({quote(column)}) = 'object'{limit}
+            ) AS sample, {json_type}_each(sample.value) AS json_data
+            GROUP BY 1, 2
+            ORDER BY 1, 2;
+        """
+
+    def get_all_db_info(self, get_json_info=True, fetch_through_pandas=True, fail_silently=False, sample_rows=None, sample_method="tablesample", max_workers=1):
         """Gets all Database info, using a INFORMATION_SCHEMA query.
         Ignore table pg_stat_statements and tables inside schemas pg_catalog and information_schema.
 
         If get_json_info parameter is True, it adds 2 columns with the data types from each key
         inside json and jsonb columns.
 
+        By default, every row of every json and jsonb column is read to find its keys. If sample_rows
+        parameter is set, only up to that many rows of each column are read. sample_method parameter sets
+        how they're chosen: "tablesample" reads random pages of the table (with TABLESAMPLE SYSTEM, sized
+        from the planner row estimate) and "limit" reads the first rows found.
+        max_workers parameter sets how many columns are read at the same time, each in a connection of its own.
+
         fetch_through_pandas and fail_silently parameters are passed directly to the query method if
         get_json_info parameter is set to False; if it's not, these 2 parameters are passed as their default values.
 
@@ -232,52 +3288,57 @@ class PostgreSQLTool(SQLTool):
 
         if not get_json_info:
             return self.query(sql_query, fetch_through_pandas=fetch_through_pandas, fail_silently=fail_silently)
+
+        if sample_method not in ("tablesample", "limit"):
+            raise ValueError(f"Unsupported sample_method {sample_method}. Methods available: ['tablesample', 'limit']")
+
+        import pandas as pd
+
+        df = self.query(sql_query, fetch_through_pandas=True, fail_silently=False)
+
+        # Adding 2 new empty columns for the JSON data
+        col_add_position = df.columns.get_loc("data_type")
+        df.insert(col_add_position + 1, 'json_key', "")
+        df.insert(col_add_position + 2, 'json_value_type', "")
+
+        # Filtering only json and jsonb types for further info lookup
+        df_json = df[df['data_type'].isin(['jsonb', 'json'])]
+
+        row_estimates = {}
+        if sample_rows is not None and sample_method == "tablesample" and not df_json.empty:
+            row_estimates = self._table_row_estimates()
+
+        # One query for each column with json or jsonb data types
+        json_queries = []
+        for schema, table, column, json_type in df_json[['table_schema', 'table_name', 'column_name', 'data_type']].itertuples(index=False):
+            sample_percent = None
+            estimate = row_estimates.get((schema, table), 0)
+            if sample_rows is not None and estimate > sample_rows:
+                # Reading twice the pages needed on average, so the LIMIT is usually reached
+                sample_percent = min(100.0, 200.0 * sample_rows / estimate)
+
+            json_queries.append(self._json_keys_query(schema, table, column, json_type, sample_rows, sample_percent))
+
+        if max_workers > 1 and len(json_queries) > 1:
+            json_results = self._run_in_sessions(
+                lambda tool, json_query: tool.query(json_query, fetch_through_pandas=False, fail_silently=False),
+                json_queries,
+                max_workers,
+            )
         else:
-            df = self.query(sql_query, fetch_through_pandas=True, fail_silently=False)
-
-            # Adding 2 new empty columns for the JSON data
-            num_rows, _ = df.shape
-            col_add_position = df.columns.get_loc("data_type")
-            df.insert(col_add_position + 1, 'json_key', pd.Series(["" for i in range(num_rows)], index=df.index))
-            df.insert(col_add_position + 2, 'json_value_type', pd.Series(["" for i in range(num_rows)], index=df.index))
-
-            # Filtering only json and jsonb types for further info lookup
-            df_json = df[df['data_type'].isin(['jsonb', 'json'])]
-
-            # Creating a empty dictionary list that will be later converted to a DataFrame and
-            # joined with the base information_schema query. It's done that way to improve efficiency
-            json_types_dict = {}
-            for index in df_json.columns.values.tolist():
-                json_types_dict[index] = []
-
-            # Base query for JSON keys and value data type lookup
-            json_query = """
-                SELECT
-                    json_data.key,
-                    {json}_typeof(json_data.value) AS json_value_data_type,
-                    COUNT(*)
-                FROM {schema}.{table}, {json}_each({table}.{column}) AS json_data
-                GROUP BY 1, 2
-                ORDER BY 1, 2;
-            """
-
-            # Run the base query for each column with json or jsonb data types
-            # and add the results to the json_types_dict.
-            for index, row in df_json.iterrows():
-                df_query_results = self.query(json_query.format(
-                    schema=row['table_schema'],
-                    table=row['table_name'],
-                    column=row['column_name'],
-                    json=row['data_type'],
-                ), fetch_through_pandas=True, fail_silently=False)
-
-                for _, query_row in df_query_results.iterrows():
-                    for col in json_types_dict.keys():
-                        if col not in ['json_key', 'json_value_type']:
-                            json_types_dict[col].append(row[col])
-                    json_types_dict['json_key'].append(query_row['key'])
-                    json_types_dict['json_value_type'].append(query_row['json_value_data_type'])
-
-            # Converting the results to DataFrame, joining and sorting them before returning the result
-            new_df = pd.concat([df, pd.DataFrame(json_types_dict)], ignore_index=True)
-            return new_df.sort_values(by=['table_catalog', 'table_schema', 'table_name', 'column_name', 'data_type', 'json_key', 'json_value_type'], ignore_index=True)
+            json_results = [self.query(json_query, fetch_through_pandas=False, fail_silently=False) for json_query in json_queries]
+
+        # Joining each key found with the information_schema row of its column, all at once
+        keys = pd.DataFrame(
+            [
+                (column_index, key, value_type)
+                for column_index, rows in zip(df_json.index, json_results)
+                for key, value_type, _ in rows
+            ],
+            columns=['_column_index', 'json_key', 'json_value_type'],
+        )
+        json_rows = df_json.drop(columns=['json_key', 'json_value_type']).merge(keys, left_index=True, right_on='_column_index')
+
+        # Converting the results to DataFrame, joining and sorting them before returning the result
+        new_df = pd.concat([df, json_rows[df.columns]], ignore_index=True)
+        return new_df.sort_values(by=['table_catalog', 'table_schema', 'table_name', 'column_name', 'data_type', 'json_key', 'json_value_type'], ignore_index=True)
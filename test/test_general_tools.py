@@ -1,8 +1,13 @@
 import os
 import json
 import yaml
+import logging
+import tempfile
 import unittest
-from instackup.general_tools import fetch_credentials, unicode_to_ascii, parse_remote_uri
+from unittest import mock
+from instackup.general_tools import (
+    fetch_credentials, reload_credentials, configure_logging, shutdown_logging, unicode_to_ascii, parse_remote_uri
+)
 
 
 class TestFetchCredentials(unittest.TestCase):
@@ -93,6 +98,113 @@ class TestFetchCredentials(unittest.TestCase):
         self.assertDictEqual(project_ids, secrets_project_ids)
 
 
+class TestCredentialsCache(unittest.TestCase):
+    """Unittest for the secrets file cache used by fetch_credentials function in general_tools module of instackup package"""
+
+    def setUp(self):
+        self.secrets_dir = tempfile.TemporaryDirectory()
+        self.secrets_filepath = os.path.join(self.secrets_dir.name, "secret.yml")
+        self.write_secrets({"Location": "local"})
+
+        self.environ = mock.patch.dict(os.environ, {"CREDENTIALS_HOME": self.secrets_filepath})
+        self.environ.start()
+        reload_credentials()
+
+    def tearDown(self):
+        self.environ.stop()
+        self.secrets_dir.cleanup()
+        reload_credentials()
+
+    def write_secrets(self, secrets, mtime=None):
+        with open(self.secrets_filepath, "w") as stream:
+            yaml.safe_dump(secrets, stream)
+
+        if mtime is not None:
+            os.utime(self.secrets_filepath, ns=(mtime, mtime))
+
+    def test_file_is_parsed_only_once(self):
+        """Test if consecutive calls don't parse the secrets file again"""
+
+        with mock.patch("yaml.safe_load", wraps=yaml.safe_load) as safe_load:
+            fetch_credentials("Location")
+            fetch_credentials("Location")
+
+        self.assertEqual(safe_load.call_count, 1)
+
+    def test_changed_file_is_parsed_again(self):
+        """Test if a change in the secrets file is picked up by the next call"""
+
+        self.assertEqual(fetch_credentials("Location"), "local")
+
+        self.write_secrets({"Location": "remote"}, mtime=1_000_000_000_000_000_000)
+        self.assertEqual(fetch_credentials("Location"), "remote")
+
+    def test_reload_credentials(self):
+        """Test if reload_credentials forces the secrets file to be read again"""
+
+        stat = os.stat(self.secrets_filepath)
+        self.assertEqual(fetch_credentials("Location"), "local")
+
+        # Same size and modification time, so only an explicit reload can notice it
+        self.write_secrets({"Location": "other"}, mtime=stat.st_mtime_ns)
+        self.assertEqual(fetch_credentials("Location"), "local")
+
+        reload_credentials()
+        self.assertEqual(fetch_credentials("Location"), "other")
+
+    def test_returned_values_are_copies(self):
+        """Test if changing a returned value doesn't change the cached secrets"""
+
+        self.write_secrets({"AWS": {"default": {"access_key": "key"}}})
+
+        aws_creds = fetch_credentials("AWS", "default")
+        aws_creds["access_key"] = "changed"
+
+        self.assertEqual(fetch_credentials("AWS", "default")["access_key"], "key")
+
+
+class TestConfigureLogging(unittest.TestCase):
+    """Unittest for configure_logging and shutdown_logging functions in general_tools module of instackup package"""
+
+    class ListHandler(logging.Handler):
+        def __init__(self):
+            super().__init__()
+            self.messages = []
+
+        def emit(self, record):
+            self.messages.append(record.getMessage())
+
+    def tearDown(self):
+        shutdown_logging()
+
+    def test_records_reach_handlers(self):
+        """Test if records from the package modules reach the configured handlers, respecting the level"""
+
+        handler = self.ListHandler()
+        configure_logging(level="INFO", handlers=[handler])
+
+        module_logger = logging.getLogger("instackup.sql_tools")
+        module_logger.debug("Query Executed: %s", "SELECT 1")
+        module_logger.info("Connected!")
+
+        # Shutting down waits for the background thread to write every queued record
+        shutdown_logging()
+        self.assertListEqual(handler.messages, ["Connected!"])
+
+    def test_log_file(self):
+        """Test if records are written to the given file, creating its directory"""
+
+        with tempfile.TemporaryDirectory() as log_dir:
+            filename = os.path.join(log_dir, "logs", "instackup.log")
+            configure_logging(filename=filename)
+
+            logging.getLogger("instackup.s3_tools").warning("Invalid AWS credentials")
+            shutdown_logging()
+
+            with open(filename, "r") as log_file:
+                self.assertIn("instackup.s3_tools:WARNING: Invalid AWS credentials", log_file.read())
+
+
 class TestUnicodeToAscii(unittest.TestCase):
     """Unittest for unicode_to_ascii function in general_tools module of instackup package"""
 
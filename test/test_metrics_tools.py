@@ -0,0 +1,122 @@
+import unittest
+from instackup.metrics_tools import (
+    MetricsRegistry, enable_metrics, disable_metrics, get_registry, instrument_methods, add_bytes, add_retry
+)
+from instackup.sql_tools import SQLiteTool
+
+
+@instrument_methods
+class SampleTool(object):
+    """Tool used to check the instrumentation without any external service"""
+
+    def transfer(self, nbytes):
+        add_bytes(nbytes)
+        return [1, 2, 3]
+
+    def flaky(self):
+        add_retry()
+        raise ValueError("Failed")
+
+    def _private(self):
+        return [1]
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    """Unittest for MetricsRegistry class in metrics_tools module of instackup package"""
+
+    def test_counter(self):
+        """Test if counters are kept separately for each combination of labels"""
+
+        registry = MetricsRegistry()
+        registry.counter("calls").inc(tool="A")
+        registry.counter("calls").inc(2, tool="A")
+        registry.counter("calls").inc(tool="B")
+
+        self.assertEqual(registry.counter("calls").value(tool="A"), 3)
+        self.assertEqual(registry.counter("calls").value(tool="B"), 1)
+
+    def test_histogram_snapshot(self):
+        """Test if histogram buckets in the snapshot are cumulative"""
+
+        registry = MetricsRegistry()
+        histogram = registry.histogram("latency", buckets=(0.1, 1.0))
+        for value in [0.05, 0.5, 5]:
+            histogram.observe(value, method="query")
+
+        sample = registry.snapshot()["latency"]["samples"][0]
+        self.assertDictEqual(sample["buckets"], {"0.1": 1, "1.0": 2, "+Inf": 3})
+        self.assertEqual(sample["count"], 3)
+        self.assertAlmostEqual(sample["sum"], 5.55)
+
+    def test_prometheus_format(self):
+        """Test if the exporter writes the Prometheus text format"""
+
+        registry = MetricsRegistry()
+        registry.counter("instackup_calls_total", "Calls.").inc(tool="S3Tool", method="upload_file")
+        registry.histogram("instackup_seconds", buckets=(1.0,)).observe(0.5, tool="S3Tool")
+
+        text = registry.to_prometheus()
+        self.assertIn("# HELP instackup_calls_total Calls.\n# TYPE instackup_calls_total counter\n", text)
+        self.assertIn('instackup_calls_total{method="upload_file",tool="S3Tool"} 1\n', text)
+        self.assertIn('instackup_seconds_bucket{tool="S3Tool",le="1.0"} 1\n', text)
+        self.assertIn('instackup_seconds_bucket{tool="S3Tool",le="+Inf"} 1\n', text)
+        self.assertIn('instackup_seconds_count{tool="S3Tool"} 1\n', text)
+
+
+class TestInstrumentMethods(unittest.TestCase):
+    """Unittest for instrument_methods decorator in metrics_tools module of instackup package"""
+
+    def setUp(self):
+        self.registry = enable_metrics(MetricsRegistry())
+
+    def tearDown(self):
+        disable_metrics()
+
+    def test_successful_call(self):
+        """Test if calls, duration, bytes and rows are recorded"""
+
+        SampleTool().transfer(1024)
+
+        labels = {"tool": "SampleTool", "method": "transfer"}
+        self.assertEqual(self.registry.counter("instackup_calls_total").value(status="ok", **labels), 1)
+        self.assertEqual(self.registry.counter("instackup_bytes_total").value(**labels), 1024)
+        self.assertEqual(self.registry.counter("instackup_rows_total").value(**labels), 3)
+        self.assertEqual(self.registry.histogram("instackup_call_duration_seconds").samples()[0]["count"], 1)
+
+    def test_failed_call(self):
+        """Test if failed calls and their retries are recorded and the error is raised"""
+
+        self.assertRaises(ValueError, SampleTool().flaky)
+
+        labels = {"tool": "SampleTool", "method": "flaky"}
+        self.assertEqual(self.registry.counter("instackup_calls_total").value(status="error", **labels), 1)
+        self.assertEqual(self.registry.counter("instackup_retries_total").value(**labels), 1)
+
+    def test_private_methods_are_not_instrumented(self):
+        """Test if methods starting with an underscore don't report metrics"""
+
+        SampleTool()._private()
+        self.assertDictEqual(self.registry.snapshot(), {})
+
+    def test_disabled(self):
+        """Test if nothing is recorded while metrics are disabled"""
+
+        disable_metrics()
+        SampleTool().transfer(1024)
+        self.assertDictEqual(get_registry().snapshot(), {})
+
+    def test_sql_tool(self):
+        """Test if SQLTool queries report the rows returned under the subclass name"""
+
+        with SQLiteTool() as db:
+            db.execute_sql("CREATE TABLE t (id INTEGER)")
+            db.execute_sql("INSERT INTO t VALUES (1), (2)")
+            db.query("SELECT * FROM t")
+
+        rows = self.registry.counter("instackup_rows_total")
+        self.assertEqual(rows.value(tool="SQLiteTool", method="execute_sql"), 2)
+        self.assertEqual(rows.value(tool="SQLiteTool", method="query"), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,686 @@
+import io
+import os
+import gzip
+import json
+import time
+import datetime
+import tempfile
+import threading
+import unittest
+from unittest import mock
+import pandas as pd
+import psycopg2
+from instackup.sql_tools import SlowQueryLog, QueryResultCache
+from instackup.redshift_tools import RedShiftTool, ClusterCredentialsCache
+
+
+class FakeRedshiftClient(object):
+    """Stand-in for the boto3 RedShift client, counting the GetClusterCredentials calls"""
+
+    def __init__(self, duration=900, delay=0):
+        self.duration = duration
+        self.delay = delay
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def get_cluster_credentials(self, DbUser, DbName, ClusterIdentifier, DurationSeconds, AutoCreate):
+        time.sleep(self.delay)
+        with self.lock:
+            self.calls += 1
+            calls = self.calls
+
+        return {
+            "DbUser": f"IAM:{DbUser}",
+            "DbPassword": f"password_{calls}",
+            "Expiration": datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=self.duration),
+        }
+
+
+class TestClusterCredentialsCache(unittest.TestCase):
+    """Unittest for ClusterCredentialsCache class in redshift_tools module of instackup package"""
+
+    def test_cached_until_expiration(self):
+        """Test if credentials are requested once for each cluster, user and database"""
+
+        client = FakeRedshiftClient()
+        cache = ClusterCredentialsCache(client=client)
+
+        first = cache.get("cluster", "user", "db")
+        self.assertIs(cache.get("cluster", "user", "db"), first)
+        self.assertEqual(client.calls, 1)
+
+        cache.get("cluster", "other_user", "db")
+        self.assertEqual(client.calls, 2)
+
+        cache.invalidate("cluster", "user", "db")
+        self.assertEqual(cache.get("cluster", "user", "db")["DbPassword"], "password_3")
+        self.assertEqual(cache.stats()["entries"], 2)
+
+    def test_expired_credentials(self):
+        """Test if credentials about to expire are requested again before being returned"""
+
+        client = FakeRedshiftClient(duration=5)
+        cache = ClusterCredentialsCache(client=client)
+
+        cache.get("cluster", "user", "db")
+        cache.get("cluster", "user", "db")
+        self.assertEqual(client.calls, 2)
+
+    def test_refresh_ahead(self):
+        """Test if credentials close to expiring are returned while new ones are requested in background"""
+
+        client = FakeRedshiftClient(duration=60, delay=0.05)
+        cache = ClusterCredentialsCache(refresh_ahead=120, client=client)
+
+        first = cache.get("cluster", "user", "db")
+        client.duration = 900
+
+        self.assertIs(cache.get("cluster", "user", "db"), first)
+        self.assertIs(cache.get("cluster", "user", "db"), first)
+
+        deadline = time.monotonic() + 5
+        while cache.get("cluster", "user", "db") is first and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        # Only one refresh at a time, however many calls were made meanwhile
+        self.assertEqual(cache.get("cluster", "user", "db")["DbPassword"], "password_2")
+        self.assertEqual(client.calls, 2)
+
+    def test_concurrent_requests(self):
+        """Test if concurrent callers of missing credentials share a single API call"""
+
+        client = FakeRedshiftClient(delay=0.05)
+        cache = ClusterCredentialsCache(client=client)
+
+        threads = [threading.Thread(target=cache.get, args=("cluster", "user", "db")) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(client.calls, 1)
+
+
+class FakeS3Client(object):
+    """Stand-in for the boto3 S3 client, keeping the objects in a dictionary"""
+
+    def __init__(self, fail_key=None):
+        self.objects = {}
+        self.lock = threading.Lock()
+        self.fail_key = fail_key
+
+    def put_object(self, Bucket, Key, Body):
+        if self.fail_key is not None and Key.endswith(self.fail_key):
+            raise ConnectionError(f"Failed to upload {Key}")
+
+        with self.lock:
+            self.objects[(Bucket, Key)] = Body
+
+    def get_object(self, Bucket, Key):
+        return {"Body": io.BytesIO(self.objects[(Bucket, Key)])}
+
+    def delete_objects(self, Bucket, Delete):
+        for item in Delete["Objects"]:
+            self.objects.pop((Bucket, item["Key"]))
+
+    def get_paginator(self, operation):
+        client = self
+
+        class Paginator(object):
+            def paginate(self, Bucket, Prefix):
+                keys = sorted(key for bucket, key in client.objects if bucket == Bucket and key.startswith(Prefix))
+                yield {"Contents": [{"Key": key, "Size": len(client.objects[(Bucket, key)])} for key in keys]}
+
+        return Paginator()
+
+
+class FakeRedShiftCursor(object):
+    """Stand-in for a psycopg2 cursor, answering the queries run by copy_from_S3"""
+
+    def __init__(self, s3, slices=4, error=None, unload=None):
+        self.s3 = s3
+        self.unload = unload
+        self.slices = slices
+        self.error = error
+        self.commands = []
+        self.rowcount = -1
+        self.rows = []
+        self.loaded = []
+
+    def execute(self, sql, params=None):
+        self.commands.append(sql)
+
+        if "stv_slices" in sql:
+            self.rows = [(self.slices,)]
+        elif "pg_last_copy_count" in sql:
+            self.rows = [(len(self.loaded), 42)]
+        elif "stl_load_errors" in sql:
+            self.rows = [(42, "s3://bucket/part", 1, "id", "int4", "a", 1207, "Invalid digit", "a,b")] if self.error else []
+        elif sql.strip().startswith("UNLOAD"):
+            # Writes the DataFrame in one part for each slice, and the manifest
+            bucket, prefix = sql.split("TO 's3://")[1].split("'")[0].split("/", 1)
+            entries = []
+            for index in range(self.slices):
+                part = self.unload.iloc[index::self.slices]
+                if "PARQUET" in sql:
+                    body = part.to_parquet(index=False)
+                else:
+                    body = gzip.compress(part.to_csv(index=False).encode())
+                self.s3.put_object(Bucket=bucket, Key=f"{prefix}{index:04d}_part_00", Body=body)
+                entries.append({"url": f"s3://{bucket}/{prefix}{index:04d}_part_00"})
+            self.s3.put_object(Bucket=bucket, Key=f"{prefix}manifest", Body=json.dumps({"entries": entries}).encode())
+        elif sql.strip().startswith(("MERGE", "INSERT")):
+            self.rowcount = len(self.loaded)
+        elif sql.strip().startswith("DELETE"):
+            self.rowcount = 3
+        elif sql.strip().startswith("COPY"):
+            if self.error:
+                raise psycopg2.InternalError(self.error)
+
+            # Reads the files of the manifest, like RedShift would
+            manifest_url = sql.split("FROM '")[1].split("'")[0]
+            manifest = json.loads(self.s3.objects[tuple(manifest_url[len("s3://"):].split("/", 1))])
+            for entry in manifest["entries"]:
+                body = self.s3.objects[tuple(entry["url"][len("s3://"):].split("/", 1))]
+                if "PARQUET" in sql:
+                    body = gzip.compress(pd.read_parquet(io.BytesIO(body)).to_csv(index=False, header=False, na_rep="NULL").encode())
+                self.loaded.extend(gzip.decompress(body).decode().splitlines())
+
+    def fetchone(self):
+        return self.rows[0]
+
+    def fetchall(self):
+        return self.rows
+
+
+class FakeSystemCursor(object):
+    """Stand-in for a psycopg2 cursor, answering the queries to the system tables about a query"""
+
+    tables = {
+        "stl_query": (["query", "sql", "starttime", "endtime", "aborted"], [
+            (77, "SELECT * FROM sales JOIN users USING (user_id)", datetime.datetime(2020, 1, 1, 0, 0, 0), datetime.datetime(2020, 1, 1, 0, 0, 7), 0),
+        ]),
+        "stl_wlm_query": (["service_class", "slot_count", "total_queue_time", "total_exec_time"], [
+            (6, 1, 1000000, 2000000),
+            (7, 2, 500000, 3000000),
+        ]),
+        "svl_query_summary": (["stm", "seg", "step", "label", "maxtime", "avgtime", "rows", "bytes", "rate_row", "is_diskbased", "workmem"], [
+            (0, 0, 0, "scan   tbl=100", 500, 300, 1000, 8000, None, False, 0),
+            (1, 1, 0, "hash   tbl=200", 900, 800, 40, 320, None, True, 1024),
+        ]),
+        "svl_query_report": (["slice", "segment", "step", "label", "rows", "bytes", "elapsed_time"], [
+            (0, 0, 0, "scan   tbl=100", 100, 800, 100000),
+            (1, 0, 0, "scan   tbl=100", 100, 800, 100000),
+            (2, 0, 0, "scan   tbl=100", 100, 800, 100000),
+            (3, 0, 0, "scan   tbl=100", 700, 5600, 500000),
+        ] + [(index, 1, 0, "hash   tbl=200", 10, 80, 200000) for index in range(4)]),
+    }
+
+    def __init__(self):
+        self.commands = []
+        self.rowcount = -1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        pass
+
+    def execute(self, sql, params=None):
+        self.commands.append(sql)
+        if "missing" in sql:
+            raise psycopg2.ProgrammingError('relation "missing" does not exist')
+
+        table = next((name for name in self.tables if f"FROM {name}\n" in sql), None)
+        if table is not None:
+            names, self.rows = self.tables[table]
+        elif "pg_last_query_id" in sql:
+            names, self.rows = ["pg_last_query_id"], [(77,)]
+        else:
+            names, self.rows = ["?column?"], [(1,)]
+
+        self.description = [(name,) for name in names]
+        self.rowcount = len(self.rows)
+
+    def fetchone(self):
+        return self.rows[0]
+
+    def fetchall(self):
+        return self.rows
+
+
+class FakeStreamCursor(object):
+    """Stand-in for a psycopg2 named cursor, which only has a description after the first fetch"""
+
+    rows = [(index, f"name_{index}", None if index % 5 else "a,b") for index in range(25)]
+
+    def __init__(self, name=None):
+        self.commands = []
+        self.description = None
+        self.fetched = 0
+
+    def execute(self, sql, params=None):
+        self.commands.append(sql)
+        if "missing" in sql:
+            raise psycopg2.ProgrammingError('relation "missing" does not exist')
+
+    def fetchmany(self, size):
+        self.description = [("id",), ("name",), ("tags",)]
+        rows = self.rows[self.fetched:self.fetched + size]
+        self.fetched += len(rows)
+        return rows
+
+    def close(self):
+        pass
+
+
+class TestRedShiftTool(unittest.TestCase):
+    """Unittest for RedShiftTool class in redshift_tools module of instackup package"""
+
+    secrets = {
+        "cluster_credentials": {"dbname": "db", "user": "user", "cluster_id": "cluster", "host": "localhost", "port": 5439},
+        "master_password": {"dbname": "db", "user": "master", "password": "secret", "host": "localhost", "port": 5439},
+    }
+
+    def fake_fetch_credentials(self, service_name, connection="default", connection_type=None):
+        if service_name == "AWS":
+            return {"access_key": "testing", "secret_key": "testing"}
+        return dict(self.secrets[connection_type])
+
+    def test_credentials_requested_on_use(self):
+        """Test if creating a tool doesn't call the API, and tools connecting with a password don't need it"""
+
+        client = FakeRedshiftClient()
+        cache = ClusterCredentialsCache(client=client)
+
+        with mock.patch("instackup.redshift_tools.fetch_credentials", self.fake_fetch_credentials), \
+                mock.patch("instackup.redshift_tools._cluster_credentials", cache):
+            by_password = RedShiftTool(connect_by_cluster=False)
+            self.assertIsNone(by_password.cluster_creds)
+
+            tools = [RedShiftTool() for _ in range(3)]
+            self.assertEqual(client.calls, 0)
+
+            self.assertEqual({tool.cluster_creds["DbPassword"] for tool in tools}, {"password_1"})
+            self.assertEqual(client.calls, 1)
+
+
+    def copy_tool(self, cursor):
+        with mock.patch("instackup.redshift_tools.fetch_credentials", self.fake_fetch_credentials):
+            tool = RedShiftTool(connect_by_cluster=False)
+
+        tool.connection = mock.Mock()
+        tool.cursor = cursor
+        tool._connection_info = {}
+        return tool
+
+    def test_copy_from_S3_dataframe(self):
+        """Test if a DataFrame is split in a multiple of the slices, uploaded and loaded through a manifest"""
+
+        s3 = FakeS3Client()
+        cursor = FakeRedShiftCursor(s3, slices=4)
+        tool = self.copy_tool(cursor)
+        df = pd.DataFrame({"id": range(100), "name": [f"name_{i}" for i in range(100)]})
+
+        with mock.patch("instackup.redshift_tools.S3Tool") as s3_tool:
+            s3_tool.return_value.s3.meta.client = s3
+            report = tool.copy_from_S3("my_table", data=df, s3_path="s3://bucket/loads", compress=True, parts_per_slice=2)
+
+        copy_command = next(command for command in cursor.commands if command.strip().startswith("COPY"))
+        self.assertIn("COPY my_table (id, name)", copy_command)
+        self.assertIn("MANIFEST", copy_command)
+        self.assertIn("GZIP", copy_command)
+        self.assertNotIn("IGNOREHEADER", copy_command)
+
+        self.assertEqual(report["files"], 8)
+        self.assertEqual(report["rows"], 100)
+        self.assertEqual(report["query_id"], 42)
+        self.assertEqual(report["errors"], [])
+        self.assertEqual(sorted(cursor.loaded), sorted(f"{i},name_{i}" for i in range(100)))
+        tool.connection.commit.assert_called_once()
+
+        # Parts and manifest are deleted after loading
+        self.assertEqual(s3.objects, {})
+
+    def test_copy_from_S3_file(self):
+        """Test if a local CSV file is split by lines, without its header"""
+
+        s3 = FakeS3Client()
+        cursor = FakeRedShiftCursor(s3, slices=3)
+        tool = self.copy_tool(cursor)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filename = os.path.join(temp_dir, "data.csv")
+            with open(filename, "w") as f:
+                f.write("id,name\n")
+                f.writelines(f"{i},name_{i}\n" for i in range(50))
+
+            with mock.patch("instackup.redshift_tools.S3Tool") as s3_tool:
+                s3_tool.return_value.s3.meta.client = s3
+                report = tool.copy_from_S3("my_table", data=filename, s3_path="s3://bucket/", compress=True, header=True, cleanup=False)
+
+        self.assertEqual(report["files"], 3)
+        self.assertEqual(cursor.loaded, [f"{i},name_{i}" for i in range(50)])
+
+        # 3 parts and the manifest are kept
+        self.assertEqual(len(s3.objects), 4)
+
+    def test_copy_from_S3_failed_upload(self):
+        """Test if the parts already uploaded are deleted when another part fails to upload"""
+
+        s3 = FakeS3Client(fail_key="part_0005.csv.gz")
+        cursor = FakeRedShiftCursor(s3, slices=4)
+        tool = self.copy_tool(cursor)
+        df = pd.DataFrame({"id": range(100)})
+
+        with mock.patch("instackup.redshift_tools.S3Tool") as s3_tool:
+            s3_tool.return_value.s3.meta.client = s3
+
+            with self.assertRaises(ConnectionError):
+                tool.copy_from_S3("my_table", data=df, s3_path="s3://bucket/loads", compress=True, parts_per_slice=2, max_workers=2)
+
+        self.assertEqual(s3.objects, {})
+        self.assertFalse(any(command.strip().startswith("COPY") for command in cursor.commands))
+
+    def test_copy_from_S3_errors(self):
+        """Test if the stl_load_errors rows of a failed load are returned (or the error is raised)"""
+
+        s3 = FakeS3Client()
+        cursor = FakeRedShiftCursor(s3, error="Load into table 'my_table' failed.")
+        tool = self.copy_tool(cursor)
+
+        with mock.patch("instackup.redshift_tools.S3Tool") as s3_tool:
+            s3_tool.return_value.s3.meta.client = s3
+
+            with self.assertRaises(psycopg2.InternalError):
+                tool.copy_from_S3("my_table", source="s3://bucket/data/", file_format="CSV", header=True)
+
+            report = tool.copy_from_S3("my_table", source="s3://bucket/data/", fail_silently=True)
+
+        copy_command = next(command for command in cursor.commands if command.strip().startswith("COPY"))
+        self.assertIn("FROM 's3://bucket/data/'", copy_command)
+        self.assertIn("IGNOREHEADER 1", copy_command)
+        self.assertNotIn("MANIFEST", copy_command)
+
+        self.assertEqual(report["rows"], 0)
+        self.assertIsNone(report["files"])
+        self.assertEqual(report["errors"][0]["err_reason"], "Invalid digit")
+        self.assertEqual(tool.connection.rollback.call_count, 2)
+
+
+    def test_unload_and_fetch(self):
+        """Test if the unloaded parts are read as a single result and deleted"""
+
+        df = pd.DataFrame({"id": range(100), "value": [i / 2 for i in range(100)], "name": [f"name_{i}" for i in range(100)]})
+        s3 = FakeS3Client()
+        cursor = FakeRedShiftCursor(s3, unload=df)
+        tool = self.copy_tool(cursor)
+
+        with mock.patch("instackup.redshift_tools.S3Tool") as s3_tool:
+            s3_tool.return_value.s3.meta.client = s3
+
+            result = tool.unload_and_fetch("SELECT * FROM my_table", "s3://bucket/staging")
+            pd.testing.assert_frame_equal(result.sort_values("id", ignore_index=True), df)
+
+            unload_command = next(command for command in cursor.commands if command.strip().startswith("UNLOAD"))
+            self.assertIn("FORMAT AS PARQUET MANIFEST", unload_command)
+            self.assertIn("TO 's3://bucket/staging/unload_", unload_command)
+            self.assertEqual(s3.objects, {})
+
+            table = tool.unload_and_fetch("SELECT * FROM my_table", "s3://bucket/staging", file_format="csv", fetch_as="arrow")
+            self.assertEqual(table.num_rows, 100)
+            self.assertEqual(table.column_names, ["id", "value", "name"])
+            self.assertEqual(s3.objects, {})
+
+    def test_unload_and_fetch_csv_types(self):
+        """Test if CSV parts whose values look like different types are read with the same types"""
+
+        # The part of the first slice has only integers in value and only digits in code
+        df = pd.DataFrame({
+            "value": pd.Series([1 if index % 2 == 0 else index + 0.5 for index in range(8)], dtype=object),
+            "code": ["007" if index % 2 == 0 else f"x{index}" for index in range(8)],
+            "note": [None if index % 2 == 0 else "a" for index in range(8)],
+        })
+        s3 = FakeS3Client()
+        cursor = FakeRedShiftCursor(s3, slices=2, unload=df)
+        tool = self.copy_tool(cursor)
+
+        with mock.patch("instackup.redshift_tools.S3Tool") as s3_tool:
+            s3_tool.return_value.s3.meta.client = s3
+
+            result = tool.unload_and_fetch("SELECT * FROM my_table", "s3://bucket/", file_format="csv")
+            self.assertEqual(list(result["value"]), ["1", "1", "1", "1", "1.5", "3.5", "5.5", "7.5"])
+            self.assertEqual(list(result["code"][:2]), ["007", "007"])
+            self.assertEqual(result["note"].isna().sum(), 4)
+
+            parts = list(tool.unload_and_fetch("SELECT * FROM my_table", "s3://bucket/", file_format="csv", fetch_as="arrow", yield_results=True))
+            self.assertEqual(len(parts), 2)
+            self.assertEqual(parts[0].schema, parts[1].schema)
+
+    def test_unload_and_fetch_parts(self):
+        """Test if the unloaded parts can be read one at a time, or written to a directory"""
+
+        df = pd.DataFrame({"id": range(100)})
+        s3 = FakeS3Client()
+        cursor = FakeRedShiftCursor(s3, slices=4, unload=df)
+        tool = self.copy_tool(cursor)
+
+        with mock.patch("instackup.redshift_tools.S3Tool") as s3_tool:
+            s3_tool.return_value.s3.meta.client = s3
+
+            parts = tool.unload_and_fetch("SELECT id FROM my_table", "s3://bucket/", yield_results=True, max_workers=2)
+            self.assertEqual(len(s3.objects), 5)
+
+            self.assertEqual([len(part) for part in parts], [25, 25, 25, 25])
+            self.assertEqual(s3.objects, {})
+
+            with tempfile.TemporaryDirectory() as temp_dir:
+                paths = tool.unload_and_fetch("SELECT id FROM my_table", "s3://bucket/", destination=temp_dir, cleanup=False)
+
+                self.assertEqual(len(paths), 4)
+                self.assertEqual(sum(len(pd.read_parquet(path)) for path in paths), 100)
+                self.assertEqual(len(s3.objects), 5)
+
+
+    def test_upsert_dataframe(self):
+        """Test if a DataFrame is loaded in a staging table and merged in one transaction"""
+
+        s3 = FakeS3Client()
+        cursor = FakeRedShiftCursor(s3)
+        tool = self.copy_tool(cursor)
+        df = pd.DataFrame({"id": [1, 2, 3, 2], "name": ["a", "b", None, "d"]})
+
+        with mock.patch("instackup.redshift_tools.S3Tool") as s3_tool:
+            s3_tool.return_value.s3.meta.client = s3
+            report = tool.upsert_dataframe(df, "my_table", "id", "s3://bucket/staging")
+
+        commands = [" ".join(command.split()) for command in cursor.commands]
+        staging = commands[0].split()[3]
+        self.assertEqual(commands[0], f"CREATE TEMP TABLE {staging} (LIKE my_table)")
+        self.assertTrue(staging.startswith("instackup_staging_"))
+
+        merge = next(command for command in commands if command.startswith("MERGE"))
+        self.assertIn(f"ON my_table.id = {staging}.id", merge)
+        self.assertIn(f"UPDATE SET name = {staging}.name", merge)
+        self.assertIn(f"INSERT (id, name) VALUES ({staging}.id, {staging}.name)", merge)
+        self.assertEqual(commands[-1], f"DROP TABLE {staging}")
+
+        # Only the last row of each key is loaded, from Parquet files, which keep the nulls
+        copy_command = next(command for command in commands if command.startswith("COPY"))
+        self.assertIn("FORMAT AS PARQUET", copy_command)
+        self.assertEqual(sorted(cursor.loaded), ["1,a", "2,d", "3,NULL"])
+        self.assertEqual(report["rows"], 3)
+        self.assertEqual(report["affected"], 3)
+        tool.connection.commit.assert_called_once()
+        self.assertEqual(s3.objects, {})
+
+    def test_upsert_dataframe_delete_insert(self):
+        """Test the delete and insert method, and if a failed load is rolled back"""
+
+        s3 = FakeS3Client()
+        cursor = FakeRedShiftCursor(s3)
+        tool = self.copy_tool(cursor)
+        df = pd.DataFrame({"id": [1, 2], "day": ["2020-01-01", "2020-01-02"], "value": [1.5, 2.5]})
+
+        with mock.patch("instackup.redshift_tools.S3Tool") as s3_tool:
+            s3_tool.return_value.s3.meta.client = s3
+            report = tool.upsert_dataframe(df, "my_table", ["id", "day"], "s3://bucket/staging", method="delete_insert")
+
+            commands = [" ".join(command.split()) for command in cursor.commands]
+            staging = commands[0].split()[3]
+            self.assertIn(f"DELETE FROM my_table USING {staging} WHERE my_table.id = {staging}.id AND my_table.day = {staging}.day", commands)
+            self.assertIn(f"INSERT INTO my_table (id, day, value) SELECT id, day, value FROM {staging}", commands)
+            self.assertEqual(report["affected"], 5)
+
+            cursor.error = "Load into table failed."
+            with self.assertRaises(psycopg2.InternalError):
+                tool.upsert_dataframe(df, "my_table", ["id", "day"], "s3://bucket/staging")
+
+            report = tool.upsert_dataframe(df, "my_table", ["id", "day"], "s3://bucket/staging", fail_silently=True)
+
+        self.assertEqual(report["rows"], 0)
+        tool.connection.commit.assert_called_once()
+        self.assertEqual(s3.objects, {})
+
+        with self.assertRaises(ValueError):
+            tool.upsert_dataframe(df, "my_table", "missing", "s3://bucket/staging")
+
+    def test_upsert_dataframe_upload_error(self):
+        """Test if an error uploading the staging data rolls back the transaction"""
+
+        s3 = FakeS3Client(fail_key=".parquet")
+        cursor = FakeRedShiftCursor(s3)
+        tool = self.copy_tool(cursor)
+        df = pd.DataFrame({"id": [1, 2], "name": ["a", "b"]})
+
+        with mock.patch("instackup.redshift_tools.S3Tool") as s3_tool:
+            s3_tool.return_value.s3.meta.client = s3
+
+            with self.assertRaises(ConnectionError):
+                tool.upsert_dataframe(df, "my_table", "id", "s3://bucket/staging", fail_silently=True)
+
+        self.assertTrue(cursor.commands[0].startswith("CREATE TEMP TABLE"))
+        tool.connection.rollback.assert_called_once()
+        tool.connection.commit.assert_not_called()
+
+
+    def export_tool(self):
+        self.cursors = []
+        tool = self.copy_tool(None)
+        tool.export_fetch_size = 10
+        tool.connection.cursor.side_effect = lambda name=None: self.cursors.append(FakeStreamCursor(name)) or self.cursors[-1]
+        return tool
+
+    def test_export(self):
+        """Test if the rows of a query or table are streamed from a server-side cursor and written as CSV"""
+
+        tool = self.export_tool()
+
+        output = io.BytesIO()
+        self.assertEqual(tool.export("public.users", output, compress=True), 25)
+        self.assertEqual(self.cursors[0].commands, ["SELECT * FROM public.users"])
+
+        lines = gzip.decompress(output.getvalue()).decode().splitlines()
+        self.assertListEqual(lines[:3], ["id,name,tags", '0,name_0,"a,b"', "1,name_1,"])
+        self.assertEqual(len(lines), 26)
+
+        output = io.BytesIO()
+        tool.export("SELECT id, name, tags FROM users;", output, header=False)
+        self.assertEqual(self.cursors[1].commands, ["SELECT id, name, tags FROM users;"])
+        self.assertEqual(output.getvalue().decode().splitlines()[0], '0,name_0,"a,b"')
+        self.assertFalse(output.closed)
+
+        self.assertRaises(ValueError, tool.export, "users", io.BytesIO(), file_format="binary")
+        self.assertRaises(psycopg2.ProgrammingError, tool.export, "missing", io.BytesIO())
+        self.assertIsNone(tool.export("missing", io.BytesIO(), fail_silently=True))
+
+    def test_export_in_chunks(self):
+        """Test if the exported rows are parsed in DataFrame chunks"""
+
+        tool = self.export_tool()
+        chunks = list(tool.export_in_chunks("users", chunksize=10))
+
+        self.assertListEqual([len(chunk) for chunk in chunks], [10, 10, 5])
+        self.assertListEqual(list(chunks[0].columns), ["id", "name", "tags"])
+        self.assertEqual(chunks[0]["tags"][0], "a,b")
+        self.assertTrue(pd.isna(chunks[0]["tags"][1]))
+
+        with self.assertRaises(psycopg2.ProgrammingError):
+            list(tool.export_in_chunks("missing"))
+
+    def system_tool(self):
+        cursor = FakeSystemCursor()
+        tool = self.copy_tool(cursor)
+        tool.connection.cursor.return_value = cursor
+        return tool, cursor
+
+    def test_last_query_id(self):
+        """Test if the ID of the last query is only read from the session when used, or when the query is slow"""
+
+        tool, cursor = self.system_tool()
+
+        tool.execute_sql("UPDATE sales SET price = 0")
+        self.assertEqual(len(cursor.commands), 1)
+
+        self.assertEqual(tool.last_query_id, 77)
+        self.assertEqual(tool.last_query_id, 77)
+        self.assertEqual(len(cursor.commands), 2)
+
+        # A query not read before closing the connection is lost
+        tool.execute_sql("UPDATE sales SET price = 1")
+        tool.close_connection()
+        self.assertIsNone(tool.last_query_id)
+
+        # Failed statements and cached results don't run in the session, so they have no ID
+        tool, cursor = self.system_tool()
+        tool.execute_sql("UPDATE sales SET price = 0")
+        with self.assertRaises(psycopg2.ProgrammingError):
+            tool.execute_sql("UPDATE missing SET price = 0")
+        self.assertIsNone(tool.last_query_id)
+
+        tool.result_cache = QueryResultCache()
+        tool.query("SELECT * FROM sales", fetch_through_pandas=False)
+        self.assertEqual(tool.last_query_id, 77)
+        tool.query("SELECT * FROM sales", fetch_through_pandas=False)
+        self.assertIsNone(tool.last_query_id)
+
+        tool, cursor = self.system_tool()
+        tool.slow_query_log = SlowQueryLog(threshold=0)
+        tool.execute_sql("UPDATE sales SET price = 0")
+
+        entry = tool.slow_query_log.entries()[0]
+        self.assertEqual(entry["query_id"], 77)
+        self.assertEqual(entry["rows"], 1)
+
+    def test_get_query_report(self):
+        """Test if the report summarizes queue and execution times, and finds disk-based and skewed steps"""
+
+        tool, cursor = self.system_tool()
+
+        with self.assertRaises(ValueError):
+            tool.get_query_report()
+
+        tool.query("SELECT * FROM sales JOIN users USING (user_id)", fetch_through_pandas=False)
+        report = tool.get_query_report()
+
+        self.assertEqual(report["query_id"], 77)
+        self.assertEqual(report["sql"], "SELECT * FROM sales JOIN users USING (user_id)")
+        self.assertFalse(report["aborted"])
+        self.assertEqual(report["queue_seconds"], 1.5)
+        self.assertEqual(report["execution_seconds"], 5)
+        self.assertEqual(report["service_class"], 7)
+
+        self.assertEqual(len(report["steps"]), 2)
+        self.assertEqual([step["label"] for step in report["disk_based_steps"]], ["hash   tbl=200"])
+
+        self.assertEqual(len(report["skewed_steps"]), 1)
+        skewed = report["skewed_steps"][0]
+        self.assertEqual((skewed["segment"], skewed["step"], skewed["slowest_slice"]), (0, 0, 3))
+        self.assertEqual(skewed["skew"], 2.8)
+        self.assertEqual(skewed["max_seconds"], 0.5)
+
+        self.assertEqual(report["rows_per_slice"], {0: 100, 1: 100, 2: 100, 3: 700})
+
+
+if __name__ == '__main__':
+    unittest.main()
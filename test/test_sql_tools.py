@@ -0,0 +1,1300 @@
+import io
+import os
+import copy
+import gzip
+import decimal
+import datetime
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest import mock
+import pandas as pd
+import psycopg2
+from instackup.sql_tools import (
+    SQLTool, SQLiteTool, PostgreSQLTool, ConnectionPool, StatementCache, QueryResultCache, ReplicaSet, configure_pool, close_all_pools, get_pool,
+    SlowQueryLog, SchemaCatalog, JSONWatermarkStore, SQLiteWatermarkStore, configure_replicas, get_replica_set,
+    run_concurrent_queries, copy_table, _copy_text, _copy_source, _numbered_placeholders, _arrow_types,
+    _type_family, _destination_type, _portable_value
+)
+
+
+class TestConnectionPool(unittest.TestCase):
+    """Unittest for ConnectionPool class in sql_tools module of instackup package"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.temp_dir, "test.db")
+
+    def tearDown(self):
+        close_all_pools()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def connect(self):
+        return sqlite3.connect(self.filename, check_same_thread=False)
+
+    def test_reuse(self):
+        """Test if a released connection is handed out again instead of opening a new one"""
+
+        pool = ConnectionPool(self.connect)
+        first = pool.acquire()
+        pool.release(first)
+        second = pool.acquire()
+
+        self.assertIs(first.connection, second.connection)
+        self.assertEqual(pool.size, 1)
+
+    def test_max_size(self):
+        """Test if acquire times out when all connections are in use"""
+
+        pool = ConnectionPool(self.connect, max_size=2, checkout_timeout=0.05)
+        pool.acquire()
+        pool.acquire()
+
+        self.assertRaises(TimeoutError, pool.acquire)
+
+    def test_health_check(self):
+        """Test if a broken idle connection is replaced on checkout"""
+
+        pool = ConnectionPool(self.connect)
+        pooled = pool.acquire()
+        pool.release(pooled)
+        pooled.connection.close()
+
+        new_pooled = pool.acquire()
+        self.assertIsNot(new_pooled.connection, pooled.connection)
+        self.assertEqual(new_pooled.connection.execute("SELECT 1").fetchall(), [(1,)])
+        self.assertEqual(pool.size, 1)
+
+    def test_idle_timeout(self):
+        """Test if idle connections past the timeout are closed, keeping min_size of them"""
+
+        pool = ConnectionPool(self.connect, min_size=1, idle_timeout=0, health_check=False)
+        first, second = pool.acquire(), pool.acquire()
+        pool.release(first)
+        pool.release(second)
+
+        pooled = pool.acquire()
+        self.assertEqual(pool.size, 1)
+        self.assertIs(pooled.connection, second.connection)
+
+    def test_release_rolls_back(self):
+        """Test if uncommitted changes are discarded when a connection returns to the pool"""
+
+        pool = ConnectionPool(self.connect)
+        pooled = pool.acquire()
+        pooled.connection.execute("CREATE TABLE t (id INTEGER)")
+        pooled.connection.commit()
+        pooled.connection.execute("INSERT INTO t VALUES (1)")
+        pool.release(pooled)
+
+        pooled = pool.acquire()
+        self.assertEqual(pooled.connection.execute("SELECT COUNT(*) FROM t").fetchall(), [(0,)])
+
+    def test_fork_reset(self):
+        """Test if a pool forgets the connections inherited from the parent process"""
+
+        pool = ConnectionPool(self.connect)
+        pooled = pool.acquire()
+        pool.release(pooled)
+
+        pool._after_fork()
+        self.assertEqual(pool.size, 0)
+        self.assertIsNot(pool.acquire().connection, pooled.connection)
+
+    def test_sqlite_tool(self):
+        """Test if tools with use_pool share the same connection between with blocks"""
+
+        configure_pool("SQLite", self.filename, max_size=1)
+
+        with SQLiteTool(self.filename, use_pool=True) as db:
+            db.execute_sql("CREATE TABLE t (id INTEGER)")
+            db.execute_sql("INSERT INTO t VALUES (1)")
+            first_connection = db.connection
+
+        with SQLiteTool(self.filename, use_pool=True) as db:
+            self.assertIs(db.connection, first_connection)
+            self.assertEqual(db.query("SELECT * FROM t", fetch_through_pandas=False), [(1,)])
+
+        self.assertIsNone(db.connection)
+
+
+class TestStreamQuery(unittest.TestCase):
+    """Unittest for stream_query method of SQLTool class in sql_tools module of instackup package"""
+
+    def setUp(self):
+        self.db = SQLiteTool().connect()
+        self.db.execute_sql("CREATE TABLE t (id INTEGER, name TEXT)")
+        for index in range(25):
+            self.db.execute_sql(f"INSERT INTO t VALUES ({index}, 'name_{index}')")
+
+    def tearDown(self):
+        self.db.close_connection()
+
+    def test_rows(self):
+        """Test if rows are returned in chunks of up to chunksize"""
+
+        chunks = list(self.db.stream_query("SELECT * FROM t ORDER BY id", chunksize=10, fetch_through_pandas=False))
+
+        self.assertListEqual([len(chunk) for chunk in chunks], [10, 10, 5])
+        self.assertEqual(chunks[2][-1], (24, "name_24"))
+
+    def test_dataframes(self):
+        """Test if DataFrame chunks have the query columns"""
+
+        chunks = list(self.db.stream_query("SELECT id, name FROM t", chunksize=20))
+
+        self.assertListEqual([chunk.shape for chunk in chunks], [(20, 2), (5, 2)])
+        self.assertListEqual(list(chunks[0].columns), ["id", "name"])
+
+    def test_fail_silently(self):
+        """Test if an invalid query raises an error, or returns an empty generator when failing silently"""
+
+        self.assertRaises(sqlite3.Error, self.db.stream_query, "SELECT * FROM missing")
+        self.assertListEqual(list(self.db.stream_query("SELECT * FROM missing", fail_silently=True)), [])
+
+
+class TestBulkInsert(unittest.TestCase):
+    """Unittest for bulk_insert method of SQLTool class in sql_tools module of instackup package"""
+
+    def setUp(self):
+        self.db = SQLiteTool().connect()
+        self.db.execute_sql("CREATE TABLE t (id INTEGER, name TEXT, value REAL)")
+
+    def tearDown(self):
+        self.db.close_connection()
+
+    def test_dataframe(self):
+        """Test if a DataFrame is inserted by column names, with missing values as NULL"""
+
+        df = pd.DataFrame({"value": [0.5, float("nan")], "id": [1, 2], "name": ["a", None]})
+
+        self.assertEqual(self.db.bulk_insert(df, "t"), 2)
+        self.assertListEqual(
+            self.db.query("SELECT id, name, value FROM t ORDER BY id", fetch_through_pandas=False),
+            [(1, "a", 0.5), (2, None, None)]
+        )
+
+    def test_generator_batches(self):
+        """Test if rows from a generator are inserted and committed in batches"""
+
+        rows = ((index, f"name_{index}") for index in range(25))
+        inserted = self.db.bulk_insert(rows, "t", columns=["id", "name"], batch_size=10)
+
+        self.db.rollback()
+        self.assertEqual(inserted, 25)
+        self.assertListEqual(self.db.query("SELECT COUNT(*) FROM t", fetch_through_pandas=False), [(25,)])
+
+    def test_without_commit(self):
+        """Test if rows inserted without commit can be rolled back"""
+
+        self.db.bulk_insert([(1, "a", 0.5)], "t", commit=False)
+        self.db.rollback()
+
+        self.assertListEqual(self.db.query("SELECT COUNT(*) FROM t", fetch_through_pandas=False), [(0,)])
+
+    def test_copy_text(self):
+        """Test if values are escaped for PostgreSQL COPY text format"""
+
+        self.assertEqual(_copy_text(None), "\\N")
+        self.assertEqual(_copy_text("a\tb\nc\\"), "a\\tb\\nc\\\\")
+        self.assertEqual(_copy_text(b"\x01\xff"), "\\\\x01ff")
+        self.assertEqual(_copy_text({"a": 1}), '{"a": 1}')
+        self.assertEqual(_copy_text(1.5), "1.5")
+
+
+class FakeCopyCursor(object):
+    """Cursor that answers any COPY TO STDOUT command with the same CSV data"""
+
+    data = b"id,name\n" + b"".join(f"{index},name_{index}\n".encode() for index in range(25))
+
+    def __init__(self):
+        self.commands = []
+        self.rowcount = -1
+
+    def copy_expert(self, sql, file):
+        self.commands.append(sql)
+        file.write(self.data)
+        self.rowcount = 25
+
+    def close(self):
+        pass
+
+
+class TestPostgreSQLExport(unittest.TestCase):
+    """Unittest for export methods of PostgreSQLTool class in sql_tools module of instackup package"""
+
+    def setUp(self):
+        with mock.patch("instackup.sql_tools.fetch_credentials", return_value={}):
+            self.pg = PostgreSQLTool(use_pool=False)
+
+        self.cursors = []
+        self.pg.connection = mock.Mock()
+        self.pg.connection.cursor.side_effect = lambda: self.cursors.append(FakeCopyCursor()) or self.cursors[-1]
+
+    def test_copy_source(self):
+        """Test if queries are put between parentheses and table names are kept as they are"""
+
+        self.assertEqual(_copy_source("public.users"), "public.users")
+        self.assertEqual(_copy_source("SELECT * FROM users;"), "(SELECT * FROM users)")
+
+    def test_export_gzip(self):
+        """Test if the COPY command is built from the parameters and its data is compressed"""
+
+        output = io.BytesIO()
+        rows = self.pg.export("SELECT * FROM users", output, compress=True)
+
+        self.assertEqual(rows, 25)
+        self.assertEqual(self.cursors[0].commands, ["COPY (SELECT * FROM users) TO STDOUT WITH (FORMAT csv, HEADER true)"])
+        self.assertEqual(gzip.decompress(output.getvalue()), FakeCopyCursor.data)
+
+    def test_export_binary(self):
+        """Test if binary format is requested without header, and invalid formats raise an error"""
+
+        self.pg.export("users", io.BytesIO(), file_format="binary")
+
+        self.assertEqual(self.cursors[0].commands, ["COPY users TO STDOUT WITH (FORMAT binary)"])
+        self.assertRaises(ValueError, self.pg.export, "users", io.BytesIO(), file_format="parquet")
+
+    def test_export_in_chunks(self):
+        """Test if the exported data is parsed in DataFrame chunks"""
+
+        chunks = list(self.pg.export_in_chunks("users", chunksize=10))
+
+        self.assertListEqual([len(chunk) for chunk in chunks], [10, 10, 5])
+        self.assertListEqual(list(chunks[0].columns), ["id", "name"])
+
+    def test_export_in_chunks_error(self):
+        """Test if the database error of a failed COPY is raised, instead of the error parsing its empty output"""
+
+        import psycopg2
+
+        def failed_copy(sql, file):
+            raise psycopg2.ProgrammingError('relation "missing" does not exist')
+
+        cursor = FakeCopyCursor()
+        cursor.copy_expert = failed_copy
+        self.pg.connection.cursor.side_effect = lambda: cursor
+
+        with self.assertRaises(psycopg2.ProgrammingError) as context:
+            list(self.pg.export_in_chunks("missing"))
+        self.assertIsInstance(context.exception.__cause__, pd.errors.EmptyDataError)
+
+        self.assertListEqual(list(self.pg.export_in_chunks("missing", fail_silently=True)), [])
+
+
+class RecordingCursor(object):
+    """Cursor that records the commands executed, shared by all cursors of the same connection"""
+
+    def __init__(self, commands, unpreparable=()):
+        self.commands = commands
+        self.unpreparable = unpreparable
+        self.description = [("id",), ("name",)]
+        self.rowcount = 1
+
+    def execute(self, sql, params=None):
+        self.commands.append((sql, params))
+        # Like PostgreSQL, which can't infer the type of some parameters or bind a tuple to IN
+        if sql.startswith("PREPARE") and any(pattern in sql for pattern in self.unpreparable):
+            raise psycopg2.ProgrammingError(f"can't prepare: {sql}")
+
+    def fetchall(self):
+        return [(1, "a")]
+
+    def close(self):
+        pass
+
+
+class TestPreparedStatements(unittest.TestCase):
+    """Unittest for parameterized queries and StatementCache class in sql_tools module of instackup package"""
+
+    def test_statement_cache(self):
+        """Test if the least recently used statement is evicted and hits and misses are counted"""
+
+        evicted = []
+        cache = StatementCache(max_size=2, on_evict=lambda sql, statement: evicted.append(sql))
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+        cache.get("b")
+
+        self.assertListEqual(evicted, ["b"])
+        self.assertDictEqual(cache.stats(), {"size": 2, "max_size": 2, "hits": 1, "misses": 1, "hit_ratio": 0.5})
+
+    def test_numbered_placeholders(self):
+        """Test if psycopg2 placeholders are converted to PREPARE ones"""
+
+        self.assertEqual(
+            _numbered_placeholders("SELECT * FROM t WHERE a = %s AND b LIKE 'x%%' AND c = %s"),
+            ("SELECT * FROM t WHERE a = $1 AND b LIKE 'x%' AND c = $2", [0, 1])
+        )
+        self.assertEqual(
+            _numbered_placeholders("SELECT %(a)s, %(b)s, %(a)s"),
+            ("SELECT $1, $2, $1", ["a", "b"])
+        )
+
+    def test_sqlite(self):
+        """Test if SQLite queries with parameters are counted in the statement cache"""
+
+        with SQLiteTool() as db:
+            db.execute_sql("CREATE TABLE t (id INTEGER, name TEXT)")
+            for index in range(3):
+                db.execute_sql("INSERT INTO t VALUES (?, ?)", params=(index, f"name_{index}"))
+
+            df = db.query("SELECT * FROM t WHERE id >= :id", params={"id": 1})
+            stats = db.statement_cache.stats()
+
+        self.assertListEqual(df["name"].tolist(), ["name_1", "name_2"])
+        self.assertEqual(stats["hits"], 2)
+        self.assertEqual(stats["misses"], 2)
+
+    def postgresql_tool(self, commands, in_transaction=True):
+        with mock.patch("instackup.sql_tools.fetch_credentials", return_value={}):
+            pg = PostgreSQLTool(use_pool=False)
+
+        unpreparable = ("SELECT $1", "$1 IS NULL", "IN $1")
+        pg.connection = mock.Mock(autocommit=False)
+        pg.connection.get_transaction_status.return_value = 2 if in_transaction else 0
+        pg.connection.cursor.side_effect = lambda: RecordingCursor(commands, unpreparable)
+        pg.cursor = RecordingCursor(commands, unpreparable)
+        pg._connection_info = {}
+        return pg
+
+    def test_postgresql(self):
+        """Test if PostgreSQL statements are prepared when they run again, executed with their parameters
+        and deallocated when evicted"""
+
+        commands = []
+        pg = self.postgresql_tool(commands)
+        pg.statement_cache_size = 1
+
+        for index in range(3):
+            pg.query("SELECT * FROM t WHERE id = %s", params=(index,), fetch_through_pandas=False)
+        pg.execute_sql("DELETE FROM t WHERE name = %(name)s", params={"name": "a"})
+        pg.execute_sql("DELETE FROM t WHERE name = %(name)s", params={"name": "b"})
+
+        first_name = commands[2][0].split()[1]
+        second_name = commands[9][0].split()[1]
+        self.assertListEqual(commands, [
+            ("SELECT * FROM t WHERE id = %s", (0,)),
+            ("SAVEPOINT instackup_prepare", None),
+            (f"PREPARE {first_name} AS SELECT * FROM t WHERE id = $1", None),
+            ("RELEASE SAVEPOINT instackup_prepare", None),
+            (f"EXECUTE {first_name} (%s)", [1]),
+            (f"EXECUTE {first_name} (%s)", [2]),
+            (f"DEALLOCATE {first_name}", None),
+            ("DELETE FROM t WHERE name = %(name)s", {"name": "a"}),
+            ("SAVEPOINT instackup_prepare", None),
+            (f"PREPARE {second_name} AS DELETE FROM t WHERE name = $1", None),
+            ("RELEASE SAVEPOINT instackup_prepare", None),
+            (f"EXECUTE {second_name} (%s)", ["b"]),
+        ])
+
+    def test_postgresql_unpreparable(self):
+        """Test if statements PREPARE fails for run with the parameters bound by psycopg2, without PREPARE"""
+
+        statements = [
+            ("SELECT %s", (1,)),
+            ("SELECT * FROM t WHERE %s IS NULL OR id = %s", (None, 1)),
+            ("SELECT * FROM t WHERE id IN %s", ((1, 2),)),
+        ]
+
+        commands = []
+        pg = self.postgresql_tool(commands)
+        for sql, params in statements * 3:
+            pg.query(sql, params=params, fetch_through_pandas=False)
+
+        prepares = [command for command, _ in commands if command.startswith("PREPARE")]
+        self.assertEqual(len(prepares), 3)
+        self.assertEqual(
+            [command for command in commands if not command[0].split()[0] in ("PREPARE", "SAVEPOINT", "ROLLBACK")],
+            statements * 3,
+        )
+        self.assertEqual(commands.count(("ROLLBACK TO SAVEPOINT instackup_prepare", None)), 3)
+        self.assertEqual(len(pg.statement_cache), 3)
+
+        # Without a transaction to keep, the failed PREPARE is just rolled back
+        commands = []
+        pg = self.postgresql_tool(commands, in_transaction=False)
+        pg.query("SELECT %s", params=(1,), fetch_through_pandas=False)
+        pg.query("SELECT %s", params=(2,), fetch_through_pandas=False)
+        self.assertListEqual([command for command, _ in commands if not command.startswith("PREPARE")], ["SELECT %s"] * 2)
+        pg.connection.rollback.assert_called_once_with()
+
+    def test_postgresql_one_off(self):
+        """Test if statements that run only once aren't prepared"""
+
+        commands = []
+        pg = self.postgresql_tool(commands)
+        pg.execute_sql("UPDATE t SET name = %(name)s WHERE id = %(id)s", params={"name": "a", "id": 1})
+
+        self.assertListEqual(commands, [("UPDATE t SET name = %(name)s WHERE id = %(id)s", {"name": "a", "id": 1})])
+
+
+class TestQueryResultCache(unittest.TestCase):
+    """Unittest for QueryResultCache class in sql_tools module of instackup package"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db = SQLiteTool().connect()
+        self.db.execute_sql("CREATE TABLE users (id INTEGER, name TEXT)")
+        self.db.execute_sql("CREATE TABLE orders (id INTEGER)")
+        self.db.execute_sql("INSERT INTO users VALUES (1, 'a')")
+
+    def tearDown(self):
+        self.db.close_connection()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_hits(self):
+        """Test if equivalent queries are served from the cache, and results are copies"""
+
+        self.db.result_cache = QueryResultCache()
+
+        first = self.db.query("SELECT * FROM users")
+        first.loc[0, "name"] = "changed"
+        second = self.db.query("SELECT *\n  FROM users;")
+        self.db.query("SELECT * FROM users WHERE id = ?", params=(1,))
+
+        self.assertEqual(second.loc[0, "name"], "a")
+        self.assertDictEqual(
+            self.db.result_cache.stats(),
+            {"entries": 2, "bytes": None, "hits": 1, "disk_hits": 0, "misses": 2}
+        )
+
+    def test_invalidation(self):
+        """Test if writes invalidate only the entries of the tables written"""
+
+        cache = self.db.result_cache = QueryResultCache()
+        self.db.query("SELECT * FROM users", fetch_through_pandas=False)
+        self.db.query("SELECT * FROM orders", fetch_through_pandas=False)
+
+        self.db.execute_sql("INSERT INTO users VALUES (2, 'b')")
+
+        self.assertEqual(cache.stats()["entries"], 1)
+        self.assertEqual(len(self.db.query("SELECT * FROM users", fetch_through_pandas=False)), 2)
+
+        self.db.bulk_insert([(1,)], "orders")
+        self.assertEqual(cache.stats()["entries"], 1)
+
+    def test_invalidation_by_query(self):
+        """Test if writes run with the query method (like INSERT ... RETURNING) invalidate the tables written"""
+
+        cache = self.db.result_cache = QueryResultCache()
+        self.db.query("SELECT * FROM users", fetch_through_pandas=False)
+        self.db.query("SELECT * FROM orders", fetch_through_pandas=False)
+
+        self.assertEqual(self.db.query("INSERT INTO users VALUES (2, 'b') RETURNING id", fetch_through_pandas=False), [(2,)])
+        self.assertEqual(cache.stats()["entries"], 1)
+        self.assertEqual(len(self.db.query("SELECT * FROM users", fetch_through_pandas=False)), 2)
+
+        self.db.query("UPDATE users SET name = 'c' WHERE id = 2 RETURNING name", fetch_through_pandas=False)
+        self.assertEqual(self.db.query("SELECT * FROM users", fetch_through_pandas=False)[-1], (2, "c"))
+
+    def test_ttl_and_lru(self):
+        """Test if expired and least recently used entries are removed"""
+
+        cache = QueryResultCache(ttl=0)
+        cache.put("a", [(1,)])
+        self.assertIsNone(cache.get("a"))
+
+        cache = QueryResultCache(max_entries=2)
+        cache.put("a", [(1,)])
+        cache.put("b", [(2,)])
+        cache.get("a")
+        cache.put("c", [(3,)])
+
+        self.assertIsNone(cache.get("b"))
+        self.assertListEqual(cache.get("a"), [(1,)])
+
+    def test_disk(self):
+        """Test if DataFrame results are read back from disk by a new cache, until they're invalidated"""
+
+        self.db.result_cache = QueryResultCache(disk_dir=self.temp_dir)
+        self.db.query("SELECT * FROM users")
+
+        cache = self.db.result_cache = QueryResultCache(disk_dir=self.temp_dir)
+        df = self.db.query("SELECT * FROM users")
+
+        self.assertEqual(cache.stats()["disk_hits"], 1)
+        self.assertListEqual(df["name"].tolist(), ["a"])
+
+        cache.invalidate(["users"])
+        self.assertListEqual(os.listdir(self.temp_dir), [])
+
+
+class FakeCatalogTool(PostgreSQLTool):
+    """PostgreSQLTool that answers the queries of get_all_db_info without a server."""
+
+    def __init__(self):
+        with mock.patch("instackup.sql_tools.fetch_credentials", return_value={}):
+            super().__init__(use_pool=False)
+        self.queries = []
+
+    def _new_session(self):
+        session = copy.copy(self)
+        session.connection = mock.Mock()
+        return session
+
+    def query(self, sql_query, fetch_through_pandas=True, fail_silently=False, params=None):
+        self.queries.append(sql_query)
+
+        if "INFORMATION_SCHEMA.COLUMNS" in sql_query:
+            return pd.DataFrame({
+                "table_catalog": ["db"] * 3,
+                "table_schema": ["public"] * 3,
+                "table_name": ["events", "events", "users"],
+                "column_name": ["id", "payload", "profile"],
+                "data_type": ["integer", "jsonb", "json"],
+                "is_nullable": ["NO", "YES", "YES"],
+            })
+        if "pg_class" in sql_query:
+            return [("public", "events", 1000000.0), ("public", "users", 50.0)]
+        if '"payload"' in sql_query:
+            return [("kind", "string", 10), ("size", "number", 8)]
+        return [("age", "number", 5)]
+
+
+class TestGetAllDbInfo(unittest.TestCase):
+    """Unittest for get_all_db_info method of PostgreSQLTool class in sql_tools module of instackup package"""
+
+    def test_json_keys(self):
+        """Test if each json key found gets a row with the information of its column"""
+
+        pg = FakeCatalogTool()
+        df = pg.get_all_db_info(max_workers=2)
+
+        self.assertListEqual(df["column_name"].tolist(), ["id", "payload", "payload", "payload", "profile", "profile"])
+        self.assertListEqual(df["json_key"].tolist(), ["", "", "kind", "size", "", "age"])
+        self.assertListEqual(df["json_value_type"].tolist(), ["", "", "string", "number", "", "number"])
+        self.assertListEqual(list(df.columns[4:7]), ["data_type", "json_key", "json_value_type"])
+        self.assertFalse(any("pg_class" in sql_query for sql_query in pg.queries))
+
+    def test_sampling(self):
+        """Test if only big tables are read with TABLESAMPLE, and every column query gets a LIMIT"""
+
+        pg = FakeCatalogTool()
+        pg.get_all_db_info(sample_rows=1000)
+        events_query, users_query = pg.queries[-2:]
+
+        self.assertIn('FROM "public"."events" TABLESAMPLE SYSTEM (0.200000)', events_query)
+        self.assertIn("LIMIT 1000", events_query)
+        self.assertNotIn("TABLESAMPLE", users_query)
+        self.assertIn("LIMIT 1000", users_query)
+
+        pg = FakeCatalogTool()
+        pg.get_all_db_info(sample_rows=10, sample_method="limit")
+        self.assertFalse(any("TABLESAMPLE" in sql_query or "pg_class" in sql_query for sql_query in pg.queries))
+        self.assertRaises(ValueError, pg.get_all_db_info, sample_rows=10, sample_method="random")
+
+    def test_run_in_sessions(self):
+        """Test if each worker thread gets a connection of its own, closed at the end"""
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            db = SQLiteTool(filename=os.path.join(temp_dir, "test.db"))
+            db.connect()
+            db.execute_sql("CREATE TABLE numbers (n INTEGER)")
+            db.bulk_insert([(n,) for n in range(10)], "numbers")
+
+            sessions = []
+            results = db._run_in_sessions(
+                lambda tool, n: sessions.append(tool) or tool.query(f"SELECT n FROM numbers WHERE n = {n}", fetch_through_pandas=False),
+                range(10),
+                max_workers=3,
+            )
+            db.close_connection()
+
+        self.assertListEqual(results, [[(n,)] for n in range(10)])
+        self.assertLessEqual(len(set(map(id, sessions))), 3)
+        for tool in sessions:
+            self.assertIsNot(tool, db)
+            self.assertRaises(sqlite3.ProgrammingError, tool.connection.execute, "SELECT 1")
+
+
+class TestRunConcurrentQueries(unittest.TestCase):
+    """Unittest for run_concurrent_queries function in sql_tools module of instackup package"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db = SQLiteTool(filename=os.path.join(self.temp_dir, "test.db"))
+        with self.db as db:
+            db.execute_sql("CREATE TABLE numbers (n INTEGER)")
+            db.bulk_insert([(n,) for n in range(10)], "numbers")
+
+    def tearDown(self):
+        close_all_pools()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_dict(self):
+        """Test if each job outcome is returned by its key, with its result, error and time"""
+
+        results = run_concurrent_queries({
+            "count": (self.db, "SELECT COUNT(*) AS total FROM numbers"),
+            "filter": (self.db, "SELECT n FROM numbers WHERE n < ?", (3,)),
+            "error": (self.db, "SELECT * FROM missing_table"),
+        }, max_workers=2)
+
+        self.assertListEqual(list(results), ["count", "filter", "error"])
+        self.assertEqual(results["count"].result["total"][0], 10)
+        self.assertListEqual(results["filter"].result["n"].tolist(), [0, 1, 2])
+        self.assertIsNone(results["filter"].error)
+        self.assertIsNone(results["error"].result)
+        self.assertIn("no such table", str(results["error"].error))
+        self.assertTrue(all(outcome.seconds >= 0 for outcome in results.values()))
+
+    def test_iterator(self):
+        """Test if outcomes are yielded for every job of a list, keyed by position"""
+
+        jobs = [(self.db, f"SELECT n FROM numbers WHERE n = {n}") for n in range(10)]
+        results = run_concurrent_queries(jobs, max_workers=4, fetch_through_pandas=False, yield_results=True)
+
+        outcomes = sorted(results)
+        self.assertListEqual([outcome.key for outcome in outcomes], list(range(10)))
+        self.assertListEqual([outcome.result for outcome in outcomes], [[(n,)] for n in range(10)])
+
+    def test_pooled(self):
+        """Test if jobs of a pooled tool borrow their connections from the pool"""
+
+        db = SQLiteTool(filename=self.db.filename, use_pool=True)
+        results = run_concurrent_queries([(db, "SELECT 1")] * 6, max_workers=3, fetch_through_pandas=False)
+
+        self.assertTrue(all(outcome.result == [(1,)] for outcome in results.values()))
+        pool = get_pool(db._pool_key())
+        self.assertLessEqual(pool.size, 3)
+        self.assertEqual(pool.idle, pool.size)
+
+
+class TestArrowResults(unittest.TestCase):
+    """Unittest for Arrow result formats of SQLTool class in sql_tools module of instackup package"""
+
+    def setUp(self):
+        self.db = SQLiteTool().connect()
+        self.db.execute_sql("CREATE TABLE items (id INTEGER, name TEXT, price REAL, note TEXT)")
+        self.db.bulk_insert([(n, f"item_{n}", n * 1.5, "sale" if n >= 5 else None) for n in range(12)], "items")
+
+    def tearDown(self):
+        self.db.close_connection()
+
+    def test_query(self):
+        """Test if Arrow tables get typed columns, also as pandas ArrowDtype columns"""
+
+        import pyarrow as pa
+
+        table = self.db.query("SELECT * FROM items", fetch_as="arrow")
+
+        self.assertEqual(table.schema, pa.schema([("id", pa.int64()), ("name", pa.string()), ("price", pa.float64()), ("note", pa.string())]))
+        self.assertEqual(table.column("name")[3].as_py(), "item_3")
+
+        df = self.db.query("SELECT * FROM items WHERE id < ?", fetch_as="pandas_arrow", params=(3,))
+        self.assertListEqual([str(dtype) for dtype in df.dtypes], ["int64[pyarrow]", "string[pyarrow]", "double[pyarrow]", "null[pyarrow]"])
+        self.assertRaises(ValueError, self.db.query, "SELECT * FROM items", fetch_as="polars")
+
+    def test_stream_query(self):
+        """Test if chunks keep the types found in the first one and empty results keep their columns"""
+
+        batches = list(self.db.stream_query("SELECT id, note FROM items", chunksize=5, fetch_as="arrow"))
+
+        self.assertListEqual([batch.num_rows for batch in batches], [5, 5, 2])
+        self.assertEqual(str(batches[1].schema.field("note").type), "string")
+
+        batches = list(self.db.stream_query("SELECT id FROM items WHERE id < 0", fetch_as="arrow"))
+        self.assertEqual(len(batches), 1)
+        self.assertListEqual(batches[0].schema.names, ["id"])
+
+    def test_query_to_parquet(self):
+        """Test if each chunk is written as a row group of the Parquet file"""
+
+        import pyarrow.parquet as pq
+
+        output = io.BytesIO()
+        rows = self.db.query_to_parquet("SELECT id, name FROM items", output, chunksize=5)
+        output.seek(0)
+        parquet_file = pq.ParquetFile(output)
+
+        self.assertEqual(rows, 12)
+        self.assertEqual(parquet_file.metadata.num_row_groups, 3)
+        self.assertListEqual(parquet_file.read().column("id").to_pylist(), list(range(12)))
+
+    def test_description_types(self):
+        """Test if PostgreSQL type OIDs and numeric precisions are mapped to Arrow types"""
+
+        description = [
+            ("id", 23, None, 4, None, None, None),
+            ("amount", 1700, None, None, 10, 2, None),
+            ("ratio", 1700, None, None, None, None, None),
+            ("created_at", 1184, None, 8, None, None, None),
+        ]
+
+        self.assertListEqual(
+            [str(arrow_type) for arrow_type in _arrow_types("PostgreSQL", description)],
+            ["int32", "decimal128(10, 2)", "None", "timestamp[us, tz=UTC]"],
+        )
+
+
+class TestReadReplicas(unittest.TestCase):
+    """Unittest for read replica routing of SQLTool class in sql_tools module of instackup package"""
+
+    def setUp(self):
+        import psycopg2
+
+        self.temp_dir = tempfile.mkdtemp()
+        for host in ["primary", "replica_1", "replica_2"]:
+            with sqlite3.connect(os.path.join(self.temp_dir, host + ".db")) as connection:
+                connection.execute("CREATE TABLE source (host TEXT)")
+                connection.execute("INSERT INTO source VALUES (?)", (host,))
+
+        self.down = set()
+
+        # Each host is a SQLite file standing in for a PostgreSQL server
+        def open_connection(tool):
+            host = tool.connection_parameters["host"]
+            if host in self.down:
+                raise psycopg2.OperationalError(f"could not connect to server {host}")
+            return sqlite3.connect(os.path.join(self.temp_dir, host + ".db"), check_same_thread=False)
+
+        patcher = mock.patch.object(PostgreSQLTool, "_open_connection", open_connection)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        configure_replicas("PostgreSQL", "default")
+        credentials = {"host": "primary", "user": "postgres", "replicas": [{"host": "replica_1"}, "replica_2"]}
+        with mock.patch("instackup.sql_tools.fetch_credentials", return_value=credentials):
+            self.pg = PostgreSQLTool(read_from_replicas=True).connect()
+
+    def tearDown(self):
+        self.pg.close_connection()
+        close_all_pools()
+        configure_replicas("PostgreSQL", "default")
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def source(self):
+        return self.pg.query("SELECT host FROM source", fetch_through_pandas=False)[0][0]
+
+    def test_replica_parameters(self):
+        """Test if replicas get the primary parameters, replacing the ones they set"""
+
+        self.assertNotIn("replicas", self.pg.connection_parameters)
+        self.assertListEqual(self.pg._replicas, [
+            {"host": "replica_1", "user": "postgres"},
+            {"host": "replica_2", "user": "postgres"},
+        ])
+
+    def test_round_robin(self):
+        """Test if reads alternate between replicas, and other statements run in the primary"""
+
+        self.assertListEqual([self.source() for _ in range(4)], ["replica_1", "replica_2", "replica_1", "replica_2"])
+        self.assertEqual(self.pg.query("SELECT host FROM source")["host"][0], "replica_1")
+        self.assertEqual(self.pg.query("PRAGMA table_info(source)", fetch_through_pandas=False)[0][1], "host")
+
+    def test_transaction_sticks_to_primary(self):
+        """Test if reads run in the primary after a write, until it's committed"""
+
+        self.pg.execute_sql("UPDATE source SET host = 'primary_updated'")
+        self.assertListEqual([self.source() for _ in range(2)], ["primary_updated", "primary_updated"])
+
+        self.pg.commit()
+        self.assertEqual(self.source(), "replica_1")
+
+    def test_ejection(self):
+        """Test if replicas that can't connect leave the rotation, falling back to the primary"""
+
+        self.down.add("replica_1")
+        self.assertListEqual([self.source() for _ in range(3)], ["replica_2", "replica_2", "replica_2"])
+
+        replica_set = get_replica_set(self.pg._pool_key(), self.pg._replicas)
+        self.assertListEqual([replica["healthy"] for replica in replica_set.stats()], [False, True])
+
+        # Idle connections of a server that went down would fail their health check
+        self.down.add("replica_2")
+        get_pool(self.pg._pool_key() + ("replica", 1)).close()
+        self.assertEqual(self.source(), "primary")
+        self.assertListEqual(replica_set.healthy(), [])
+
+    def test_least_latency(self):
+        """Test if the replica with the lowest average read time is chosen, after each one is tried"""
+
+        replica_set = ReplicaSet([{"host": "a"}, {"host": "b"}, {"host": "c"}], selection="least_latency", latency_decay=0.5)
+        replica_set.record_read(0, 0.2)
+        replica_set.record_read(1, 0.1)
+        self.assertEqual(replica_set.choose(), 2)
+
+        replica_set.record_read(2, 0.3)
+        self.assertEqual(replica_set.choose(), 1)
+
+        replica_set.record_read(1, 0.7)
+        replica_set.eject(0)
+        self.assertEqual(replica_set.choose(), 2)
+        self.assertRaises(ValueError, ReplicaSet, [], selection="random")
+
+
+class TestTimeouts(unittest.TestCase):
+    """Unittest for statement timeouts, cancel method and SlowQueryLog class in sql_tools module of instackup package"""
+
+    slow_query = "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) SELECT MAX(x) FROM c"
+
+    def setUp(self):
+        self.db = SQLiteTool().connect()
+
+    def tearDown(self):
+        self.db.close_connection()
+
+    def test_sqlite_timeout(self):
+        """Test if SQLite statements are interrupted after the timeout, given per call or by default"""
+
+        self.assertRaises(sqlite3.OperationalError, self.db.query, self.slow_query, fetch_through_pandas=False, timeout=0.05)
+
+        self.db.statement_timeout = 0.05
+        self.assertRaises(sqlite3.OperationalError, self.db.execute_sql, self.slow_query)
+        self.assertListEqual(self.db.query("SELECT 1", fetch_through_pandas=False), [(1,)])
+
+    def test_cancel(self):
+        """Test if a running statement is canceled from another thread"""
+
+        timer = threading.Timer(0.05, self.db.cancel)
+        timer.start()
+        try:
+            self.assertRaises(sqlite3.OperationalError, self.db.query, self.slow_query, fetch_through_pandas=False)
+        finally:
+            timer.cancel()
+
+    def test_postgresql_timeout(self):
+        """Test if the session statement timeout is only set when it changes, or after a rollback"""
+
+        with mock.patch("instackup.sql_tools.fetch_credentials", return_value={}):
+            pg = PostgreSQLTool(use_pool=False)
+
+        commands = []
+        pg.connection = mock.Mock()
+        pg.cursor = RecordingCursor(commands)
+        pg._connection_info = {}
+
+        pg.statement_timeout = 30
+        pg.query("SELECT 1", fetch_through_pandas=False)
+        pg.query("SELECT 2", fetch_through_pandas=False)
+        pg.execute_sql("UPDATE t SET a = 1", timeout=1.5)
+        pg.rollback()
+        pg.statement_timeout = None
+        pg.query("SELECT 3", fetch_through_pandas=False)
+        pg.query("SELECT 4", fetch_through_pandas=False)
+
+        self.assertListEqual([sql for sql, _ in commands], [
+            "SET statement_timeout = 30000", "SELECT 1", "SELECT 2",
+            "SET statement_timeout = 1500", "UPDATE t SET a = 1",
+            "SET statement_timeout = DEFAULT", "SELECT 3", "SELECT 4",
+        ])
+
+    def test_slow_query_log(self):
+        """Test if statements over the threshold are logged, with the plan of the queries"""
+
+        log = self.db.slow_query_log = SlowQueryLog(threshold=0, explain=True)
+        self.db.execute_sql("CREATE TABLE t (id INTEGER)")
+        self.db.query("SELECT * FROM t WHERE id > ?", params=(1,))
+
+        create, select = log.entries()
+        self.assertEqual(create["sql"], "CREATE TABLE t (id INTEGER)")
+        self.assertIsNone(create["plan"])
+        self.assertEqual(select["params"], (1,))
+        self.assertEqual(select["rows"], 0)
+        self.assertIn("SCAN t", select["plan"])
+
+        log.threshold = 60
+        self.db.query("SELECT * FROM t")
+        self.assertEqual(len(log.entries()), 2)
+
+    def test_canceled_statements_keep_replicas(self):
+        """Test if statements canceled by a timeout aren't taken for connection failures"""
+
+        import psycopg2
+        import psycopg2.extensions
+        from instackup.sql_tools import _is_connection_failure
+
+        self.assertTrue(_is_connection_failure("PostgreSQL", psycopg2.OperationalError()))
+        self.assertFalse(_is_connection_failure("PostgreSQL", psycopg2.extensions.QueryCanceledError()))
+        self.assertFalse(_is_connection_failure("PostgreSQL", psycopg2.ProgrammingError()))
+
+
+class TestSQLitePerformance(unittest.TestCase):
+    """Unittest for SQLiteTool profiles, bulk_load, backup and restore methods in sql_tools module of instackup package"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.temp_dir, "test.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_profiles(self):
+        """Test if the PRAGMA settings of the profile are applied to new connections"""
+
+        with SQLiteTool(self.filename, profile="fast", pragmas={"cache_size": -1024}) as db:
+            self.assertEqual(db.query("PRAGMA journal_mode", fetch_through_pandas=False), [("wal",)])
+            self.assertEqual(db.query("PRAGMA synchronous", fetch_through_pandas=False), [(1,)])
+            self.assertEqual(db.query("PRAGMA temp_store", fetch_through_pandas=False), [(2,)])
+            self.assertEqual(db.query("PRAGMA cache_size", fetch_through_pandas=False), [(-1024,)])
+
+        self.assertRaises(ValueError, SQLiteTool, profile="unknown")
+        self.assertRaises(ValueError, SQLiteTool, pragmas={"synchronous": "OFF; DROP TABLE t"})
+
+    def test_bulk_load(self):
+        """Test if bulk_load commits once at the end, rebuilding the deferred indexes"""
+
+        with SQLiteTool(self.filename) as db:
+            db.execute_sql("CREATE TABLE t (id INTEGER, name TEXT)")
+            db.execute_sql("CREATE INDEX t_id ON t (id)")
+            db.commit()
+
+            with db.bulk_load(tables=["t"]):
+                self.assertEqual(db.query("SELECT name FROM sqlite_master WHERE type = 'index'", fetch_through_pandas=False), [])
+                db.bulk_insert(((index, "x") for index in range(100)), "t", batch_size=10)
+
+                with SQLiteTool(self.filename) as other:
+                    # Nothing is visible to other connections until the block ends
+                    self.assertEqual(other.query("SELECT COUNT(*) FROM t", fetch_through_pandas=False), [(0,)])
+
+            with SQLiteTool(self.filename) as other:
+                self.assertEqual(other.query("SELECT COUNT(*) FROM t", fetch_through_pandas=False), [(100,)])
+                self.assertEqual(other.query("SELECT name FROM sqlite_master WHERE type = 'index'", fetch_through_pandas=False), [("t_id",)])
+
+    def test_bulk_load_rollback(self):
+        """Test if an error inside bulk_load rolls back the rows and restores the indexes"""
+
+        with SQLiteTool(self.filename) as db:
+            db.execute_sql("CREATE TABLE t (id INTEGER)")
+            db.execute_sql("CREATE UNIQUE INDEX t_id ON t (id)")
+            db.commit()
+
+            # The duplicated ids are only detected when the unique index is built again
+            with self.assertRaises(sqlite3.IntegrityError):
+                with db.bulk_load():
+                    db.bulk_insert([(1,), (1,)], "t")
+
+            self.assertEqual(db.query("SELECT COUNT(*) FROM t", fetch_through_pandas=False), [(0,)])
+            self.assertEqual(db.query("SELECT name FROM sqlite_master WHERE type = 'index'", fetch_through_pandas=False), [("t_id",)])
+
+    def test_backup_and_restore(self):
+        """Test if an in-memory database is saved to disk and loaded back"""
+
+        with SQLiteTool() as db:
+            db.execute_sql("CREATE TABLE t (id INTEGER)")
+            db.bulk_insert([(1,), (2,)], "t")
+            db.backup(self.filename)
+
+        with SQLiteTool() as db:
+            db.restore(self.filename)
+            self.assertEqual(db.query("SELECT id FROM t", fetch_through_pandas=False), [(1,), (2,)])
+
+            with SQLiteTool() as copy_db:
+                db.backup(copy_db)
+                self.assertEqual(copy_db.query("SELECT COUNT(*) FROM t", fetch_through_pandas=False), [(2,)])
+
+
+class TestSchemaCatalog(unittest.TestCase):
+    """Unittest for SchemaCatalog class and get_catalog method in sql_tools module of instackup package"""
+
+    def setUp(self):
+        self.db = SQLiteTool().connect()
+        self.db.execute_sql("CREATE TABLE users (id INTEGER PRIMARY KEY, email TEXT NOT NULL, score REAL DEFAULT 0)")
+        self.db.execute_sql("CREATE UNIQUE INDEX users_email ON users (email, score)")
+        self.db.execute_sql("CREATE TABLE memberships (user_id INTEGER, group_id INTEGER, PRIMARY KEY (group_id, user_id))")
+
+    def tearDown(self):
+        self.db.close_connection()
+
+    def test_sqlite_catalog(self):
+        """Test if columns, primary keys and indexes of all tables are read"""
+
+        catalog = self.db.get_catalog()
+        self.assertEqual(len(catalog), 2)
+
+        users = catalog.table("users")
+        self.assertEqual([column.name for column in users.columns], ["id", "email", "score"])
+        self.assertFalse(users.columns[1].nullable)
+        self.assertEqual(users.columns[2].default, "0")
+        self.assertEqual(users.primary_key, ("id",))
+        self.assertIn(("users_email", ("email", "score"), True, False), users.indexes)
+
+        self.assertEqual(catalog.table("main.memberships").primary_key, ("group_id", "user_id"))
+        self.assertRaises(KeyError, catalog.table, "missing")
+
+        self.assertEqual(
+            self.db.describe_table("users", fetch_through_pandas=False, use_catalog=True),
+            [("id", "INTEGER", True, None, True), ("email", "TEXT", False, None, False), ("score", "REAL", True, "0", False)],
+        )
+        self.assertEqual(self.db.describe_table("missing", fetch_through_pandas=False, use_catalog=True), [])
+
+    def test_catalog_cache(self):
+        """Test if the catalog is reused until its TTL expires or the schema changes"""
+
+        catalog = self.db.get_catalog()
+        self.assertIs(self.db.get_catalog(), catalog)
+
+        self.db.execute_sql("INSERT INTO users (email) VALUES ('a@b.c')")
+        self.assertIs(self.db.get_catalog(), catalog)
+
+        self.db.execute_sql("ALTER TABLE users ADD COLUMN name TEXT")
+        refreshed = self.db.get_catalog()
+        self.assertIsNot(refreshed, catalog)
+        self.assertEqual(refreshed.table("users").columns[-1].name, "name")
+
+        self.db.catalog_ttl = 0
+        self.assertIsNot(self.db.get_catalog(), refreshed)
+
+        # Each in-memory database has its own catalog
+        with SQLiteTool() as other:
+            self.assertEqual(len(other.get_catalog()), 0)
+
+    def test_plain_sql_tool(self):
+        """Test if the catalog is read by SQLTool objects, not only by the tools of each database"""
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filename = os.path.join(temp_dir, "catalog.db")
+            with SQLiteTool(filename=filename) as source:
+                source.execute_sql("CREATE TABLE users (id INTEGER PRIMARY KEY, email TEXT NOT NULL)")
+                source.execute_sql("INSERT INTO users VALUES (1, 'a@b.c')")
+                source.commit()
+
+            with SQLTool("SQLite", filename=filename) as db, SQLTool("SQLite") as destination:
+                self.assertEqual(db.get_catalog().table("users").primary_key, ("id",))
+
+                copy_table(db, destination, "users")
+                self.assertEqual(destination.query("SELECT * FROM users", fetch_through_pandas=False), [(1, "a@b.c")])
+
+    def test_refresh_with_result_cache(self):
+        """Test if a refreshed catalog sees tables created by other connections when a result cache is set"""
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filename = os.path.join(temp_dir, "catalog.db")
+            with SQLiteTool(filename=filename) as db, SQLiteTool(filename=filename) as other:
+                db.result_cache = QueryResultCache(ttl=300)
+                db.execute_sql("CREATE TABLE users (id INTEGER PRIMARY KEY)")
+                db.commit()
+                self.assertEqual(len(db.get_catalog()), 1)
+
+                other.execute_sql("CREATE TABLE groups (id INTEGER PRIMARY KEY)")
+                other.commit()
+                self.assertEqual(len(db.get_catalog(refresh=True)), 2)
+
+    def test_unsupported_database(self):
+        """Test if reading the catalog of a database without a catalog query honors fail_silently"""
+
+        self.db.sql_type = "Oracle"
+        self.assertRaises(ValueError, self.db.get_catalog)
+        self.assertIsNone(self.db.get_catalog(fail_silently=True))
+
+    def test_describe_table(self):
+        """Test if SQLite describe_table returns the columns of the table"""
+
+        self.assertEqual(
+            [row[1] for row in self.db.describe_table("users", fetch_through_pandas=False)],
+            ["id", "email", "score"],
+        )
+
+    def test_from_rows(self):
+        """Test if catalog rows in any order are grouped by table, with columns and indexes sorted"""
+
+        rows = [
+            ("index", "shop", "orders", "PRIMARY", "id", 1, "primary", 1),
+            ("column", "shop", "orders", "total", "decimal(10,2)", 1, None, 2),
+            ("index", "shop", "orders", "orders_customer", "created_at", 0, None, 2),
+            ("column", "shop", "orders", "id", "int", 0, None, 1),
+            ("index", "shop", "orders", "orders_customer", "customer_id", 0, None, 1),
+        ]
+        catalog = SchemaCatalog.from_rows(rows)
+        orders = catalog.table("orders")
+
+        self.assertEqual([column.name for column in orders.columns], ["id", "total"])
+        self.assertEqual(orders.primary_key, ("id",))
+        self.assertEqual(orders.indexes[1], ("orders_customer", ("customer_id", "created_at"), False, False))
+        self.assertIn("shop.orders", catalog)
+        self.assertNotIn("other.orders", catalog)
+
+
+class TestIncrementalExtraction(unittest.TestCase):
+    """Unittest for extract_incremental method and watermark stores in sql_tools module of instackup package"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.store = JSONWatermarkStore(os.path.join(self.temp_dir, "watermarks.json"))
+
+        self.db = SQLiteTool().connect()
+        self.db.execute_sql("CREATE TABLE events (id INTEGER, day TEXT, kind TEXT)")
+        self.db.bulk_insert([(index, f"2020-01-{1 + index // 4:02d}", "a" if index % 2 else "b") for index in range(20)], "events")
+
+    def tearDown(self):
+        self.db.close_connection()
+        shutil.rmtree(self.temp_dir)
+
+    def extract(self, column, **kwargs):
+        return self.db.extract_incremental("events", column, self.store, fetch_through_pandas=False, **kwargs)
+
+    def test_batches_keep_values_together(self):
+        """Test if rows sharing a watermark value are always in the same batch"""
+
+        batches = list(self.extract("day", chunksize=3))
+
+        self.assertEqual([batch.rows for batch in batches], [4] * 5)
+        self.assertEqual([batch.watermark for batch in batches], [f"2020-01-{day:02d}" for day in range(1, 6)])
+        self.assertEqual([row[0] for row in batches[1].data], [4, 5, 6, 7])
+
+    def test_only_new_rows_after_commit(self):
+        """Test if committed batches aren't extracted again, and the ones not committed are"""
+
+        batches = self.extract("id", chunksize=8)
+        next(batches).commit()
+        next(batches)
+        batches.close()
+
+        # The last row fetched is held back, since the next one could have the same id
+        self.assertEqual(self.store.get("SQLite/:memory:/events.id"), 6)
+        self.assertEqual(sum(batch.rows for batch in self.extract("id")), 13)
+
+        for batch in self.extract("id"):
+            batch.commit()
+        self.db.bulk_insert([(20, "2020-01-06", "a")], "events")
+
+        batches = list(self.extract("id"))
+        self.assertEqual(len(batches), 1)
+        self.assertEqual(batches[0].data, [(20, "2020-01-06", "a")])
+
+    def test_columns_and_filter(self):
+        """Test if columns and where parameters restrict what's extracted, with the watermark column always included"""
+
+        batches = list(self.db.extract_incremental(
+            "events", "id", self.store, key="kind_a", columns=["kind"], where="kind = ?", params=["a"],
+        ))
+
+        df = batches[0].data
+        self.assertListEqual(list(df.columns), ["kind", "id"])
+        self.assertEqual(len(df), 10)
+        self.assertEqual(batches[0].watermark, 19)
+
+    def test_quoted_identifiers(self):
+        """Test if table and column names are quoted, so keywords and names with spaces can be extracted"""
+
+        self.db.execute_sql('CREATE TABLE "order items" ("order" INTEGER, "group" TEXT)')
+        self.db.bulk_insert([(1, "a"), (2, "b")], "\"order items\"")
+
+        batches = list(self.db.extract_incremental(
+            "order items", "order", self.store, columns=["group"], fetch_through_pandas=False,
+        ))
+        self.assertEqual(batches[0].data, [("a", 1), ("b", 2)])
+
+    def test_parameters_always_bound(self):
+        """Test if the query is run with bound parameters in the first run too, so % is escaped the same way"""
+
+        with mock.patch("instackup.sql_tools.fetch_credentials", return_value={}):
+            pg = PostgreSQLTool(use_pool=False)
+
+        commands = []
+        pg._stream_cursor = lambda chunksize: RecordingCursor(commands)
+        self.store.set("events", 5)
+
+        for key in ("first_run", "events"):
+            pg.extract_incremental("public.events", "id", self.store, key=key, where="kind LIKE 'a%%'")
+
+        self.assertListEqual(commands, [
+            ('SELECT * FROM "public"."events" WHERE "id" IS NOT NULL AND (kind LIKE \'a%%\') ORDER BY "id"', []),
+            ('SELECT * FROM "public"."events" WHERE "id" > %s AND (kind LIKE \'a%%\') ORDER BY "id"', [5]),
+        ])
+
+    def test_stores(self):
+        """Test if both stores keep watermarks of every supported type"""
+
+        values = [42, "2020-01-01", datetime.date(2020, 1, 2), datetime.datetime(2020, 1, 2, 3, 4, 5), decimal.Decimal("1.50")]
+
+        for store in (self.store, SQLiteWatermarkStore(os.path.join(self.temp_dir, "watermarks.db"))):
+            self.assertIsNone(store.get("missing"))
+
+            for value in values:
+                store.set("key", value)
+                self.assertEqual(store.get("key"), value)
+                self.assertIs(type(store.get("key")), type(value))
+
+            store.delete("key")
+            self.assertIsNone(store.get("key"))
+
+
+class TestCopyTable(unittest.TestCase):
+    """Unittest for copy_table function in sql_tools module of instackup package"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.source = SQLiteTool(os.path.join(self.temp_dir, "source.db")).connect()
+        self.source.execute_sql("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT NOT NULL, price NUMERIC(10, 2), extra)")
+        self.source.bulk_insert([(index, f"item_{index}", index * 1.5, index) for index in range(1000)], "items")
+
+        self.destination = SQLiteTool().connect()
+
+    def tearDown(self):
+        self.source.close_connection()
+        self.destination.close_connection()
+        shutil.rmtree(self.temp_dir)
+
+    def test_copy(self):
+        """Test if all rows are copied in chunks to a table created with the source columns"""
+
+        stats = copy_table(self.source, self.destination, "items", chunksize=64, queue_size=2)
+
+        self.assertEqual(stats["rows"], 1000)
+        self.assertEqual(stats["chunks"], 16)
+        self.assertGreater(stats["rows_per_sec"], 0)
+        self.assertEqual(self.destination.query("SELECT COUNT(*), SUM(id) FROM items", fetch_through_pandas=False), [(1000, 499500)])
+
+        items = self.destination.get_catalog().table("items")
+        self.assertEqual([column.data_type for column in items.columns], ["INTEGER", "TEXT", "NUMERIC", "INTEGER"])
+        self.assertFalse(items.columns[1].nullable)
+        self.assertEqual(items.primary_key, ("id",))
+
+    def test_if_exists(self):
+        """Test if an existing destination table is appended to, replaced or makes the copy fail"""
+
+        copy_table(self.source, self.destination, "items", columns=["id", "name"], where="id < 10")
+        copy_table(self.source, self.destination, "items", destination_table="items", columns=["id", "name"], where="id >= 990")
+        self.assertEqual(self.destination.query("SELECT COUNT(*) FROM items", fetch_through_pandas=False), [(20,)])
+
+        self.assertRaises(ValueError, copy_table, self.source, self.destination, "items", if_exists="fail")
+
+        copy_table(self.source, self.destination, "items", if_exists="replace")
+        self.assertEqual(self.destination.query("SELECT COUNT(*) FROM items", fetch_through_pandas=False), [(1000,)])
+
+    def test_errors(self):
+        """Test if errors in the reader or the writer stop the copy and roll back the destination"""
+
+        self.assertRaises(sqlite3.OperationalError, copy_table, self.source, self.destination, "items", where="missing > 0")
+        self.assertNotIn("items", self.destination.get_catalog(refresh=True))
+
+        # Duplicated ids are rejected by the primary key after the first chunks were written
+        self.destination.execute_sql("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)")
+        self.destination.execute_sql("INSERT INTO items VALUES (500, 'existing')")
+        self.destination.commit()
+
+        self.assertRaises(
+            sqlite3.IntegrityError, copy_table, self.source, self.destination, "items",
+            columns=["id", "name"], chunksize=10, queue_size=1,
+        )
+        self.assertEqual(self.destination.query("SELECT COUNT(*) FROM items", fetch_through_pandas=False), [(1,)])
+
+    def test_type_mapping(self):
+        """Test if column types of each database are mapped to the destination ones"""
+
+        self.assertEqual(_type_family("timestamp with time zone"), "timestamptz")
+        self.assertEqual(_type_family("int(11) unsigned"), "integer")
+        self.assertEqual(_type_family("tinyint(1)"), "boolean")
+        self.assertEqual(_type_family("double precision"), "float")
+        self.assertEqual(_type_family("interval"), "text")
+        self.assertEqual(_type_family("point"), "text")
+        self.assertIsNone(_type_family(""))
+
+        self.assertEqual(_destination_type("PostgreSQL", "decimal", "decimal(10,2)", False), "NUMERIC(10,2)")
+        self.assertEqual(_destination_type("MySQL", "json", "jsonb", False), "JSON")
+        self.assertEqual(_destination_type("MySQL", "text", "character varying", True), "VARCHAR(255)")
+
+        self.assertEqual(_portable_value("SQLite", decimal.Decimal("1.50")), "1.50")
+        self.assertEqual(_portable_value("SQLite", datetime.datetime(2020, 1, 2, 3, 4)), "2020-01-02 03:04:00")
+        self.assertEqual(_portable_value("MySQL", {"a": 1}), '{"a": 1}')
+        self.assertEqual(_portable_value("PostgreSQL", datetime.date(2020, 1, 2)), datetime.date(2020, 1, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()